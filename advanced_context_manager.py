@@ -1,62 +1,64 @@
-import faiss
 import numpy as np
-from transformers import AutoTokenizer, AutoModel
-import torch
 from typing import List, Dict, Tuple
 import json
+from datetime import datetime
+from utils.context_packer import fit_suffix
+from utils.embedding_service import EmbeddingService
+from utils.vector_index import VectorIndexStore
+from utils.namespace import vector_index_dir
 
 class AdvancedContextManager:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModel.from_pretrained(model_name)
-        self.short_term_memory: List[Dict] = []
-        self.long_term_memory: List[Dict] = []
-        self.index = faiss.IndexFlatL2(384)  # 384 is the embedding dimension for the chosen model
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", embedder: EmbeddingService = None, namespace: str = None):
+        # The embedder batches concurrent requests and caches by content, so the
+        # query embedding in get_context reuses the one computed in add_message
+        self.embedder = embedder or EmbeddingService(model_name)
+        self.tokenizer = self.embedder.tokenizer
+        self.short_term_memory: Dict[str, List[Dict]] = {}
+        # Each user gets their own long-term index (384 is the embedding dimension
+        # for the chosen model), saved to disk and memory-mapped back on demand
+        self.vector_indexes = VectorIndexStore(base_dir=vector_index_dir(namespace), dim=384)
         self.max_short_term_tokens = 800
         self.max_context_tokens = 2000
 
     def add_message(self, user_id: str, message: Dict):
+        message = {**message, 'timestamp': message.get('timestamp') or datetime.now().isoformat()}
+
         # Add to short-term memory
-        print(message)
-        self.short_term_memory.append(message)
-        print("short_term_memory", self.short_term_memory)
-        self._trim_short_term_memory()
+        short_term_memory = self.short_term_memory.setdefault(user_id, [])
+        short_term_memory.append(message)
+        self._trim_short_term_memory(user_id)
 
-        # Add to long-term memory
+        # Add to long-term memory; the embedding goes into the index's array, not the message
         embedding = self._get_embedding(message['content'])
-        print("embedding", embedding)
-        self.long_term_memory.append({**message, 'embedding': embedding})
-        self.index.add(np.array([embedding]))
+        self.vector_indexes.add(user_id, embedding, message)
 
     def get_context(self, user_id: str) -> str:
-        context = self._get_short_term_context()
+        context = self._get_short_term_context(user_id)
         long_term_context = self._get_long_term_context(user_id)
         return json.dumps(context + long_term_context)
 
     def _get_embedding(self, text: str) -> np.ndarray:
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-        return outputs.last_hidden_state.mean(dim=1).squeeze().numpy()
+        return self.embedder.embed(text)
 
-    def _trim_short_term_memory(self):
-        while len(self.short_term_memory) > 4 or self._count_tokens(self.short_term_memory) > self.max_short_term_tokens:
-            self.short_term_memory.pop(0)
+    def _trim_short_term_memory(self, user_id: str):
+        # Keep the newest (at most 4) messages whose token counts fit the budget
+        recent = self.short_term_memory[user_id][-4:]
+        counts = [len(self.tokenizer.encode(msg['content'])) for msg in recent]
+        self.short_term_memory[user_id] = recent[fit_suffix(counts, self.max_short_term_tokens):]
 
-    def _get_short_term_context(self) -> List[Dict]:
-        return self.short_term_memory
+    def _get_short_term_context(self, user_id: str) -> List[Dict]:
+        return self.short_term_memory.get(user_id, [])
 
     def _get_long_term_context(self, user_id: str) -> List[Dict]:
-        if not self.long_term_memory:
+        vector_index = self.vector_indexes.get(user_id)
+        if not len(vector_index):
             return []
 
-        query = self.short_term_memory[-1]['content'] if self.short_term_memory else ""
+        short_term_memory = self._get_short_term_context(user_id)
+        query = short_term_memory[-1]['content'] if short_term_memory else ""
         query_embedding = self._get_embedding(query)
 
-        k = min(5, len(self.long_term_memory))  # Get top 5 or all if less than 5
-        D, I = self.index.search(np.array([query_embedding]), k)
-
-        results = [self.long_term_memory[i] for i in I[0]]
+        results = vector_index.search(query_embedding, 5)  # Get top 5 or all if less than 5
         results.sort(key=lambda x: x['timestamp'], reverse=True)  # Sort by recency
 
         return results[:2]  # Return top 2 most relevant and recent
@@ -65,8 +67,15 @@ class AdvancedContextManager:
         return sum(len(self.tokenizer.encode(msg['content'])) for msg in messages)
 
     def get_internal_state(self, user_id: str) -> Dict:
+        short_term_memory = self._get_short_term_context(user_id)
+        vector_index = self.vector_indexes.get(user_id)
         return {
-            "short_term_memory": self.short_term_memory,
-            "long_term_memory_size": len(self.long_term_memory),
-            "current_context_tokens": self._count_tokens(self.short_term_memory)
-        }
\ No newline at end of file
+            "short_term_memory": short_term_memory,
+            "long_term_memory_size": len(vector_index),
+            "long_term_index": type(vector_index.index).__name__,
+            "current_context_tokens": self._count_tokens(short_term_memory)
+        }
+
+    def close(self):
+        # Persist every loaded user's index so the next start can memory-map it
+        self.vector_indexes.flush()
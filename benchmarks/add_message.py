@@ -0,0 +1,51 @@
+# benchmarks/add_message.py
+#
+# ExistingApproach.add_message latency against the number of messages already
+# buffered on the user's stack. The batch-full check reads one counter, so the
+# latency should stay flat from 10 to 10,000 buffered messages, e.g.
+#   python -m benchmarks.add_message --local
+
+import json
+import time
+from context_managers import ExistingApproach
+from utils.workload import latency_stats
+from benchmarks.common import argument_parser, setup, teardown, report
+
+
+def prefill(approach, user_id, count):
+    # Buffered messages all in batch 1, written directly so setup stays quick
+    pipe = approach.redis_client.pipeline(transaction=False)
+    for i in range(count):
+        message, _ = approach._build_message(user_id, {"role": "user", "content": f"buffered message {i}"}, 1)
+        pipe.rpush(f"{approach.prefix}{user_id}:stack", json.dumps(message))
+    pipe.hset(f"{approach.prefix}{user_id}:batch_counts", 1, count)
+    pipe.set(f"{approach.prefix}{user_id}:batch_id", 1)
+    pipe.execute()
+
+
+def run(sizes, samples):
+    # A batch size past every stack size keeps rollovers out of the timings
+    approach = ExistingApproach(batch_size=max(sizes) + samples + 1, namespace=namespace)
+    results = {}
+    for size in sizes:
+        user_id = f"stack_{size}"
+        prefill(approach, user_id, size)
+        times = []
+        for i in range(samples):
+            start = time.perf_counter()
+            approach.add_message(user_id, {"role": "user", "content": f"timed message {i}"})
+            times.append(time.perf_counter() - start)
+        results[size] = latency_stats(times)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argument_parser("add_message latency by stack length")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--samples", type=int, default=500)
+    args = parser.parse_args()
+    namespace = setup(args)
+    try:
+        report({"add_message_ms": run(args.sizes, args.samples)})
+    finally:
+        teardown(namespace)
@@ -0,0 +1,51 @@
+# benchmarks/common.py
+#
+# Shared setup for the benchmark scripts, which run from the repo root as
+# `python -m benchmarks.<name>`. They use the Redis and MongoDB from config.py
+# under their own namespace; --local swaps in in-process fakeredis and
+# mongomock servers instead (pip install -r requirements-dev.txt).
+
+import argparse
+import json
+import redis
+import redis.asyncio
+from utils import redis_client, mongo_client
+from utils.mongo_writer import close_mongo_writers
+from utils.namespace import reset_namespace
+
+BENCH_NAMESPACE = "bench"
+
+
+def use_local_backends():
+    # Points the process-wide pools at one shared in-process server
+    import fakeredis
+    import fakeredis.aioredis
+    import mongomock
+    close_mongo_writers()
+    server = fakeredis.FakeServer()
+    redis_client._pool = redis.ConnectionPool(connection_class=fakeredis.FakeRedisConnection, server=server, decode_responses=True)
+    redis_client._async_pool = redis.asyncio.ConnectionPool(connection_class=fakeredis.aioredis.FakeAsyncRedisConnection, server=server, decode_responses=True)
+    mongo_client._client = mongomock.MongoClient()
+    return server
+
+
+def argument_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--local", action="store_true", help="use in-process fakeredis and mongomock")
+    return parser
+
+
+def setup(args, namespace=BENCH_NAMESPACE):
+    if args.local:
+        use_local_backends()
+    reset_namespace(namespace)
+    return namespace
+
+
+def teardown(namespace=BENCH_NAMESPACE):
+    close_mongo_writers()
+    reset_namespace(namespace)
+
+
+def report(results):
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,91 @@
+# benchmarks/context_packer.py
+#
+# EnhancedExistingApproach's context packing on a long history: the original
+# _truncate_context loop, which drops one sentence and re-tokenizes the whole
+# context each time, against pack_segments. Needs no Redis or MongoDB, e.g.
+#   python -m benchmarks.context_packer --tokens 100000
+
+import argparse
+import time
+from context_managers import EnhancedExistingApproach
+from utils import token_counter
+from utils.token_counter import count_tokens
+from utils.context_packer import pack_segments
+from utils.mongo_writer import close_mongo_writers
+from utils.workload import synthetic_conversation
+from benchmarks.common import report
+
+
+def truncate_loop(context, max_tokens):
+    # _truncate_context as it was before pack_segments
+    while count_tokens(context) > max_tokens:
+        parts = context.split("\n\n", 1)
+        if len(parts) > 1:
+            summary, recent_messages = parts
+            if summary.startswith("Summary:"):
+                summary_parts = summary.split(". ")
+                if len(summary_parts) > 1:
+                    summary = "Summary: " + ". ".join(summary_parts[1:])
+                else:
+                    summary = ""
+            else:
+                recent_messages = recent_messages.split(". ", 1)[1] if ". " in recent_messages else ""
+            context = f"{summary}\n\n{recent_messages}".strip()
+        else:
+            context = context[:int(max_tokens * 0.9)]
+    return context
+
+
+def history(tokens, seed=0):
+    # Summaries of closed batches followed by the open batch's messages, about `tokens` long
+    texts = []
+    total = 0
+    for message in synthetic_conversation(seed=seed, messages=10 ** 9):
+        texts.append(message["content"])
+        total += count_tokens(message["content"])
+        if total >= tokens:
+            break
+    split = len(texts) * 9 // 10
+    summaries = [". ".join(texts[i:i + 20]) for i in range(0, split, 20)]
+    return summaries, texts[split:]
+
+
+def timed(fn):
+    token_counter._token_counts.clear()
+    start = time.perf_counter()
+    context = fn()
+    return time.perf_counter() - start, count_tokens(context)
+
+
+def run(tokens, max_tokens):
+    approach = EnhancedExistingApproach(max_tokens=max_tokens, namespace="bench")
+    summaries, messages = history(tokens)
+    # The same history as get_context's segments and as the old flat string
+    segments = [("summary", sentence) for sentence in " ".join(summaries).split(". ")]
+    segments += [("message", message) for message in messages]
+    full_context = "Summary: " + " ".join(summaries) + "\n\nRecent messages: " + " ".join(messages)
+
+    def pack():
+        return pack_segments(segments, max_tokens, approach._render_context, key=lambda segment: segment[1])[0]
+
+    packer_seconds, packer_tokens = timed(pack)
+    loop_seconds, loop_tokens = timed(lambda: truncate_loop(full_context, max_tokens))
+    return {
+        "history_tokens": count_tokens(full_context),
+        "max_tokens": max_tokens,
+        "segments": len(segments),
+        "pack_segments": {"seconds": round(packer_seconds, 4), "context_tokens": packer_tokens},
+        "truncate_loop": {"seconds": round(loop_seconds, 4), "context_tokens": loop_tokens},
+        "speedup": round(loop_seconds / packer_seconds, 1) if packer_seconds else None
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Context packing against the old truncation loop")
+    parser.add_argument("--tokens", type=int, default=100000, help="history length in tokens")
+    parser.add_argument("--max-tokens", type=int, default=4000)
+    args = parser.parse_args()
+    try:
+        report(run(args.tokens, args.max_tokens))
+    finally:
+        close_mongo_writers()
@@ -0,0 +1,64 @@
+# benchmarks/embedding.py
+#
+# Embedding throughput of EmbeddingService._encode (the model call under the
+# micro-batcher, no cache) at batch sizes 1 to 128, for the torch backend and
+# the ONNX backend (int8 and, with --fp32, unquantized). Needs torch and
+# transformers, plus onnxruntime for onnx; the first ONNX run exports the model
+# to EMBEDDING_ONNX_DIR. Needs neither server, e.g.
+#   python -m benchmarks.embedding --backends torch onnx
+
+import argparse
+import random
+import time
+from benchmarks.common import report
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+WORDS = ("the user asked about redis caching pasta recipes travel plans python errors "
+         "summaries tokens budget meeting tomorrow deadline weather music books").split()
+
+
+def messages(count, seed=0):
+    # Chat-length messages, 5 to 40 words, so padding varies within a batch
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 40))) for _ in range(count)]
+
+
+def throughput(service, texts, batch_size, repeats):
+    service._encode(texts[:batch_size])  # Warm-up at this shape
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            service._encode(texts[i:i + batch_size])
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(len(texts) / best, 1)
+
+
+def run(backends, batch_sizes, count, repeats, fp32, threads):
+    from utils.embedding_service import EmbeddingService
+    texts = messages(count)
+    configs = [(backend, True) for backend in backends]
+    if fp32 and "onnx" in backends:
+        configs.append(("onnx", False))
+    results = {}
+    for backend, quantize in configs:
+        name = backend if backend == "torch" else f"onnx_{'int8' if quantize else 'fp32'}"
+        service = EmbeddingService(MODEL_NAME, backend=backend, quantize=quantize, num_threads=threads)
+        results[name] = {
+            f"batch_{batch_size}": throughput(service, texts, batch_size, repeats)
+            for batch_size in batch_sizes
+        }
+    return {"embeddings_per_second": results, "messages": count, "threads": threads}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="embedding throughput by backend and batch size")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"], choices=["torch", "onnx"])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--messages", type=int, default=512)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--fp32", action="store_true", help="also run the unquantized ONNX model")
+    args = parser.parse_args()
+    report(run(args.backends, args.batch_sizes, args.messages, args.repeats, args.fp32, args.threads))
@@ -0,0 +1,72 @@
+# benchmarks/import_time.py
+#
+# App cold start: each sample imports main (which builds ChatManager) in a
+# fresh interpreter and reports the wall time, the RSS it added and which
+# heavy libraries ended up loaded, then times the first set_approach for each
+# approach named with --approaches. e.g.
+#   python -m benchmarks.import_time --local --approaches hierarchical sliding_window
+
+import json
+import statistics
+import subprocess
+import sys
+from benchmarks.common import argument_parser, report
+
+HEAVY_MODULES = ["torch", "transformers", "faiss", "sklearn", "scipy"]
+
+# Run in the child; --local backends are set up before the clock starts
+CHILD = """
+import json, resource, sys, time
+local, approaches, heavy = json.loads(sys.argv[1])
+if local:
+    from benchmarks.common import use_local_backends
+    use_local_backends()
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+import main
+result = {
+    "import_s": time.perf_counter() - start,
+    "rss_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+    "loaded": [name for name in heavy if name in sys.modules],
+    "set_approach_s": {},
+}
+for name in approaches:
+    if name not in main.chat_manager.approaches:
+        sys.exit(f"unknown approach {name!r}; registered: {', '.join(main.chat_manager.approaches)}")
+    start = time.perf_counter()
+    main.chat_manager.set_approach(name)
+    result["set_approach_s"][name] = time.perf_counter() - start
+print(json.dumps(result))
+"""
+
+
+def sample(local, approaches):
+    child = subprocess.run(
+        [sys.executable, "-c", CHILD, json.dumps([local, approaches, HEAVY_MODULES])],
+        capture_output=True, text=True,
+    )
+    if child.returncode:
+        sys.exit(child.stderr.strip().splitlines()[-1])
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def run(runs, local, approaches):
+    samples = [sample(local, approaches) for _ in range(runs)]
+    return {
+        "runs": runs,
+        "import_s": round(statistics.median(s["import_s"] for s in samples), 3),
+        "rss_mb": round(statistics.median(s["rss_mb"] for s in samples), 1),
+        "loaded": samples[0]["loaded"],
+        "set_approach_s": {
+            name: round(statistics.median(s["set_approach_s"][name] for s in samples), 4)
+            for name in approaches
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argument_parser("app cold start time and RSS")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--approaches", nargs="*", default=[])
+    args = parser.parse_args()
+    report(run(args.runs, args.local, args.approaches))
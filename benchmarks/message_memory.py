@@ -0,0 +1,73 @@
+# benchmarks/message_memory.py
+#
+# Bytes per buffered message for the sliding windows: one dict per message in
+# per-user lists (the original layout) against MessageRecord in per-user
+# deque(maxlen=...). Messages are parsed from JSON like requests are, so each
+# one arrives with its own role and content strings. Token counts are passed
+# in, keeping the shared (globally capped) token memo out of the numbers.
+# Needs neither server, e.g.
+#   python -m benchmarks.message_memory --users 100000
+
+import argparse
+import gc
+import json
+import tracemalloc
+from collections import deque
+from utils.message_record import MessageRecord
+from benchmarks.common import report
+
+
+def incoming(user, window):
+    for i in range(window):
+        role = "user" if i % 2 == 0 else "assistant"
+        yield json.loads(f'{{"role": "{role}", "content": "user {user} says message number {i} about their day"}}')
+
+
+def as_dicts(users, window):
+    windows = {}
+    for user in range(users):
+        messages = windows.setdefault(f"user{user}", [])
+        for message in incoming(user, window):
+            messages.append(message)
+            if len(messages) > window:
+                messages.pop(0)
+    return windows
+
+
+def as_records(users, window):
+    windows = {}
+    for user in range(users):
+        messages = windows.setdefault(f"user{user}", deque(maxlen=window))
+        for message in incoming(user, window):
+            messages.append(MessageRecord(message["role"], message["content"], tokens=len(message["content"].split())))
+    return windows
+
+
+def measure(build, users, window):
+    gc.collect()
+    tracemalloc.start()
+    windows = build(users, window)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del windows
+    return {
+        "total_mb": round(size / 1e6, 1),
+        "bytes_per_message": round(size / (users * window), 1),
+    }
+
+
+def run(users, window):
+    return {
+        "users": users,
+        "messages_per_user": window,
+        "dict_list": measure(as_dicts, users, window),
+        "record_deque": measure(as_records, users, window),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="memory per buffered sliding-window message")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--window", type=int, default=20)
+    args = parser.parse_args()
+    report(run(args.users, args.window))
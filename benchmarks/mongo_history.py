@@ -0,0 +1,117 @@
+# benchmarks/mongo_history.py
+#
+# chat_history writes and reads as the app does them (buffered insert_many,
+# then (UserId, Timestamp)-indexed reads with HISTORY_PROJECTION and
+# MONGO_READ_BATCH_SIZE) against the original per-message insert_one and
+# unindexed full-document reads, on the configured MongoDB, e.g.
+#   python -m benchmarks.mongo_history --users 200 --messages 100
+# --local runs against mongomock, which has no query planner, so only the
+# write side means anything there.
+
+import random
+import time
+from datetime import datetime, timedelta
+from utils.mongo_client import get_mongo_client, ensure_indexes
+from utils.mongo_writer import BufferedMongoWriter
+from utils.namespace import collection_name
+from utils.workload import latency_stats
+from context_managers import HISTORY_PROJECTION
+from config import MONGO_READ_BATCH_SIZE
+from benchmarks.common import argument_parser, setup, teardown, report
+
+CONTENT = "a chat message of a typical length, about twenty words, so documents are not trivially small " * 2
+
+
+def documents(users, messages, seed=0):
+    # Users' messages interleaved in arrival order, as a live server writes them
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    order = [user for user in range(users) for _ in range(messages)]
+    rng.shuffle(order)
+    counts = [0] * users
+    for n, user in enumerate(order):
+        counts[user] += 1
+        yield {
+            "UserId": f"user{user}",
+            "Timestamp": (start + timedelta(milliseconds=n)).isoformat(),
+            "Content": {"role": "user", "content": f"{CONTENT} {counts[user]}"},
+            "BatchId": counts[user] // 20 + 1
+        }
+
+
+def write_insert_one(collection, docs):
+    start = time.perf_counter()
+    for doc in docs:
+        collection.insert_one(doc)
+    return time.perf_counter() - start
+
+
+def write_buffered(collection, docs):
+    # Time spent in insert() (what a request waits for) and until all is written
+    writer = BufferedMongoWriter(collection)
+    start = time.perf_counter()
+    for doc in docs:
+        writer.insert(doc)
+    queued = time.perf_counter() - start
+    writer.close()  # Includes the final flush
+    return queued, time.perf_counter() - start
+
+
+def read_times(collection, user_ids, query):
+    times = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        query(collection, user_id)
+        times.append(time.perf_counter() - start)
+    return latency_stats(times)
+
+
+def read_unindexed(collection, user_id):
+    return list(collection.find({"UserId": user_id}).sort("Timestamp", 1))
+
+
+def read_indexed(collection, user_id):
+    cursor = collection.find({"UserId": user_id}, HISTORY_PROJECTION).sort("Timestamp", 1)
+    return list(cursor.batch_size(MONGO_READ_BATCH_SIZE))
+
+
+def run(namespace, users, messages, reads):
+    mongo_db = get_mongo_client()
+    baseline = mongo_db[collection_name(namespace, "history_baseline")]
+    tuned = mongo_db[collection_name(namespace, "history_tuned")]
+    ensure_indexes(tuned)
+    total = users * messages
+
+    baseline_write = write_insert_one(baseline, documents(users, messages))
+    tuned_queued, tuned_write = write_buffered(tuned, documents(users, messages))
+    assert baseline.count_documents({}) == tuned.count_documents({}) == total
+
+    user_ids = [f"user{n}" for n in random.Random(1).sample(range(users), min(reads, users))]
+    return {
+        "documents": total,
+        "write_per_second": {
+            "insert_one": round(total / baseline_write),
+            "buffered_insert_many": round(total / tuned_write),
+        },
+        "request_path_us_per_message": {
+            "insert_one": round(baseline_write / total * 1e6, 1),
+            "buffered_insert_many": round(tuned_queued / total * 1e6, 1),
+        },
+        "history_read_ms": {
+            "unindexed_full_documents": read_times(baseline, user_ids, read_unindexed),
+            "indexed_projected": read_times(tuned, user_ids, read_indexed),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argument_parser("chat_history writes and reads, tuned against the original")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--reads", type=int, default=100)
+    args = parser.parse_args()
+    namespace = setup(args)
+    try:
+        report(run(namespace, args.users, args.messages, args.reads))
+    finally:
+        teardown(namespace)
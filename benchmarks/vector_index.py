@@ -0,0 +1,72 @@
+# benchmarks/vector_index.py
+#
+# Long-term memory search: recall@k and per-query latency of the IVF and HNSW
+# indexes UserVectorIndex switches to at VECTOR_ANN_THRESHOLD, against exact
+# flat search on the same vectors, plus float16 storage size. Needs neither
+# server, e.g.
+#   python -m benchmarks.vector_index --vectors 50000
+
+import argparse
+import time
+import numpy as np
+from utils.vector_index import UserVectorIndex
+from utils.workload import latency_stats
+from benchmarks.common import report
+
+DIM = 384
+
+
+def dataset(count, queries, seed=0):
+    # Points around a few hundred centers look more like sentence embeddings
+    # than uniform noise, and are harder for the ANN indexes
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(200, DIM)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), count)] + 0.3 * rng.normal(size=(count, DIM))
+    probes = centers[rng.integers(0, len(centers), queries)] + 0.3 * rng.normal(size=(queries, DIM))
+    return vectors.astype(np.float32), probes.astype(np.float32)
+
+
+def build(vectors, **kwargs):
+    index = UserVectorIndex(dim=DIM, **kwargs)
+    start = time.perf_counter()
+    for i, vector in enumerate(vectors):
+        index.add(vector, i)
+    return index, time.perf_counter() - start
+
+
+def measure(index, build_seconds, probes, k, truth):
+    times, found = [], []
+    for probe in probes:
+        start = time.perf_counter()
+        found.append(set(index.search(probe, k)))
+        times.append(time.perf_counter() - start)
+    return {
+        "index": type(index.index).__name__,
+        "build_s": round(build_seconds, 2),
+        "search_ms": latency_stats(times),
+        f"recall@{k}": round(float(np.mean([len(a & b) / k for a, b in zip(found, truth)])), 3),
+        "vectors_mb": round(index.vectors.nbytes / 1e6, 1),
+    }
+
+
+def run(count, queries, k, ann_threshold):
+    vectors, probes = dataset(count, queries)
+    flat, seconds = build(vectors, ann_threshold=count + 1)
+    truth = [set(flat.search(probe, k)) for probe in probes]
+    results = {"flat": measure(flat, seconds, probes, k, truth)}
+    for ann_type in ["ivf", "hnsw"]:
+        index, seconds = build(vectors, ann_threshold=ann_threshold, ann_type=ann_type)
+        results[ann_type] = measure(index, seconds, probes, k, truth)
+    index, seconds = build(vectors, ann_threshold=count + 1, dtype="float16")
+    results["flat_float16"] = measure(index, seconds, probes, k, truth)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="long-term memory recall and latency by index type")
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--ann-threshold", type=int, default=10000)
+    args = parser.parse_args()
+    report(run(args.vectors, args.queries, args.k, args.ann_threshold))
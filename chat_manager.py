@@ -1,13 +1,20 @@
 # chat_manager.py
 
+import asyncio
 import threading
 import json
+import zlib
+from bson import ObjectId
 from datetime import datetime
-from context_managers import ExistingApproach, HierarchicalSummary, KeywordExtractor, TopicClusterer, SlidingWindowContext, HybridStorage, EnhancedExistingApproach
-from advanced_context_manager import AdvancedContextManager
+from context_managers import HISTORY_PROJECTION, ExistingApproach, HierarchicalSummary, KeywordExtractor, TopicClusterer, SlidingWindowContext, HybridStorage, EnhancedExistingApproach
 from utils.redis_client import get_redis_client
-from utils.mongo_client import get_mongo_client
+from utils.mongo_client import get_mongo_client, ensure_indexes
+from utils.mongo_writer import get_mongo_writer
+from utils.event_bus import events_channel
+from utils.namespace import key_prefix, collection_name, reset_namespace
+from config import CHAT_NAMESPACE, MONGO_READ_BATCH_SIZE, USER_LOCK_STRIPES
 from summarization import summarize_chat_history
+from utils.token_counter import count_tokens
 import logging
 
 logger = logging.getLogger(__name__)
@@ -161,57 +168,218 @@ logger = logging.getLogger(__name__)
 #         return mongodb_data
 
 
+def _advanced_context_manager(namespace):
+    # torch, transformers and faiss load with the first AdvancedContextManager
+    from advanced_context_manager import AdvancedContextManager
+    return AdvancedContextManager(namespace=namespace)
+
+
 class ChatManager:
-    def __init__(self):
+    def __init__(self, namespace=CHAT_NAMESPACE):
+        # Everything this manager reads and writes is scoped to its namespace, so
+        # tests and benchmarks can run beside (and reset without touching) live data
+        self.namespace = namespace
+        self.prefix = key_prefix(namespace)
+
+        # Approaches are registered as factories and built on first use, so an
+        # approach's dependencies and models only load once it is selected
         self.approaches = {
-            'batch_summary': ExistingApproach(),
-            # 'summary_truncation': EnhancedExistingApproach(),
-            'hierarchical': HierarchicalSummary(),
-            # 'keyword': KeywordExtractor(),
-            # 'topic': TopicClusterer(),
-            'sliding_window': SlidingWindowContext(),
-            'sliding_window_5': SlidingWindowContext(window_size=5),
-            # 'hybrid': HybridStorage(),
-            # 'advanced': AdvancedContextManager()
+            'batch_summary': lambda: ExistingApproach(namespace=namespace),
+            # 'summary_truncation': lambda: EnhancedExistingApproach(namespace=namespace),
+            'hierarchical': lambda: HierarchicalSummary(namespace=namespace),
+            # 'keyword': lambda: KeywordExtractor(namespace=namespace),
+            # 'topic': lambda: TopicClusterer(namespace=namespace),
+            'sliding_window': lambda: SlidingWindowContext(namespace=namespace),
+            'sliding_window_5': lambda: SlidingWindowContext(window_size=5, namespace=namespace),
+            # 'hybrid': lambda: HybridStorage(namespace=namespace),
+            # 'advanced': lambda: _advanced_context_manager(namespace)
         }
-        self.current_approach = 'existing'
+        self.loaded_approaches = {}
+        self.approach_lock = threading.Lock()
+        # Writes for one user run one at a time in this process, while users on
+        # different stripes proceed in parallel. Across processes the approaches'
+        # own Redis compare-and-set appends keep each user's state consistent.
+        self.user_locks = [threading.Lock() for _ in range(USER_LOCK_STRIPES)]
+        self.async_user_locks = None
+        self.current_approach = 'batch_summary'
         self.redis_client = get_redis_client()
         self.mongo_db = get_mongo_client()
-        self.collection = self.mongo_db['chat_history']
+        self.collection = self.mongo_db[collection_name(namespace)]
+
+    def get_approach(self, name=None):
+        name = name or self.current_approach
+        approach = self.loaded_approaches.get(name)
+        if approach is None:
+            with self.approach_lock:
+                approach = self.loaded_approaches.get(name)
+                if approach is None:
+                    logger.info(f"Loading approach {name}")
+                    approach = self.approaches[name]()
+                    self.loaded_approaches[name] = approach
+        return approach
 
     def set_approach(self, approach):
         if approach in self.approaches:
+            # Load before switching so the first message doesn't pay for it
+            self.get_approach(approach)
             self.current_approach = approach
 
+    def _stripe(self, user_id):
+        return zlib.crc32(str(user_id).encode()) % USER_LOCK_STRIPES
+
+    def _async_user_lock(self, user_id):
+        # Created on first use so the locks belong to the running event loop
+        if self.async_user_locks is None:
+            self.async_user_locks = [asyncio.Lock() for _ in range(USER_LOCK_STRIPES)]
+        return self.async_user_locks[self._stripe(user_id)]
+
     def handle_new_message(self, user_id, message_dict):
-        self.approaches[self.current_approach].add_message(user_id, message_dict)
+        with self.user_locks[self._stripe(user_id)]:
+            self.get_approach().add_message(user_id, message_dict)
 
     def get_context(self, user_id):
-        return self.approaches[self.current_approach].get_context(user_id)
-
-    def get_redis_data(self, user_id):
-        stack_key = f"{user_id}:stack"
-        summary_key = f"{user_id}:summary"
-        batch_id_key = f"{user_id}:batch_id"
+        return self.get_approach().get_context(user_id)
+
+    def get_context_with_tokens(self, user_id):
+        # Approaches that cache their rendering also cache its token count
+        approach = self.get_approach()
+        if hasattr(approach, 'get_context_with_tokens'):
+            return approach.get_context_with_tokens(user_id)
+        context = approach.get_context(user_id)
+        # Some approaches return a list; the prompt embeds its str()
+        return context, count_tokens(str(context))
+
+    async def ahandle_new_message(self, user_id, message_dict):
+        approach = self.get_approach()
+        async with self._async_user_lock(user_id):
+            if hasattr(approach, 'aadd_message'):
+                await approach.aadd_message(user_id, message_dict)
+            else:
+                # Blocking approaches run on the default threadpool to keep the event loop
+                # free, under the thread lock too so they also serialize with sync callers
+                await asyncio.to_thread(self.handle_new_message, user_id, message_dict)
+
+    async def aget_context(self, user_id):
+        approach = self.get_approach()
+        if hasattr(approach, 'aget_context'):
+            return await approach.aget_context(user_id)
+        return await asyncio.to_thread(approach.get_context, user_id)
+
+    async def aget_context_with_tokens(self, user_id):
+        approach = self.get_approach()
+        if hasattr(approach, 'aget_context_with_tokens'):
+            return await approach.aget_context_with_tokens(user_id)
+        return await asyncio.to_thread(self.get_context_with_tokens, user_id)
+
+    def events_channel(self, user_id):
+        return events_channel(self.prefix, user_id)
+
+    def get_redis_version(self, user_id):
+        # Bumped by every write to the user's stack, summary and batch keys
+        return int(self.redis_client.get(f"{self.prefix}{user_id}:version") or 0)
+
+    def get_redis_data(self, user_id, limit=None):
+        stack_key = f"{self.prefix}{user_id}:stack"
+        summary_key = f"{self.prefix}{user_id}:summary"
+        batch_id_key = f"{self.prefix}{user_id}:batch_id"
+
+        # With a limit only the newest stack entries are read
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.lrange(stack_key, -limit if limit else 0, -1)
+        pipe.llen(stack_key)
+        pipe.get(summary_key)
+        pipe.get(batch_id_key)
+        stack, stack_size, summary, batch_id = pipe.execute()
 
         redis_data = {}
-        redis_data['stack'] = [json.loads(msg) for msg in self.redis_client.lrange(stack_key, 0, -1)]
-        summary = self.redis_client.get(summary_key)
+        redis_data['stack'] = [json.loads(msg) for msg in stack]
+        redis_data['stack_size'] = stack_size
         redis_data['summary'] = json.loads(summary) if summary else None
-        redis_data['batch_id'] = self.redis_client.get(batch_id_key)
+        redis_data['batch_id'] = batch_id
 
         return redis_data
     
     def get_internal_state(self, user_id):
         logger.info(f"Getting internal state for user {user_id} with approach {self.current_approach}")
         try:
-            return self.approaches[self.current_approach].get_internal_state(user_id)
+            return self.get_approach().get_internal_state(user_id)
         except Exception as e:
             logger.error(f"Error in get_internal_state: {str(e)}")
             raise
     
-    def get_mongodb_data(self, user_id):
-        mongodb_data = list(self.collection.find({"UserId": user_id}).sort("Timestamp", 1))
-        for doc in mongodb_data:
-            doc['_id'] = str(doc['_id'])
-        return mongodb_data
\ No newline at end of file
+    def _history_query(self, user_id, after=None):
+        # `after` is a page cursor, "<Timestamp>|<_id>"; _id breaks ties between
+        # documents written in the same microsecond
+        query = {"UserId": user_id}
+        if after:
+            timestamp, _, last_id = after.rpartition("|")
+            if not timestamp or not ObjectId.is_valid(last_id):
+                raise ValueError(f"Invalid history cursor: {after}")
+            query["$or"] = [
+                {"Timestamp": {"$gt": timestamp}},
+                {"Timestamp": timestamp, "_id": {"$gt": ObjectId(last_id)}}
+            ]
+        return query
+
+    def iter_mongodb_data(self, user_id, after=None, limit=None):
+        # Oldest first; each document carries a Cursor, and passing the last one
+        # seen as `after` gets the next page
+        cursor = self.collection.find(self._history_query(user_id, after), {**HISTORY_PROJECTION, "_id": 1})
+        cursor = cursor.sort([("Timestamp", 1), ("_id", 1)]).batch_size(MONGO_READ_BATCH_SIZE)
+        if limit:
+            cursor = cursor.limit(limit)
+        for doc in cursor:
+            doc["Cursor"] = f"{doc['Timestamp']}|{doc.pop('_id')}"
+            yield doc
+
+    def get_mongodb_data(self, user_id, after=None, limit=None):
+        return list(self.iter_mongodb_data(user_id, after, limit))
+
+    def get_mongodb_version(self, user_id, after=None):
+        # History is append-only, so the number of documents and the newest
+        # Timestamp change whenever the result could; both come from the index
+        query = self._history_query(user_id, after)
+        count = self.collection.count_documents(query)
+        latest = self.collection.find_one(query, {"_id": 0, "Timestamp": 1}, sort=[("Timestamp", -1)])
+        return f"{count}-{latest['Timestamp'] if latest else ''}"
+
+    def ensure_indexes(self):
+        if not ensure_indexes(self.collection):
+            logger.warning(f"(UserId, Timestamp) or (UserId, Kind, Timestamp) index missing on {self.collection.name}; history reads will scan")
+
+    def rehydrate(self, user_ids):
+        # Warm start: rebuild cached state from MongoDB for users whose Redis keys are missing
+        approach = self.get_approach()
+        if not hasattr(approach, 'rehydrate'):
+            return 0
+        return sum(1 for user_id in user_ids if approach.rehydrate(user_id))
+
+    def recent_users(self, limit):
+        # Users ordered by their latest message, newest first
+        pipeline = [
+            {"$group": {"_id": "$UserId", "last": {"$max": "$Timestamp"}}},
+            {"$sort": {"last": -1}},
+            {"$limit": limit}
+        ]
+        return [doc["_id"] for doc in self.collection.aggregate(pipeline)]
+
+    def warm_up(self, limit):
+        # Preload the cache for the most recently active users, e.g. after Redis was flushed
+        user_ids = self.recent_users(limit)
+        rehydrated = self.rehydrate(user_ids)
+        logger.info(f"Warm-up rehydrated {rehydrated} of {len(user_ids)} recent users")
+        return rehydrated
+
+    def reset(self):
+        # Drops this namespace's data and in-process state; the live namespace cannot be reset.
+        # Buffered writes go first so they can't land after the collection is dropped.
+        get_mongo_writer(self.collection.name).flush()
+        reset_namespace(self.namespace)
+        with self.approach_lock:
+            self.loaded_approaches.clear()
+        self.ensure_indexes()
+
+    def close(self):
+        for approach in self.loaded_approaches.values():
+            if hasattr(approach, 'close'):
+                approach.close()
@@ -8,4 +8,62 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-DATABASE_NAME = os.getenv("DATABASE_NAME", "chat_database")
\ No newline at end of file
+DATABASE_NAME = os.getenv("DATABASE_NAME", "chat_database")
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", 4))
+SUMMARY_MAX_RETRIES = int(os.getenv("SUMMARY_MAX_RETRIES", 3))
+SUMMARY_RETRY_BACKOFF_MS = float(os.getenv("SUMMARY_RETRY_BACKOFF_MS", 1000))
+
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 5))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 100000))
+TOKEN_COUNT_THREADS = int(os.getenv("TOKEN_COUNT_THREADS", 4))
+STATE_STORE = os.getenv("STATE_STORE", "memory")
+STATE_STORE_MAX_USERS = int(os.getenv("STATE_STORE_MAX_USERS", 10000))
+# Items across all users' append-only lists in the memory store (hierarchical
+# levels, keyword term records); least recently used users go first past it
+STATE_STORE_MAX_ITEMS = int(os.getenv("STATE_STORE_MAX_ITEMS", 1000000))
+STATE_STORE_TTL = int(os.getenv("STATE_STORE_TTL", 86400))
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", 4))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", 5))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 10000))
+EMBEDDING_QUANTIZE = os.getenv("EMBEDDING_QUANTIZE", "true").lower() == "true"
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", "models")
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "vector_indexes")
+VECTOR_INDEX_MAX_USERS = int(os.getenv("VECTOR_INDEX_MAX_USERS", 1000))
+VECTOR_ANN_THRESHOLD = int(os.getenv("VECTOR_ANN_THRESHOLD", 10000))
+VECTOR_ANN_TYPE = os.getenv("VECTOR_ANN_TYPE", "hnsw")
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")
+CHAT_NAMESPACE = os.getenv("CHAT_NAMESPACE", "")
+TEST_NAMESPACE = os.getenv("TEST_NAMESPACE", "test")
+REHYDRATE_LIMIT = int(os.getenv("REHYDRATE_LIMIT", 200))
+REHYDRATE_LOCK_TIMEOUT = float(os.getenv("REHYDRATE_LOCK_TIMEOUT", 10))
+WARMUP_USERS = int(os.getenv("WARMUP_USERS", 0))
+MONGO_FLUSH_INTERVAL_MS = float(os.getenv("MONGO_FLUSH_INTERVAL_MS", 100))
+MONGO_FLUSH_BATCH_SIZE = int(os.getenv("MONGO_FLUSH_BATCH_SIZE", 500))
+# "majority", or a number of acknowledging nodes (0 is fire-and-forget)
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "1")
+MONGO_WRITE_CONCERN = int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN
+MONGO_READ_BATCH_SIZE = int(os.getenv("MONGO_READ_BATCH_SIZE", 500))
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", 100))
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+FAKE_LLM_WORDS = int(os.getenv("FAKE_LLM_WORDS", 40))
+FAKE_LLM_DELAY_MS = float(os.getenv("FAKE_LLM_DELAY_MS", 0))
+BENCHMARK_LLM_BACKEND = os.getenv("BENCHMARK_LLM_BACKEND", "fake")
+# Message batches buffered per benchmark process while a conversation streams in
+BENCHMARK_QUEUE_SIZE = int(os.getenv("BENCHMARK_QUEUE_SIZE", 16))
+# Longest single message (in characters) a /run_test upload may contain
+UPLOAD_MAX_MESSAGE_CHARS = int(os.getenv("UPLOAD_MAX_MESSAGE_CHARS", 1 << 20))
+CONTEXT_CACHE_MAX_USERS = int(os.getenv("CONTEXT_CACHE_MAX_USERS", 10000))
+USER_LOCK_STRIPES = int(os.getenv("USER_LOCK_STRIPES", 64))
+# Seconds a worker keeps a user's topic model after its last clustering job
+TOPIC_OWNER_TTL = float(os.getenv("TOPIC_OWNER_TTL", 60))
+# Hashed features per message; each user's model holds max_clusters dense
+# centers of this width (8 bytes each)
+TOPIC_HASH_FEATURES = int(os.getenv("TOPIC_HASH_FEATURES", 1 << 13))
+# Topic models kept per worker; an evicted user's model is refit from Redis
+TOPIC_MAX_MODELS = int(os.getenv("TOPIC_MAX_MODELS", 500))
@@ -1,37 +1,46 @@
+import asyncio
 import json
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
+import time
 import numpy as np
-from utils.redis_client import get_redis_client
+from utils.redis_client import get_redis_client, get_async_redis_client
 from utils.mongo_client import get_mongo_client
-from summarization import summarize_chat_history
+from utils.mongo_writer import get_mongo_writer
+from summarization import summarize_chat_history, summary_queue
 import threading
+import uuid
+import logging
+from collections import deque
+from redis.exceptions import LockError
 from datetime import datetime
-from utils.token_counter import count_tokens
+from utils.context_packer import pack_segments
+from utils.state_store import get_state_store, InMemoryStateStore
+from utils.message_record import MessageRecord
+from utils.redis_scripts import ROLLOVER_SCRIPT, APPEND_SCRIPT, LEASE_SCRIPT, batch_messages
+from utils.namespace import key_prefix, collection_name
+from utils.event_bus import events_channel, publish
+from utils.context_cache import CachedContext, build_segments, summary_segment, message_segment
+from config import REHYDRATE_LIMIT, REHYDRATE_LOCK_TIMEOUT, MONGO_READ_BATCH_SIZE, CONTEXT_CACHE_MAX_USERS, TOPIC_OWNER_TTL, TOPIC_HASH_FEATURES, TOPIC_MAX_MODELS
+
+logger = logging.getLogger(__name__)
+
+# Fields shown for a user's history; _id and UserId are left out of every read
+HISTORY_PROJECTION = {"_id": 0, "Timestamp": 1, "Content": 1, "BatchId": 1, "Kind": 1}
 
 class ExistingApproach:
-    def __init__(self):
+    def __init__(self, batch_size=20, namespace=None):
+        self.prefix = key_prefix(namespace)
         self.redis_client = get_redis_client()
         self.mongo_db = get_mongo_client()
-        self.collection = self.mongo_db['chat_history']
-
-        self.clear_all_mongodb_data()
-        self.clear_all_redis_data()
-    def clear_all_redis_data(self):
-        print("Clearing Redis data")
-        try:
-            self.redis_client.flushdb()
-            print("Successfully cleared all data in the current Redis database.")
-        except Exception as e:
-            print(f"Error clearing Redis data: {e}")
-    
-    def clear_all_mongodb_data(self):
-        try:
-            # Delete all documents in the collection
-            print("Clearing MongoDB data")
-            result = self.collection.delete_many({})
-        except Exception as e:
-            print(f"Error clearing MongoDB data: {e}")
+        self.collection = self.mongo_db[collection_name(namespace)]
+        self.async_redis_client = get_async_redis_client()
+        # Inserts are buffered and written with insert_many off the request path
+        self.writer = get_mongo_writer(collection_name(namespace))
+        self.batch_size = batch_size
+        self._rollover = self.redis_client.register_script(ROLLOVER_SCRIPT)
+        self._append = self.redis_client.register_script(APPEND_SCRIPT)
+        self._async_append = self.async_redis_client.register_script(APPEND_SCRIPT)
+        # Rendered contexts by user, checked against {user}:version before use
+        self.context_cache = InMemoryStateStore(max_users=CONTEXT_CACHE_MAX_USERS)
 
     def get_internal_state(self, user_id):
         return {
@@ -40,9 +49,9 @@ class ExistingApproach:
         }
     
     def get_redis_data(self, user_id):
-        stack_key = f"{user_id}:stack"
-        summary_key = f"{user_id}:summary"
-        batch_id_key = f"{user_id}:batch_id"
+        stack_key = f"{self.prefix}{user_id}:stack"
+        summary_key = f"{self.prefix}{user_id}:summary"
+        batch_id_key = f"{self.prefix}{user_id}:batch_id"
 
         redis_data = {}
         redis_data['stack'] = [json.loads(msg) for msg in self.redis_client.lrange(stack_key, 0, -1)]
@@ -53,38 +62,160 @@ class ExistingApproach:
         return redis_data
 
     def get_mongodb_data(self, user_id):
-        mongodb_data = list(self.collection.find({"UserId": user_id}).sort("Timestamp", 1))
-        for doc in mongodb_data:
-            doc['_id'] = str(doc['_id'])
-        return mongodb_data
-    
+        cursor = self.collection.find({"UserId": user_id}, HISTORY_PROJECTION).sort("Timestamp", 1)
+        return list(cursor.batch_size(MONGO_READ_BATCH_SIZE))
+
+    def rehydrate(self, user_id):
+        # Read-through on a cache miss: rebuild the user's stack, summaries and
+        # batch counters from MongoDB. A Redis lock makes concurrent misses for
+        # the same user wait for one rebuild instead of all querying Mongo.
+        stack_key = f"{self.prefix}{user_id}:stack"
+        summary_key = f"{self.prefix}{user_id}:summary"
+        batch_id_key = f"{self.prefix}{user_id}:batch_id"
+        batch_counts_key = f"{self.prefix}{user_id}:batch_counts"
+        version_key = f"{self.prefix}{user_id}:version"
+        if self.redis_client.exists(stack_key, summary_key, batch_id_key):
+            return False
+
+        lock = self.redis_client.lock(f"{self.prefix}{user_id}:rehydrate_lock", timeout=REHYDRATE_LOCK_TIMEOUT, blocking_timeout=REHYDRATE_LOCK_TIMEOUT)
+        if not lock.acquire():
+            # Another worker's rebuild outlasted the wait; use whatever it has written by now
+            logger.warning(f"Timed out waiting to rehydrate {user_id}")
+            return bool(self.redis_client.exists(batch_id_key))
+        try:
+            if self.redis_client.exists(stack_key, summary_key, batch_id_key):
+                return False
+            self.writer.flush()
+
+            # Every summary, oldest first, and only the newest REHYDRATE_LIMIT messages;
+            # both queries are served by the (UserId, Kind, Timestamp) index
+            summaries = [
+                {"batch_id": doc["BatchId"], "content": doc["Content"], "count": doc.get("Count", 0)}
+                for doc in self.collection.find(
+                    {"UserId": user_id, "Kind": "summary"},
+                    {"_id": 0, "BatchId": 1, "Content": 1, "Count": 1}
+                ).sort("Timestamp", 1)
+            ]
+            messages = list(
+                self.collection.find(
+                    {"UserId": user_id, "Kind": None},
+                    {"_id": 0, "BatchId": 1, "Content": 1, "Timestamp": 1}
+                )
+                .sort("Timestamp", -1)
+                .limit(REHYDRATE_LIMIT)
+            )
+            messages.reverse()
+
+            summarized = {summary["batch_id"] for summary in summaries}
+            stack = [doc for doc in messages if doc["BatchId"] not in summarized]
+
+            batch_counts = {}
+            for doc in stack:
+                batch_counts[doc["BatchId"]] = batch_counts.get(doc["BatchId"], 0) + 1
+            # The open batch follows the newest one seen, and never reuses a summarized one
+            batch_id = max([doc["BatchId"] for doc in stack] + [b + 1 for b in summarized], default=1)
+            closed = [b for b, count in batch_counts.items() if count >= self.batch_size]
+            if batch_id in closed:
+                batch_id += 1
+
+            pipe = self.redis_client.pipeline()
+            for doc in stack:
+                pipe.rpush(stack_key, json.dumps({"batch_id": doc["BatchId"], "content": doc["Content"], "timestamp": doc["Timestamp"]}))
+            if summaries:
+                pipe.set(summary_key, json.dumps(summaries))
+            if batch_counts:
+                pipe.hset(batch_counts_key, mapping=batch_counts)
+            # batch_id is always written, so a user with no history is not looked up again
+            pipe.set(batch_id_key, batch_id)
+            # Restart the version from the clock so it never repeats a value clients cached before the loss
+            pipe.set(version_key, time.time_ns() // 1000)
+            publish(pipe, self.prefix, user_id, {"type": "resync"})
+            pipe.execute()
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                # The lock expired during a slow rebuild; the keys are written either way
+                pass
+
+        # Batches that filled up but were never summarized (e.g. the process stopped
+        # while their summary was queued) are summarized now, oldest first
+        for closed_batch in sorted(closed):
+            summary_queue.submit(user_id, self._create_summary, user_id, closed_batch)
+        return bool(summaries or messages)
+
     def add_message(self, user_id, message_dict):
-        stack_key = f"{user_id}:stack"
-        batch_id_key = f"{user_id}:batch_id"
+        batch_id = self.redis_client.get(f"{self.prefix}{user_id}:batch_id")
+        if batch_id is None and self.rehydrate(user_id):
+            batch_id = self.redis_client.get(f"{self.prefix}{user_id}:batch_id")
+        batch_id = int(batch_id) if batch_id else 1
 
-        batch_id = self.redis_client.get(batch_id_key)
+        while True:
+            message, message_doc = self._build_message(user_id, message_dict, batch_id)
+            # Compare-and-set on the batch id: push, count, bump the version and
+            # close a full batch in one atomic step, or learn the current batch and retry
+            result = self._append(*self._append_args(user_id, message, batch_id))
+            if result[0] != -1:
+                break
+            batch_id = result[1]
+        _, version, closed_version = result
+        self._after_append(user_id, message, message_doc, batch_id, version, closed_version)
+
+    async def aadd_message(self, user_id, message_dict):
+        batch_id = await self.async_redis_client.get(f"{self.prefix}{user_id}:batch_id")
+        if batch_id is None and await asyncio.to_thread(self.rehydrate, user_id):
+            batch_id = await self.async_redis_client.get(f"{self.prefix}{user_id}:batch_id")
         batch_id = int(batch_id) if batch_id else 1
 
+        while True:
+            message, message_doc = self._build_message(user_id, message_dict, batch_id)
+            result = await self._async_append(*self._append_args(user_id, message, batch_id))
+            if result[0] != -1:
+                break
+            batch_id = result[1]
+        _, version, closed_version = result
+        self._after_append(user_id, message, message_doc, batch_id, version, closed_version)
+
+    def _append_args(self, user_id, message, batch_id):
+        keys = [
+            f"{self.prefix}{user_id}:stack",
+            f"{self.prefix}{user_id}:batch_counts",
+            f"{self.prefix}{user_id}:version",
+            f"{self.prefix}{user_id}:batch_id"
+        ]
+        args = [
+            batch_id,
+            json.dumps(message),
+            self.batch_size,
+            events_channel(self.prefix, user_id),
+            json.dumps({"type": "message", "message": message}),
+            json.dumps({"type": "batch", "batch_id": batch_id + 1})
+        ]
+        return keys, args
+
+    def _after_append(self, user_id, message, message_doc, batch_id, version, closed_version):
+        cached = self._cached_context(user_id)
+        cached.append(version, message)
+        self.writer.insert(message_doc)
+        if closed_version:
+            # The next batch has started; summarize the closed one in the background
+            cached.advance(closed_version)
+            summary_queue.submit(user_id, self._create_summary, user_id, batch_id)
+
+    def _build_message(self, user_id, message_dict, batch_id):
         timestamp = datetime.now().isoformat()
         message = {
             "batch_id": batch_id,
             "content": message_dict,
             "timestamp": timestamp
         }
-
-        self.redis_client.rpush(stack_key, json.dumps(message))
-
         message_doc = {
             "UserId": user_id,
             "Timestamp": timestamp,
             "Content": message_dict,
             "BatchId": batch_id
         }
-        self.collection.insert_one(message_doc)
-
-        if self._count_messages_with_batch(stack_key, batch_id) == 20:
-            self._create_summary(user_id, batch_id)
-            self.redis_client.set(batch_id_key, batch_id + 1)
+        return message, message_doc
 
     # def get_context(self, user_id):
     #     summary_key = f"{user_id}:summary"
@@ -103,49 +234,62 @@ class ExistingApproach:
     #     return history
 
     def get_context(self, user_id):
-        summary_key = f"{user_id}:summary"
-        stack_key = f"{user_id}:stack"
-
-        summaries = self.redis_client.get(summary_key)
-        summaries = json.loads(summaries) if summaries else []
-
-        recent_messages = [json.loads(msg) for msg in self.redis_client.lrange(stack_key, 0, -1)]
-
-        # Format the context
-        context = ""
-
-        # Add summaries of previous batches
-        if summaries:
-            context += "Summaries of previous conversations:\n"
-            for summary in summaries:
-                context += f"Batch {summary['batch_id']}: {summary['content']}\n\n"
-
-        # Add current conversation
-        if recent_messages:
-            context += "Current conversation:\n"
-            for msg in recent_messages:
-                if isinstance(msg['content'], dict):
-                    role = msg['content'].get('role', 'unknown')
-                    content = msg['content'].get('content', '')
-                    context += f"{role.capitalize()}: {content}\n"
-                else:
-                    context += f"Message: {msg['content']}\n"
-
-        return context.strip()
-
-    def _count_messages_with_batch(self, stack_key, batch_id):
-        count = 0
-        messages = self.redis_client.lrange(stack_key, 0, -1)
-        for msg in messages:
-            message = json.loads(msg)
-            if message["batch_id"] == batch_id:
-                count += 1
-        return count
+        return self.get_context_with_tokens(user_id)[0]
+
+    async def aget_context(self, user_id):
+        return (await self.aget_context_with_tokens(user_id))[0]
+
+    def get_context_with_tokens(self, user_id):
+        # The context and its token count; a single GET of the version while
+        # the cached rendering is current
+        version = self.redis_client.get(f"{self.prefix}{user_id}:version")
+        cached = self._cached_context(user_id).read(int(version)) if version is not None else None
+        if cached is not None:
+            return cached
+
+        version, summaries, stack = self._snapshot(self.redis_client.pipeline(), user_id).execute()
+        if summaries is None and not stack and self.rehydrate(user_id):
+            version, summaries, stack = self._snapshot(self.redis_client.pipeline(), user_id).execute()
+        return self._rebuild_context(user_id, version, summaries, stack)
+
+    async def aget_context_with_tokens(self, user_id):
+        version = await self.async_redis_client.get(f"{self.prefix}{user_id}:version")
+        cached = self._cached_context(user_id).read(int(version)) if version is not None else None
+        if cached is not None:
+            return cached
+
+        version, summaries, stack = await self._snapshot(self.async_redis_client.pipeline(), user_id).execute()
+        if summaries is None and not stack and await asyncio.to_thread(self.rehydrate, user_id):
+            return await asyncio.to_thread(self.get_context_with_tokens, user_id)
+        return self._rebuild_context(user_id, version, summaries, stack)
+
+    def _snapshot(self, pipe, user_id):
+        # Queued as one MULTI, so the summaries and stack match the version read with them
+        pipe.get(f"{self.prefix}{user_id}:version")
+        pipe.get(f"{self.prefix}{user_id}:summary")
+        pipe.lrange(f"{self.prefix}{user_id}:stack", 0, -1)
+        return pipe
+
+    def _cached_context(self, user_id):
+        return self.context_cache.load(user_id, CachedContext)
+
+    def _rebuild_context(self, user_id, version, summaries, stack):
+        summaries = build_segments(json.loads(summaries) if summaries else [], summary_segment)
+        messages = build_segments([json.loads(msg) for msg in stack], message_segment)
+        if version is not None:
+            self._cached_context(user_id).replace(int(version), summaries, list(messages))
+        # Render this snapshot itself: the cached entry may already be newer
+        snapshot = CachedContext()
+        snapshot.replace(0, summaries, messages)
+        return snapshot.render()
 
     def _create_summary(self, user_id, batch_id):
-        stack_key = f"{user_id}:stack"
-        all_messages = [json.loads(msg) for msg in self.redis_client.lrange(stack_key, 0, -1)]
-        messages_to_summarize = [msg["content"] for msg in all_messages if msg["batch_id"] == batch_id]
+        stack_key = f"{self.prefix}{user_id}:stack"
+        messages_to_summarize = [msg["content"] for msg in batch_messages(self.redis_client, stack_key, batch_id, self.batch_size)]
+        if not messages_to_summarize:
+            # Already rolled out (or trimmed), so there is nothing to summarize
+            self.redis_client.hdel(f"{self.prefix}{user_id}:batch_counts", batch_id)
+            return
 
         summary_content = summarize_chat_history(messages_to_summarize)
         summary = {
@@ -154,148 +298,134 @@ class ExistingApproach:
             "count": len(messages_to_summarize)
         }
 
-        summary_key = f"{user_id}:summary"
-        existing_summaries = self.redis_client.get(summary_key)
-        if existing_summaries:
-            existing_summaries = json.loads(existing_summaries)
-            existing_summaries.append(summary)
-        else:
-            existing_summaries = [summary]
-
-        self.redis_client.set(summary_key, json.dumps(existing_summaries))
+        # Trim the batch and append the summary atomically on the server
+        removed = self._rollover(
+            keys=[stack_key, f"{self.prefix}{user_id}:summary", f"{self.prefix}{user_id}:batch_counts", f"{self.prefix}{user_id}:version"],
+            args=[json.dumps(summary), batch_id, self.batch_size]
+        )
+        timestamp = datetime.now().isoformat()
+        publish(self.redis_client, self.prefix, user_id, {"type": "summary", "summary": summary, "removed": removed, "timestamp": timestamp})
 
-        remaining_messages = [msg for msg in all_messages if msg["batch_id"] != batch_id]
-        self.redis_client.delete(stack_key)
-        for msg in remaining_messages:
-            self.redis_client.rpush(stack_key, json.dumps(msg))
+        # Keep the summary in MongoDB too, so the cache can be rebuilt without re-summarizing
+        self.writer.insert({
+            "UserId": user_id,
+            "Timestamp": timestamp,
+            "Kind": "summary",
+            "Content": summary_content,
+            "BatchId": batch_id,
+            "Count": len(messages_to_summarize)
+        })
 
 class EnhancedExistingApproach:
-    def __init__(self, max_tokens=4000):
+    def __init__(self, max_tokens=4000, batch_size=10, namespace=None):
+        self.prefix = key_prefix(namespace)
         self.redis_client = get_redis_client()
         self.mongo_db = get_mongo_client()
-        self.collection = self.mongo_db['chat_history']
+        self.collection = self.mongo_db[collection_name(namespace)]
+        self.writer = get_mongo_writer(collection_name(namespace))
         self.max_tokens = max_tokens
-
-        self.clear_all_mongodb_data()
-        self.clear_all_redis_data()
-
-    def clear_all_redis_data(self):
-        print("Clearing Redis data")
-        try:
-            self.redis_client.flushdb()
-            print("Successfully cleared all data in the current Redis database.")
-        except Exception as e:
-            print(f"Error clearing Redis data: {e}")
-
-    def clear_all_mongodb_data(self):
-        try:
-            # Delete all documents in the collection
-            print("Clearing MongoDB data")
-            result = self.collection.delete_many({})
-        except Exception as e:
-            print(f"Error clearing MongoDB data: {e}")
+        self.batch_size = batch_size
+        self._rollover = self.redis_client.register_script(ROLLOVER_SCRIPT)
+        self._append = self.redis_client.register_script(APPEND_SCRIPT)
 
     def add_message(self, user_id, message_dict):
-        stack_key = f"{user_id}:stack"
-        summary_key = f"{user_id}:summary"
-        batch_id_key = f"{user_id}:batch_id"
+        stack_key = f"{self.prefix}{user_id}:stack"
+        summary_key = f"{self.prefix}{user_id}:summary"
+        batch_id_key = f"{self.prefix}{user_id}:batch_id"
+        batch_counts_key = f"{self.prefix}{user_id}:batch_counts"
 
         batch_id = self.redis_client.get(batch_id_key)
         batch_id = int(batch_id) if batch_id else 1
 
-        message = {
-            "batch_id": batch_id,
-            "content": message_dict['content'],
-            "timestamp": datetime.now().isoformat()
-        }
+        while True:
+            message = {
+                "batch_id": batch_id,
+                "content": message_dict['content'],
+                "timestamp": datetime.now().isoformat()
+            }
+            # Same compare-and-set append as ExistingApproach; retried if the batch moved on
+            result = self._append(
+                keys=[stack_key, batch_counts_key, f"{self.prefix}{user_id}:version", batch_id_key],
+                args=[
+                    batch_id,
+                    json.dumps(message),
+                    self.batch_size,
+                    events_channel(self.prefix, user_id),
+                    json.dumps({"type": "message", "message": message}),
+                    json.dumps({"type": "batch", "batch_id": batch_id + 1})
+                ]
+            )
+            if result[0] != -1:
+                break
+            batch_id = result[1]
 
-        self.redis_client.rpush(stack_key, json.dumps(message))
-        self.collection.insert_one({
+        self.writer.insert({
             "UserId": user_id,
             "Timestamp": message["timestamp"],
             "Content": message_dict['content'],
             "BatchId": batch_id
         })
 
-        messages_in_batch = self._count_messages_with_batch(stack_key, batch_id)
-        if messages_in_batch == 10:
-            self._create_summary(user_id, batch_id)
-            self.redis_client.set(batch_id_key, batch_id + 1)
+        if result[2]:
+            # The next batch has started; summarize the closed one in the background
+            summary_queue.submit(user_id, self._create_summary, user_id, batch_id)
 
         self._manage_token_limit(user_id)
 
     def get_context(self, user_id):
-        context = self._get_full_context(user_id)
-        return self._truncate_context(context)
+        context, _ = pack_segments(self._get_segments(user_id), self.max_tokens, self._render_context, key=lambda segment: segment[1])
+        return context
 
-    def _get_full_context(self, user_id):
-        summary_key = f"{user_id}:summary"
-        stack_key = f"{user_id}:stack"
+    def _get_segments(self, user_id):
+        summary_key = f"{self.prefix}{user_id}:summary"
+        stack_key = f"{self.prefix}{user_id}:stack"
 
         summary = self.redis_client.get(summary_key)
         summary = json.loads(summary) if summary else []
 
         recent_messages = [json.loads(msg) for msg in self.redis_client.lrange(stack_key, 0, -1)]
 
-        context = ""
+        # Oldest first: summary sentences are dropped before any recent message
+        segments = []
         if summary:
-            context += "Summary: " + " ".join([s['content'] for s in summary]) + "\n\n"
-        if recent_messages:
-            context += "Recent messages: " + " ".join([m['content'] for m in recent_messages])
+            sentences = " ".join([s['content'] for s in summary]).split(". ")
+            segments.extend(("summary", sentence) for sentence in sentences)
+        segments.extend(("message", m['content']) for m in recent_messages)
+        return segments
 
-        return context
+    def _render_context(self, segments):
+        summary = [text for kind, text in segments if kind == "summary"]
+        recent_messages = [text for kind, text in segments if kind == "message"]
 
-    def _truncate_context(self, context):
-        while count_tokens(context) > self.max_tokens:
-            parts = context.split("\n\n", 1)
-            if len(parts) > 1:
-                summary, recent_messages = parts
-                if summary.startswith("Summary:"):
-                    summary_parts = summary.split(". ")
-                    if len(summary_parts) > 1:
-                        summary = "Summary: " + ". ".join(summary_parts[1:])
-                    else:
-                        summary = ""
-                else:
-                    recent_messages = recent_messages.split(". ", 1)[1] if ". " in recent_messages else ""
-                context = f"{summary}\n\n{recent_messages}".strip()
-            else:
-                context = context[:int(self.max_tokens * 0.9)]
+        context = ""
+        if summary:
+            context += "Summary: " + ". ".join(summary) + "\n\n"
+        if recent_messages:
+            context += "Recent messages: " + " ".join(recent_messages)
 
-        return context
+        return context.strip()
 
     def _manage_token_limit(self, user_id):
-        context = self._get_full_context(user_id)
-        truncated_context = self._truncate_context(context)
-        
-        summary_key = f"{user_id}:summary"
-        stack_key = f"{user_id}:stack"
-        
-        parts = truncated_context.split("\n\n", 1)
-        if len(parts) > 1:
-            summary, recent_messages = parts
-            self.redis_client.set(summary_key, json.dumps([{"content": summary[8:]}]))  # Remove "Summary: " prefix
-            self.redis_client.delete(stack_key)
-            for msg in recent_messages[17:].split(". "):  # Remove "Recent messages: " prefix
-                self.redis_client.rpush(stack_key, json.dumps({"content": msg.strip()}))
-        else:
-            self.redis_client.delete(summary_key)
-            self.redis_client.delete(stack_key)
-            self.redis_client.rpush(stack_key, json.dumps({"content": truncated_context}))
-
-    def _count_messages_with_batch(self, stack_key, batch_id):
-        count = 0
-        messages = self.redis_client.lrange(stack_key, 0, -1)
-        for msg in messages:
-            message = json.loads(msg)
-            if message.get("batch_id") == batch_id:
-                count += 1
-        return count
+        segments = self._get_segments(user_id)
+        _, dropped = pack_segments(segments, self.max_tokens, self._render_context, key=lambda segment: segment[1])
+
+        # Messages that no longer fit even with every summary sentence dropped can
+        # never be sent again, so trim them off the head of the stack
+        dropped_messages = sum(1 for kind, _ in segments[:dropped] if kind == "message")
+        if dropped_messages:
+            pipe = self.redis_client.pipeline()
+            pipe.ltrim(f"{self.prefix}{user_id}:stack", dropped_messages, -1)
+            pipe.incr(f"{self.prefix}{user_id}:version")
+            publish(pipe, self.prefix, user_id, {"type": "trim", "removed": dropped_messages})
+            pipe.execute()
 
     def _create_summary(self, user_id, batch_id):
-        stack_key = f"{user_id}:stack"
-        all_messages = [json.loads(msg) for msg in self.redis_client.lrange(stack_key, 0, -1)]
-        messages_to_summarize = [msg["content"] for msg in all_messages if msg.get("batch_id") == batch_id]
+        stack_key = f"{self.prefix}{user_id}:stack"
+        messages_to_summarize = [msg["content"] for msg in batch_messages(self.redis_client, stack_key, batch_id, self.batch_size)]
+        if not messages_to_summarize:
+            # Already rolled out (or trimmed), so there is nothing to summarize
+            self.redis_client.hdel(f"{self.prefix}{user_id}:batch_counts", batch_id)
+            return
 
         summary_content = summarize_chat_history(messages_to_summarize)
         summary = {
@@ -304,21 +434,12 @@ class EnhancedExistingApproach:
             "count": len(messages_to_summarize)
         }
 
-        summary_key = f"{user_id}:summary"
-        existing_summary = self.redis_client.get(summary_key)
-        if existing_summary:
-            existing_summary = json.loads(existing_summary)
-        else:
-            existing_summary = []
-
-        existing_summary.append(summary)
-
-        self.redis_client.set(summary_key, json.dumps(existing_summary))
-
-        remaining_messages = [msg for msg in all_messages if msg.get("batch_id") != batch_id]
-        self.redis_client.delete(stack_key)
-        for msg in remaining_messages:
-            self.redis_client.rpush(stack_key, json.dumps(msg))
+        # Trim the batch and append the summary atomically on the server
+        removed = self._rollover(
+            keys=[stack_key, f"{self.prefix}{user_id}:summary", f"{self.prefix}{user_id}:batch_counts", f"{self.prefix}{user_id}:version"],
+            args=[json.dumps(summary), batch_id, self.batch_size]
+        )
+        publish(self.redis_client, self.prefix, user_id, {"type": "summary", "summary": summary, "removed": removed, "timestamp": datetime.now().isoformat()})
 
     def get_internal_state(self, user_id):
         return {
@@ -327,9 +448,9 @@ class EnhancedExistingApproach:
         }
 
     def get_redis_data(self, user_id):
-        stack_key = f"{user_id}:stack"
-        summary_key = f"{user_id}:summary"
-        batch_id_key = f"{user_id}:batch_id"
+        stack_key = f"{self.prefix}{user_id}:stack"
+        summary_key = f"{self.prefix}{user_id}:summary"
+        batch_id_key = f"{self.prefix}{user_id}:batch_id"
 
         redis_data = {}
         redis_data['stack'] = [json.loads(msg) for msg in self.redis_client.lrange(stack_key, 0, -1)]
@@ -340,73 +461,135 @@ class EnhancedExistingApproach:
         return redis_data
 
     def get_mongodb_data(self, user_id):
-        mongodb_data = list(self.collection.find({"UserId": user_id}).sort("Timestamp", 1))
-        for doc in mongodb_data:
-            doc['_id'] = str(doc['_id'])
-        return mongodb_data
+        cursor = self.collection.find({"UserId": user_id}, HISTORY_PROJECTION).sort("Timestamp", 1)
+        return list(cursor.batch_size(MONGO_READ_BATCH_SIZE))
 
 class HierarchicalSummary:
-    def __init__(self):
-        self.levels = {1: [], 2: [], 3: [], 4: []}
+    # levels[0] holds raw messages, levels[1..3] hold summaries of the level below;
+    # each level is an append-only list in the state store
+    LEVELS = ["level0", "level1", "level2", "level3"]
+
+    def __init__(self, state_store=None, namespace=None):
+        self.state_store = state_store or get_state_store("hierarchical", namespace, lists=self.LEVELS)
 
     def add_message(self, user_id, message_dict):
         
-        self.levels[1].append(message_dict)
-        if len(self.levels[1]) % 10 == 0:
-            summary = summarize_chat_history(self.levels[1][-10:])
-            self.levels[2].append(summary)
-            if len(self.levels[2]) % 10 == 0:
-                summary = summarize_chat_history(self.levels[2][-10:])
-                self.levels[3].append(summary)
-                if len(self.levels[3]) % 10 == 0:
-                    summary = summarize_chat_history(self.levels[3][-10:])
-                    self.levels[4].append(summary)
+        length = self.state_store.append(user_id, self.LEVELS[0], message_dict)
+        if length % 10 == 0:
+            # The ten messages ending with this one, even if more were appended since
+            summary_queue.submit(user_id, self._summarize_level, user_id, 1, self.state_store.items(user_id, self.LEVELS[0], length - 10, length))
 
-    def get_context(self, user_id, num_messages=10):
+    def _summarize_level(self, user_id, level, messages):
+        summary = summarize_chat_history(messages)
+        length = self.state_store.append(user_id, self.LEVELS[level], summary)
+        if level + 1 < 4 and length % 10 == 0:
+            self._summarize_level(user_id, level + 1, self.state_store.items(user_id, self.LEVELS[level], length - 10, length))
 
+    def get_context(self, user_id, num_messages=10):
         context = []
-        context.extend(self.levels[4][-1:])
-        context.extend(self.levels[3][-3:])
-        context.extend(self.levels[2][-5:])
-        context.extend(self.levels[1][-num_messages:])
+        context.extend(self.state_store.tail(user_id, self.LEVELS[3], 1))
+        context.extend(self.state_store.tail(user_id, self.LEVELS[2], 3))
+        context.extend(self.state_store.tail(user_id, self.LEVELS[1], 5))
+        context.extend(self.state_store.tail(user_id, self.LEVELS[0], num_messages))
 
         print("Context: ", context)
         return context
     
     def get_internal_state(self, user_id):
         return {
-            "level1": self.levels[1],
-            "level2": self.levels[2],
-            "level3": self.levels[3],
-            "level4": self.levels[4]
+            "level1": self.state_store.items(user_id, self.LEVELS[0]),
+            "level2": self.state_store.items(user_id, self.LEVELS[1]),
+            "level3": self.state_store.items(user_id, self.LEVELS[2]),
+            "level4": self.state_store.items(user_id, self.LEVELS[3])
         }
 
 class KeywordExtractor:
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer()
-        self.messages = []
-        self.importance_scores = np.array([])
+    def __init__(self, state_store=None, namespace=None):
+        # sklearn is imported here so it only loads once this approach is used
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        # Same tokenization as TfidfVectorizer() so scores match a full refit
+        self.analyzer = TfidfVectorizer().build_analyzer()
+        # Each message is appended once, with its term counts, to the user's list
+        self.state_store = state_store or get_state_store("keyword", namespace, lists=["messages"])
+        # The sparse layout built from those records, per user and per process;
+        # a read only adds the records appended since (by any worker)
+        self.indexes = InMemoryStateStore()
+
+    def _new_index(self):
+        # Term counts are kept as a flat sparse layout: message i owns
+        # term_indices/term_counts[offsets[i]:offsets[i + 1]]
+        return {"lock": threading.Lock(), "messages": [], "vocabulary": {}, "df": [], "term_indices": [], "term_counts": [], "offsets": [0]}
 
     def add_message(self, user_id, message):
-        self.messages.append(message['content'])
-        self._update_importance_scores()
-
-    def _update_importance_scores(self):
-        if len(self.messages) > 1:
-            tfidf_matrix = self.vectorizer.fit_transform(self.messages)
-            self.importance_scores = np.mean(tfidf_matrix.toarray(), axis=1)
+        terms = {}
+        for term in self.analyzer(message['content']):
+            terms[term] = terms.get(term, 0) + 1
+        self.state_store.append(user_id, "messages", {"content": message['content'], "terms": terms})
+
+    def _load_index(self, user_id):
+        index = self.indexes.load(user_id, self._new_index)
+        with index["lock"]:
+            if self.state_store.length(user_id, "messages") < len(index["messages"]):
+                # The stored list was dropped (e.g. it expired), so start over
+                index.update({key: value for key, value in self._new_index().items() if key != "lock"})
+            for record in self.state_store.items(user_id, "messages", len(index["messages"])):
+                index["messages"].append(record["content"])
+                self._add_term_counts(index, record["terms"])
+        return index
+
+    def _add_term_counts(self, index, terms):
+        vocabulary, df = index["vocabulary"], index["df"]
+        for term, count in terms.items():
+            term_index = vocabulary.get(term)
+            if term_index is None:
+                term_index = vocabulary[term] = len(df)
+                df.append(0)
+            df[term_index] += 1
+            index["term_indices"].append(term_index)
+            index["term_counts"].append(count)
+        index["offsets"].append(len(index["term_indices"]))
+
+    def _importance_scores(self, state):
+        # Mean of each message's l2-normalized TF-IDF row, computed from the sparse
+        # counts without densifying; matches TfidfVectorizer(smooth_idf=True)
+        num_messages, vocabulary_size = len(state["messages"]), len(state["df"])
+        if num_messages <= 1 or vocabulary_size == 0:
+            return np.array([])
+
+        idf = np.log((1 + num_messages) / (1 + np.asarray(state["df"], dtype=np.float64))) + 1
+        weights = np.asarray(state["term_counts"], dtype=np.float64) * idf[np.asarray(state["term_indices"], dtype=np.int64)]
+
+        offsets = np.asarray(state["offsets"])
+        row_of_term = np.repeat(np.arange(num_messages), np.diff(offsets))
+        sums = np.bincount(row_of_term, weights=weights, minlength=num_messages)
+        norms = np.sqrt(np.bincount(row_of_term, weights=weights ** 2, minlength=num_messages))
+
+        scores = np.zeros(num_messages)
+        nonzero = norms > 0
+        scores[nonzero] = sums[nonzero] / norms[nonzero] / vocabulary_size
+        return scores
 
     def get_context(self, user_id, top_n=10):
-        if self.importance_scores.size == 0:
-            return self.messages
-        indices = np.argsort(self.importance_scores)[-top_n:]
-        return [self.messages[i] for i in indices]
+        index = self._load_index(user_id)
+        with index["lock"]:
+            importance_scores = self._importance_scores(index)
+            if importance_scores.size == 0:
+                return list(index["messages"])
+            if top_n < importance_scores.size:
+                # Select the top_n in linear time, then order them by ascending score
+                indices = np.argpartition(importance_scores, -top_n)[-top_n:]
+                indices = indices[np.argsort(importance_scores[indices], kind="stable")]
+            else:
+                indices = np.argsort(importance_scores, kind="stable")
+            return [index["messages"][i] for i in indices]
 
     def get_internal_state(self, user_id):
-        return {
-            "messages": self.messages,
-            "importance_scores": self.importance_scores.tolist() if self.importance_scores.size > 0 else []
-        }
+        index = self._load_index(user_id)
+        with index["lock"]:
+            return {
+                "messages": list(index["messages"]),
+                "importance_scores": self._importance_scores(index).tolist()
+            }
     
 # class TopicClusterer:
 #     def __init__(self, num_topics=5):
@@ -440,64 +623,173 @@ class KeywordExtractor:
     
 
 class TopicClusterer:
-    def __init__(self, max_tokens=4000, max_clusters=5):
+    def __init__(self, max_tokens=4000, max_clusters=5, incremental=True, resummarize_threshold=0.5, summary_window=50, namespace=None):
+        self.prefix = key_prefix(namespace)
         self.redis_client = get_redis_client()
         self.mongo_db = get_mongo_client()
-        self.collection = self.mongo_db['chat_history']
+        self.collection = self.mongo_db[collection_name(namespace)]
         self.max_tokens = max_tokens
         self.max_clusters = max_clusters
+        # sklearn is imported here so it only loads once this approach is used
+        from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
+        from sklearn.cluster import KMeans
         self.vectorizer = TfidfVectorizer(stop_words='english')
         self.kmeans = KMeans(n_clusters=self.max_clusters)
 
-        self.clear_all_redis_data()
-    def clear_all_redis_data(self):
-        print("Clearing Redis data")
-        try:
-            self.redis_client.flushdb()
-            print("Successfully cleared all data in the current Redis database.")
-        except Exception as e:
-            print(f"Error clearing Redis data: {e}")
-    
-    def add_message(self, user_id, message_dict):
-        messages_key = f"{user_id}:messages"
-        clusters_key = f"{user_id}:clusters"
+        # Incremental mode: stateless hashing features and a per-user streaming
+        # k-means; a cluster is re-summarized only once it has grown by more than
+        # resummarize_threshold since its last summary
+        self.incremental = incremental
+        self.resummarize_threshold = resummarize_threshold
+        self.summary_window = summary_window
+        self.hasher = HashingVectorizer(stop_words='english', alternate_sign=False, n_features=TOPIC_HASH_FEATURES)
+        # A user's model lives in one worker at a time: the holder of the
+        # {user}:topic:owner lease. Every worker queues new messages in the
+        # user's topic inbox and the owner drains it; a worker that takes the
+        # lease over, or whose model was evicted, refits from the topic lists
+        # already in Redis
+        self.models = InMemoryStateStore(max_users=TOPIC_MAX_MODELS)
+        self.owner_token = uuid.uuid4().hex
+        self._lease = self.redis_client.register_script(LEASE_SCRIPT)
 
-        # Add message to Redis
-        self.redis_client.rpush(messages_key, json.dumps(message_dict))
+    def add_message(self, user_id, message_dict):
+        messages_key = f"{self.prefix}{user_id}:messages"
 
-        # Retrieve all messages
-        messages = [json.loads(msg) for msg in self.redis_client.lrange(messages_key, 0, -1)]
+        # Add message to Redis, and to the clustering inbox in the same step
+        pipe = self.redis_client.pipeline()
+        pipe.rpush(messages_key, json.dumps(message_dict))
+        if self.incremental:
+            pipe.rpush(f"{self.prefix}{user_id}:topic:inbox", json.dumps(message_dict))
+        pipe.execute()
 
-        # Perform clustering
-        if len(messages) >= self.max_clusters:
-            self._cluster_messages(user_id, messages)
+        if self.incremental:
+            summary_queue.submit(user_id, self._update_clusters, user_id, coalesce=True)
+        # Recluster in the background once there are enough messages
+        elif self.redis_client.llen(messages_key) >= self.max_clusters:
+            summary_queue.submit(user_id, self._recluster, user_id, coalesce=True)
 
         # Manage token limit
         self._manage_token_limit(user_id)
 
     def get_context(self, user_id):
-        clusters_key = f"{user_id}:clusters"
-        messages_key = f"{user_id}:messages"
+        clusters_key = f"{self.prefix}{user_id}:clusters"
+        messages_key = f"{self.prefix}{user_id}:messages"
 
         clusters = self.redis_client.get(clusters_key)
         clusters = json.loads(clusters) if clusters else []
 
         recent_messages = [json.loads(msg) for msg in self.redis_client.lrange(messages_key, -5, -1)]
 
+        segments = [("cluster", cluster) for cluster in clusters] + [("message", msg) for msg in recent_messages]
+        return self._render_context(segments)
+
+    def _segment_text(self, segment):
+        kind, item = segment
+        if kind == "cluster":
+            return f"- {item['summary']}\n"
+        return f"{item['role']}: {item['content']}\n"
+
+    def _render_context(self, segments):
         context = "Topic summaries:\n"
-        for cluster in clusters:
-            context += f"- {cluster['summary']}\n"
+        for segment in segments:
+            if segment[0] == "cluster":
+                context += self._segment_text(segment)
 
         context += "\nRecent messages:\n"
-        for msg in recent_messages:
-            context += f"{msg['role']}: {msg['content']}\n"
+        for segment in segments:
+            if segment[0] == "message":
+                context += self._segment_text(segment)
 
         return context
 
+    def _new_model(self):
+        from sklearn.cluster import MiniBatchKMeans
+        return {
+            "kmeans": MiniBatchKMeans(n_clusters=self.max_clusters, random_state=0, n_init=1),
+            "seeded": False,
+            "fitted": False,
+            "pending": [],
+            "sizes": [0] * self.max_clusters,
+            "summarized_sizes": [0] * self.max_clusters,
+            "summaries": [None] * self.max_clusters
+        }
+
+    def _update_clusters(self, user_id):
+        lease = self._lease(keys=[f"{self.prefix}{user_id}:topic:owner"], args=[self.owner_token, int(TOPIC_OWNER_TTL * 1000)])
+        if not lease:
+            # Another worker owns this user's model and clusters the inbox
+            return
+        if lease == 2:
+            # Newly owned: a model this worker kept from an earlier lease may be stale
+            self.models.delete(user_id)
+        model = self.models.load(user_id, self._new_model)
+        topic_keys = [f"{self.prefix}{user_id}:topic:{label}" for label in range(self.max_clusters)]
+        inbox_key = f"{self.prefix}{user_id}:topic:inbox"
+        if not model["seeded"]:
+            # Refit on the messages already clustered, by any worker; their topic
+            # lists are replaced when the new labels are written
+            pipe = self.redis_client.pipeline()
+            for topic_key in topic_keys:
+                pipe.lrange(topic_key, 0, -1)
+            model["pending"] = [{"content": content} for topic in pipe.execute() for content in topic]
+            model["seeded"] = True
+
+        # The streaming model needs one sample per cluster before its first
+        # update; until then new messages wait in the inbox, not in this worker
+        if not model["fitted"] and len(model["pending"]) + self.redis_client.llen(inbox_key) < self.max_clusters:
+            return
+
+        # Taken and cleared in one step, so each message is clustered exactly once
+        pipe = self.redis_client.pipeline()
+        pipe.lrange(inbox_key, 0, -1)
+        pipe.delete(inbox_key)
+        inbox = pipe.execute()[0]
+        new_messages = model["pending"] + [json.loads(msg) for msg in inbox]
+        if not new_messages:
+            return
+
+        X = self.hasher.transform([msg['content'] for msg in new_messages])
+        model["kmeans"].partial_fit(X)
+        labels = model["kmeans"].predict(X)
+
+        pipe = self.redis_client.pipeline()
+        if not model["fitted"]:
+            pipe.delete(*topic_keys)
+        for msg, label in zip(new_messages, labels):
+            pipe.rpush(topic_keys[label], msg['content'])
+            model["sizes"][label] += 1
+        pipe.execute()
+        model["pending"] = []
+        model["fitted"] = True
+
+        for label in set(labels.tolist()):
+            summarized_size = model["summarized_sizes"][label]
+            if model["sizes"][label] - summarized_size > self.resummarize_threshold * summarized_size:
+                members = self.redis_client.lrange(f"{self.prefix}{user_id}:topic:{label}", -self.summary_window, -1)
+                model["summaries"][label] = summarize_chat_history(members)
+                model["summarized_sizes"][label] = model["sizes"][label]
+
+        summaries = [
+            {"summary": summary, "size": size}
+            for summary, size in zip(model["summaries"], model["sizes"])
+            if summary is not None
+        ]
+        self.redis_client.set(f"{self.prefix}{user_id}:clusters", json.dumps(summaries))
+        self._manage_token_limit(user_id)
+
+    def _recluster(self, user_id):
+        messages_key = f"{self.prefix}{user_id}:messages"
+        messages = [json.loads(msg) for msg in self.redis_client.lrange(messages_key, 0, -1)]
+        if len(messages) >= self.max_clusters:
+            self._cluster_messages(user_id, messages)
+            self._manage_token_limit(user_id)
+
     def _cluster_messages(self, user_id, messages):
+        from sklearn.base import clone
         texts = [msg['content'] for msg in messages]
-        X = self.vectorizer.fit_transform(texts)
-        labels = self.kmeans.fit_predict(X)
+        # Fit fresh copies since summary workers may cluster several users at once
+        X = clone(self.vectorizer).fit_transform(texts)
+        labels = clone(self.kmeans).fit_predict(X)
 
         clusters = [[] for _ in range(self.max_clusters)]
         for msg, label in zip(messages, labels):
@@ -509,89 +801,96 @@ class TopicClusterer:
                 summary = summarize_chat_history([msg['content'] for msg in cluster])
                 summaries.append({"summary": summary, "size": len(cluster)})
 
-        clusters_key = f"{user_id}:clusters"
+        clusters_key = f"{self.prefix}{user_id}:clusters"
         self.redis_client.set(clusters_key, json.dumps(summaries))
 
     def _manage_token_limit(self, user_id):
-        context = self.get_context(user_id)
-        while count_tokens(context) > self.max_tokens:
-            clusters_key = f"{user_id}:clusters"
-            messages_key = f"{user_id}:messages"
-
-            clusters = self.redis_client.get(clusters_key)
-            clusters = json.loads(clusters) if clusters else []
-
-            if clusters:
-                # Remove the smallest cluster
-                clusters.sort(key=lambda x: x['size'])
-                clusters.pop(0)
-                self.redis_client.set(clusters_key, json.dumps(clusters))
-            elif self.redis_client.llen(messages_key) > 0:
-                # If no clusters, remove oldest message
-                self.redis_client.lpop(messages_key)
-            else:
-                # If both clusters and messages are empty, break to avoid infinite loop
-                break
+        clusters_key = f"{self.prefix}{user_id}:clusters"
+        messages_key = f"{self.prefix}{user_id}:messages"
 
-            context = self.get_context(user_id)
+        clusters = self.redis_client.get(clusters_key)
+        clusters = json.loads(clusters) if clusters else []
+        recent_messages = [json.loads(msg) for msg in self.redis_client.lrange(messages_key, -5, -1)]
+
+        # Smallest clusters are dropped first, then the oldest visible messages
+        clusters.sort(key=lambda x: x['size'])
+        segments = [("cluster", cluster) for cluster in clusters] + [("message", msg) for msg in recent_messages]
+        _, dropped = pack_segments(segments, self.max_tokens, self._render_context, key=self._segment_text)
+
+        dropped_clusters = min(dropped, len(clusters))
+        dropped_messages = dropped - dropped_clusters
+        if dropped_clusters:
+            self.redis_client.set(clusters_key, json.dumps(clusters[dropped_clusters:]))
+        if dropped_messages:
+            self.redis_client.ltrim(messages_key, -(len(recent_messages) - dropped_messages), -1)
     
     def get_internal_state(self, user_id):
+        clusters = self.redis_client.get(f"{self.prefix}{user_id}:clusters")
         return {
-            "messages": self.messages,
-            "topics": self.topics.tolist() if len(self.topics) > 0 else []
+            "messages": [json.loads(msg) for msg in self.redis_client.lrange(f"{self.prefix}{user_id}:messages", 0, -1)],
+            "clusters": json.loads(clusters) if clusters else []
         }
     
 
 class SlidingWindowContext:
-    def __init__(self, window_size=20):
+    def __init__(self, window_size=20, state_store=None, namespace=None):
         self.window_size = window_size
-        self.messages = []
+        self.state_store = state_store or get_state_store(
+            f"sliding_window_{window_size}",
+            namespace,
+            encode=lambda window: [record.to_list() for record in window],
+            decode=lambda data: deque((MessageRecord(*item) for item in data), maxlen=self.window_size)
+        )
+
+    def _new_window(self):
+        # A bounded deque evicts the oldest message in O(1) once the window is full
+        return deque(maxlen=self.window_size)
 
     def add_message(self, user_id, message_dict):
-        self.messages.append(message_dict)
-        print(f"Length of messages: {len(self.messages)}")
-        if len(self.messages) > self.window_size:
-            self.messages.pop(0)
+        record = MessageRecord.from_dict(message_dict)
+        window = self.state_store.update(user_id, self._new_window, lambda window: window.append(record))
+        print(f"Length of messages: {len(window)}")
 
     def get_context(self, user_id):
-        return self.messages
+        return [record.to_dict() for record in self.state_store.load(user_id, self._new_window)]
     
     def get_internal_state(self, user_id):
         return {
-            "window": self.messages
+            "window": self.get_context(user_id)
         }
 
 class HybridStorage:
-    def __init__(self):
+    def __init__(self, namespace=None):
+        self.prefix = key_prefix(namespace)
         self.memory_cache = {}
         self.redis_client = get_redis_client()
         self.mongo_client = get_mongo_client()
+        self.collection = self.mongo_client[collection_name(namespace)]
+        self.writer = get_mongo_writer(collection_name(namespace))
 
     def add_message(self, user_id, message_dict):
         if user_id not in self.memory_cache:
-            self.memory_cache[user_id] = []
-        self.memory_cache[user_id].append(message_dict)
-        if len(self.memory_cache[user_id]) > 200:
-            self.memory_cache[user_id].pop(0)
+            self.memory_cache[user_id] = deque(maxlen=200)
+        self.memory_cache[user_id].append(MessageRecord.from_dict(message_dict))
 
         # Add to Redis (recent history)
-        self.redis_client.lpush(f"user:{user_id}:messages", json.dumps(message_dict))
-        self.redis_client.ltrim(f"user:{user_id}:messages", 0, 999)
+        self.redis_client.lpush(f"{self.prefix}user:{user_id}:messages", json.dumps(message_dict))
+        self.redis_client.ltrim(f"{self.prefix}user:{user_id}:messages", 0, 999)
 
         # Add to MongoDB (long-term storage)
-        self.mongo_client.chat_history.insert_one({"user_id": user_id, "message": message_dict})
+        self.writer.insert({"user_id": user_id, "message": message_dict})
 
     def get_context(self, user_id):
         context = {
-            "recent": self.memory_cache.get(user_id, []),
-            "mid_term": [json.loads(msg) for msg in self.redis_client.lrange(f"user:{user_id}:messages", 0, -1)],
-            "long_term": list(self.mongo_client.chat_history.find({"user_id": user_id}).sort("_id", -1).limit(1000))
+            "recent": [record.to_dict() for record in self.memory_cache.get(user_id, [])],
+            "mid_term": [json.loads(msg) for msg in self.redis_client.lrange(f"{self.prefix}user:{user_id}:messages", 0, -1)],
+            "long_term": list(self.collection.find({"user_id": user_id}, {"_id": 0, "message": 1}).sort("_id", -1).limit(1000).batch_size(MONGO_READ_BATCH_SIZE))
         }
         return context
     
     def get_internal_state(self, user_id):
         return {
-            "memory_cache": self.memory_cache.get(user_id, []),
-            "redis": [json.loads(msg) for msg in self.redis_client.lrange(f"user:{user_id}:messages", 0, -1)],
-            "mongodb": list(self.mongo_client.chat_history.find({"user_id": user_id}).sort("_id", -1).limit(1000))
+            "memory_cache": [record.to_dict() for record in self.memory_cache.get(user_id, [])],
+            "redis": [json.loads(msg) for msg in self.redis_client.lrange(f"{self.prefix}user:{user_id}:messages", 0, -1)],
+            "mongodb": list(self.collection.find({"user_id": user_id}, {"_id": 0, "message": 1}).sort("_id", -1).limit(1000).batch_size(MONGO_READ_BATCH_SIZE))
         }
\ No newline at end of file
@@ -1,23 +1,69 @@
-from utils.gemini_api import call_gemini
+from utils.llm import get_llm
 from utils.token_counter import count_tokens
 
+def _prompt(context, message_text):
+    return f"Context: {context}\n\nUser: {message_text}\n\nAssistant:"
+
+def _token_count(context_tokens, message_text, response_text):
+    # The context's count comes with it (cached per state version for the batch
+    # approach), so only the text around it is tokenized on each turn
+    return context_tokens + count_tokens(_prompt("", message_text) + response_text)
+
 def handle_user_message(chat_manager, user_id, message_text):
     # Add the user's message to the context
     chat_manager.handle_new_message(user_id, {"role": "user", "content": message_text})
 
     # Get the current context
-    context = chat_manager.get_context(user_id)
+    context, context_tokens = chat_manager.get_context_with_tokens(user_id)
 
     # Prepare the prompt for Gemini
-    prompt = f"Context: {context}\n\nUser: {message_text}\n\nAssistant:"
+    prompt = _prompt(context, message_text)
 
-    # Call Gemini API
-    response = call_gemini(prompt)
+    # Call the LLM
+    response = get_llm().complete(prompt)
 
     # Add the assistant's response to the context
     chat_manager.handle_new_message(user_id, {"role": "assistant", "content": response['content']})
 
     # Count tokens
-    token_count = count_tokens(prompt + response['content'])
+    token_count = _token_count(context_tokens, message_text, response['content'])
+
+    return response['content'], token_count
+
+async def ahandle_user_message(chat_manager, user_id, message_text):
+    await chat_manager.ahandle_new_message(user_id, {"role": "user", "content": message_text})
+
+    context, context_tokens = await chat_manager.aget_context_with_tokens(user_id)
+
+    prompt = _prompt(context, message_text)
+
+    # Await the LLM so other requests keep being served while it generates
+    response = await get_llm().acomplete(prompt)
+
+    await chat_manager.ahandle_new_message(user_id, {"role": "assistant", "content": response['content']})
+
+    token_count = _token_count(context_tokens, message_text, response['content'])
+
+    return response['content'], token_count
+
+async def astream_user_message(chat_manager, user_id, message_text):
+    # Yields {"type": "token"} events as the reply is generated, then a "done"
+    # event. The reply is stored only once the stream has completed, so a
+    # client that disconnects midway leaves no partial assistant message.
+    await chat_manager.ahandle_new_message(user_id, {"role": "user", "content": message_text})
+
+    context, context_tokens = await chat_manager.aget_context_with_tokens(user_id)
+
+    prompt = _prompt(context, message_text)
+
+    chunks = []
+    async for text in get_llm().astream(prompt):
+        chunks.append(text)
+        yield {"type": "token", "text": text}
+    response_text = "".join(chunks)
+
+    await chat_manager.ahandle_new_message(user_id, {"role": "assistant", "content": response_text})
+
+    token_count = _token_count(context_tokens, message_text, response_text)
 
-    return response['content'], token_count
\ No newline at end of file
+    yield {"type": "done", "response": response_text, "token_count": token_count}
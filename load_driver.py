@@ -0,0 +1,158 @@
+# load_driver.py
+#
+# Multi-user load against a running server's /chat endpoint, e.g.
+#   python load_driver.py --url http://127.0.0.1:8000 --users 50 --messages 200
+# Each simulated user sends its own seeded synthetic conversation, one message
+# at a time. Run the server with CHAT_NAMESPACE (and LLM_BACKEND=fake to keep
+# Gemini out of the numbers) so the load never lands in live history.
+#
+# --hot-user-threads N adds N threads that all write to one user at the same
+# time, then checks that user's stored history for lost or double-counted
+# messages and batches summarized more than once (batch_summary approach).
+#
+# --sweep 1 4 16 64 repeats the run once per level, with that many users (so
+# that many requests in flight) each time, and reports throughput per level.
+# With LLM_BACKEND=fake and a nonzero FAKE_LLM_DELAY_MS, every reply waits on
+# the model, so throughput should grow with the number of requests in flight.
+
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from utils.workload import SyntheticWorkload, latency_stats
+
+
+def post_json(url, payload, timeout):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def get_json(url, timeout):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def run_user(args, workload, user_index, latencies, errors, lock, user_id=None):
+    user_id = user_id or f"{args.user_prefix}_{user_index}"
+    for message in workload.for_user(user_index):
+        start = time.perf_counter()
+        try:
+            post_json(f"{args.url}/chat", {"user_id": user_id, "message_text": message["content"]}, args.timeout)
+        except (urllib.error.URLError, OSError) as e:
+            with lock:
+                errors.append(str(e))
+            continue
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+
+def run_load(args):
+    # Only user turns are sent; the server produces the replies
+    workload = SyntheticWorkload(
+        seed=args.seed,
+        messages=args.messages,
+        topic_drift=args.topic_drift,
+        mean_words=args.mean_words,
+        length_sigma=args.length_sigma,
+        user_share=1.0
+    )
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    threads = [threading.Thread(target=run_user, args=(args, workload, n, latencies, errors, lock)) for n in range(args.users)]
+    hot_user = f"{args.user_prefix}_hot"
+    hot_latencies = []
+    hot_errors = []
+    threads += [
+        threading.Thread(target=run_user, args=(args, workload, args.users + n, hot_latencies, hot_errors, lock, hot_user))
+        for n in range(args.hot_user_threads)
+    ]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies += hot_latencies
+    errors += hot_errors
+
+    report = {
+        "users": args.users,
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": latency_stats(latencies),
+        "first_errors": errors[:5]
+    }
+    if args.hot_user_threads:
+        report["hot_user"] = check_hot_user(args, hot_user, len(hot_latencies))
+    return report
+
+
+def run_sweep(args):
+    # Fresh users at every level, so later levels don't start with longer histories
+    levels = {}
+    for in_flight in args.sweep:
+        level_args = argparse.Namespace(**{**vars(args), "users": in_flight, "hot_user_threads": 0,
+                                           "user_prefix": f"{args.user_prefix}_sweep{in_flight}"})
+        report = run_load(level_args)
+        levels[in_flight] = {key: report[key] for key in ("requests", "errors", "requests_per_second", "latency_ms")}
+    return {"messages_per_user": args.messages, "in_flight": levels}
+
+
+def check_hot_user(args, user_id, requests):
+    # Every successful /chat stores the user message and the reply
+    time.sleep(1)  # Let the server's buffered Mongo writes flush
+    documents = get_json(f"{args.url}/mongodb_data/{urllib.parse.quote(user_id)}", args.timeout)
+    batch_counts = {}
+    summarized = []
+    for document in documents:
+        if document.get("Kind") == "summary":
+            summarized.append(document["BatchId"])
+        else:
+            batch_counts[document["BatchId"]] = batch_counts.get(document["BatchId"], 0) + 1
+
+    batches = sorted(batch_counts)
+    overfull = [batch for batch in batches if batch_counts[batch] > args.batch_size]
+    underfull = [batch for batch in batches[:-1] if batch_counts[batch] < args.batch_size]
+    duplicate_summaries = sorted({batch for batch in summarized if summarized.count(batch) > 1})
+    return {
+        "requests": requests,
+        "stored_messages": sum(batch_counts.values()),
+        "expected_messages": 2 * requests,
+        "batches": len(batches),
+        "overfull_batches": overfull,
+        "underfull_batches": underfull,
+        "duplicate_summaries": duplicate_summaries,
+        "consistent": sum(batch_counts.values()) == 2 * requests and not overfull and not underfull and not duplicate_summaries
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-user load driver for /chat")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=100, help="messages sent per user")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--topic-drift", type=float, default=0.05)
+    parser.add_argument("--mean-words", type=float, default=30)
+    parser.add_argument("--length-sigma", type=float, default=0.6)
+    parser.add_argument("--user-prefix", default="load")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--hot-user-threads", type=int, default=0, help="threads writing to one shared user")
+    parser.add_argument("--batch-size", type=int, default=20, help="batch size of the server's batch_summary approach")
+    parser.add_argument("--sweep", type=int, nargs="+", help="run once per number of requests in flight")
+    args = parser.parse_args()
+    args.url = args.url.rstrip("/")
+    print(json.dumps(run_sweep(args) if args.sweep else run_load(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
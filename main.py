@@ -1,14 +1,25 @@
 # main.py
-import os
-from fastapi import FastAPI, Request, File, UploadFile
-from fastapi.responses import HTMLResponse, JSONResponse
+import json
+from typing import Optional
+from fastapi import FastAPI, Request, Query
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from conversation_handler import handle_user_message
+from conversation_handler import ahandle_user_message, astream_user_message
 from chat_manager import ChatManager
 import logging
-from test_runner import run_test
+from test_runner import submit_test, start_test_stream, fail_test, get_test_job
+from summarization import summary_queue
+from utils.redis_client import ping_redis, get_redis_pool_stats, close_redis_pool, close_async_redis_pool
+from utils.mongo_client import ping_mongo, get_mongo_pool_stats, close_mongo_client
+from utils.mongo_writer import get_mongo_writer_stats, close_mongo_writers
+from utils.event_bus import event_bus
+from utils.llm import get_llm
+from utils.workload import SyntheticWorkload
+from utils.conversation_parser import ConversationParser
+from config import WARMUP_USERS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,6 +35,29 @@ templates = Jinja2Templates(directory="templates")
 # Initialize ChatManager
 chat_manager = ChatManager()
 
+@app.on_event("startup")
+async def startup_event():
+    if not await run_in_threadpool(ping_redis):
+        logger.warning("Redis health check failed at startup")
+    if not await run_in_threadpool(ping_mongo):
+        logger.warning("MongoDB health check failed at startup")
+    else:
+        await run_in_threadpool(chat_manager.ensure_indexes)
+    if WARMUP_USERS:
+        await run_in_threadpool(chat_manager.warm_up, WARMUP_USERS)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Let in-flight summaries finish so closed batches are not left unsummarized
+    await run_in_threadpool(summary_queue.shutdown, True)
+    await run_in_threadpool(chat_manager.close)
+    # Write out buffered history before the Mongo client goes away
+    await run_in_threadpool(close_mongo_writers)
+    await event_bus.close()
+    close_redis_pool()
+    await close_async_redis_pool()
+    close_mongo_client()
+
 class Message(BaseModel):
     user_id: str
     message_text: str
@@ -31,6 +65,15 @@ class Message(BaseModel):
 class ApproachChange(BaseModel):
     approach: str
 
+class Workload(BaseModel):
+    seed: int = 0
+    users: int = 1
+    messages: int = 10000
+    topic_drift: float = 0.05
+    mean_words: float = 30
+    length_sigma: float = 0.6
+    user_share: float = 0.5
+
 @app.get("/test")
 async def test_route():
     return {"message": "Test route is working"}
@@ -41,25 +84,52 @@ async def test_route():
 #     return {"message": "Test completed"}
 
 @app.post("/run_test")
-async def run_test_endpoint(file: UploadFile = File(...)):
-    logger.info(f"Received file: {file.filename}")
+async def run_test_endpoint(request: Request):
+    # The body is the raw JSON or NDJSON conversation. It is parsed as it
+    # arrives and replay starts with the first messages; nothing touches disk.
+    job_id, run = await run_in_threadpool(start_test_stream)
+    logger.info(f"Started test run {job_id}")
+    parser = ConversationParser()
     try:
-        contents = await file.read()
-        temp_file_path = f"temp_{file.filename}"
-        with open(temp_file_path, "wb") as f:
-            f.write(contents)
-        
-        logger.info(f"Starting test run for file: {temp_file_path}")
-        results = run_test(temp_file_path)
-        logger.info("Test run completed successfully")
-        
-        os.remove(temp_file_path)  # Clean up the temporary file
-        logger.info(f"Temporary file removed: {temp_file_path}")
-        
-        return JSONResponse(content=results)
+        async for chunk in request.stream():
+            messages = parser.feed(chunk)
+            if messages:
+                # Blocks while the benchmark processes catch up
+                await run_in_threadpool(run.send, messages)
+        await run_in_threadpool(run.send, parser.close())
+        run.close()
     except Exception as e:
         logger.error(f"Error during test run: {str(e)}")
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+        fail_test(job_id, str(e))
+        run.abort()
+        status_code = 400 if isinstance(e, ValueError) else 500
+        return JSONResponse(content={"error": str(e), "job_id": job_id}, status_code=status_code)
+
+    # The benchmark finishes in the background; poll /run_test/{job_id} for results
+    logger.info(f"Test run {job_id} received {parser.count} messages")
+    return JSONResponse(content={"job_id": job_id, "status_url": f"/run_test/{job_id}", "messages": parser.count}, status_code=202)
+
+@app.post("/run_test/synthetic")
+async def run_synthetic_test(workload: Workload):
+    # Benchmark workers generate the messages themselves; nothing is uploaded
+    conversation = SyntheticWorkload(
+        seed=workload.seed,
+        messages=workload.messages,
+        topic_drift=workload.topic_drift,
+        mean_words=workload.mean_words,
+        length_sigma=workload.length_sigma,
+        user_share=workload.user_share
+    )
+    job_id = submit_test(conversation, users=workload.users)
+    logger.info(f"Started synthetic test run {job_id}: {workload.users} users x {workload.messages} messages")
+    return JSONResponse(content={"job_id": job_id, "status_url": f"/run_test/{job_id}"}, status_code=202)
+
+@app.get("/run_test/{job_id}")
+async def run_test_status(job_id: str):
+    job = get_test_job(job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Unknown test run"}, status_code=404)
+    return job
 
 @app.get("/test_page")
 async def test_page(request: Request):
@@ -67,16 +137,26 @@ async def test_page(request: Request):
 
 @app.post("/chat")
 async def chat_endpoint(message: Message):
-    response_text, token_count = handle_user_message(chat_manager, message.user_id, message.message_text)
+    response_text, token_count = await ahandle_user_message(chat_manager, message.user_id, message.message_text)
     return {"response": response_text, "token_count": token_count}
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(message: Message):
+    # Server-sent events: "token" events relay the reply as it is generated,
+    # then a "done" event carries the full response and token count
+    async def event_stream():
+        async for event in astream_user_message(chat_manager, message.user_id, message.message_text):
+            yield f"data: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.post("/change_approach")
-async def change_approach(approach_change: ApproachChange):
+def change_approach(approach_change: ApproachChange):
     chat_manager.set_approach(approach_change.approach)
     return {"status": "success", "new_approach": approach_change.approach}
 
 @app.get("/internal_state/{user_id}")
-async def get_internal_state(user_id: str):
+def get_internal_state(user_id: str):
     logger.info(f"Accessing internal state for user: {user_id}")
     try:
         internal_state = chat_manager.get_internal_state(user_id)
@@ -86,15 +166,65 @@ async def get_internal_state(user_id: str):
         logger.error(f"Error retrieving internal state: {str(e)}")
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+def _conditional_response(request, version, build):
+    # The UI polls these after every message; with no-cache the browser revalidates
+    # with If-None-Match and gets a 304 without a body when nothing changed
+    etag = f'"{version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return build(headers)
+
 @app.get("/redis_data/{user_id}")
-async def get_redis_data(user_id: str):
-    redis_data = chat_manager.get_redis_data(user_id)
-    return JSONResponse(content=redis_data)
+def get_redis_data(user_id: str, request: Request, limit: Optional[int] = Query(None, ge=1)):
+    version = chat_manager.get_redis_version(user_id)
+    return _conditional_response(request, version, lambda headers: JSONResponse(
+        content=chat_manager.get_redis_data(user_id, limit), headers=headers))
 
 @app.get("/mongodb_data/{user_id}")
-async def get_mongodb_data(user_id: str):
-    mongodb_data = chat_manager.get_mongodb_data(user_id)
-    return JSONResponse(content=mongodb_data)
+def get_mongodb_data(user_id: str, request: Request, after: Optional[str] = None,
+                     limit: Optional[int] = Query(None, ge=1), format: str = "json"):
+    try:
+        version = chat_manager.get_mongodb_version(user_id, after)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    if format == "ndjson":
+        # One document per line, written as the cursor returns batches
+        return _conditional_response(request, version, lambda headers: StreamingResponse(
+            (json.dumps(doc) + "\n" for doc in chat_manager.iter_mongodb_data(user_id, after, limit)),
+            media_type="application/x-ndjson", headers=headers))
+    return _conditional_response(request, version, lambda headers: JSONResponse(
+        content=chat_manager.get_mongodb_data(user_id, after, limit), headers=headers))
+
+@app.get("/events/{user_id}")
+async def stream_events(user_id: str, request: Request):
+    # Server-sent events: one JSON state delta per message, summary, batch
+    # rollover or trim, so the UI no longer re-reads the history after each chat
+    async def event_stream():
+        async for event in event_bus.listen(chat_manager.events_channel(user_id)):
+            if await request.is_disconnected():
+                break
+            # A comment line on idle keeps proxies from closing the stream
+            yield f"data: {event}\n\n" if event is not None else ": keepalive\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/health")
+def health_check():
+    redis_ok = ping_redis()
+    mongo_ok = ping_mongo()
+    status_code = 200 if redis_ok and mongo_ok else 503
+    return JSONResponse(content={"redis": redis_ok, "mongodb": mongo_ok}, status_code=status_code)
+
+@app.get("/metrics")
+async def get_metrics():
+    return {
+        "summary_queue": summary_queue.stats(),
+        "redis_pool": get_redis_pool_stats(),
+        "mongo_pool": get_mongo_pool_stats(),
+        "mongo_writers": get_mongo_writer_stats(),
+        "llm": get_llm().stats()
+    }
 
 @app.get("/", response_class=HTMLResponse)
 async def get(request: Request):
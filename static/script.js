@@ -31,6 +31,7 @@ function addMessage(role, content) {
     messageDiv.textContent = `${role.charAt(0).toUpperCase() + role.slice(1)}: ${content}`;
     chatWindow.appendChild(messageDiv);
     chatWindow.scrollTop = chatWindow.scrollHeight;
+    return messageDiv;
 }
 
 async function sendMessage() {
@@ -41,7 +42,7 @@ async function sendMessage() {
     addMessage('user', messageText);
     userInput.value = '';
 
-    const response = await fetch('/chat', {
+    const response = await fetch('/chat/stream', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
@@ -49,28 +50,106 @@ async function sendMessage() {
         body: JSON.stringify({ user_id: userId, message_text: messageText }),
     });
 
-    const data = await response.json();
-    addMessage('assistant', data.response);
+    // Show the reply as it is generated; the stream ends with a "done" event
+    const chatWindow = document.getElementById('chat-window');
+    const messageDiv = addMessage('assistant', '');
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    let data = null;
+    while (data === null) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += value;
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const event of events) {
+            if (!event.startsWith('data: ')) continue;
+            const payload = JSON.parse(event.slice(6));
+            if (payload.type === 'token') {
+                messageDiv.textContent += payload.text;
+                chatWindow.scrollTop = chatWindow.scrollHeight;
+            } else if (payload.type === 'done') {
+                data = payload;
+            }
+        }
+    }
+    if (data === null) return;
 
     totalTokenCount += data.token_count;
     document.getElementById('token-count').textContent = `Total Tokens Used: ${totalTokenCount}`;
+    // Redis and MongoDB panels are updated by the event stream below
+}
+
+// Only the newest entries are shown; the endpoints send ETags, so the browser
+// revalidates these polls and unchanged data comes back as an empty 304
+const redisStackLimit = 50;
+const mongodbPageSize = 200;
+const mongodbDisplayLimit = 200;
+let redisData = null;
+let mongodbDocs = [];
+let mongodbAfter = '';
+
+function renderData() {
+    document.getElementById('redis-data').textContent = JSON.stringify(redisData, null, 2);
+    document.getElementById('mongodb-data').textContent = JSON.stringify(mongodbDocs, null, 2);
+}
 
-    // Fetch and display Redis and MongoDB data
-    fetchData();
+// Documents pushed as events have no Cursor yet; the next fetch replaces them
+// with the stored copies, paging on from the last Cursor the server returned
+function addMongodbDoc(doc) {
+    mongodbDocs = mongodbDocs.concat([doc]).slice(-mongodbDisplayLimit);
 }
 
 async function fetchData() {
     // Fetch Redis data
-    const redisResponse = await fetch(`/redis_data/${userId}`);
-    const redisData = await redisResponse.json();
-    document.getElementById('redis-data').textContent = JSON.stringify(redisData, null, 2);
+    const redisResponse = await fetch(`/redis_data/${userId}?limit=${redisStackLimit}`);
+    redisData = await redisResponse.json();
+
+    // Fetch MongoDB documents added since the last poll, one page at a time
+    mongodbDocs = mongodbDocs.filter(doc => doc.Cursor);
+    while (true) {
+        const params = new URLSearchParams({ after: mongodbAfter, limit: mongodbPageSize });
+        const mongodbResponse = await fetch(`/mongodb_data/${userId}?${params}`);
+        const page = await mongodbResponse.json();
+        if (page.length === 0) break;
+        mongodbDocs = mongodbDocs.concat(page).slice(-mongodbDisplayLimit);
+        mongodbAfter = page[page.length - 1].Cursor;
+        if (page.length < mongodbPageSize) break;
+    }
+    renderData();
+}
 
-    // Fetch MongoDB data
-    const mongodbResponse = await fetch(`/mongodb_data/${userId}`);
-    const mongodbData = await mongodbResponse.json();
-    document.getElementById('mongodb-data').textContent = JSON.stringify(mongodbData, null, 2);
+// Apply a state delta pushed by the server to both panels
+function applyEvent(event) {
+    if (event.type === 'resync' || redisData === null) {
+        fetchData();
+        return;
+    }
+    if (event.type === 'message') {
+        const message = event.message;
+        redisData.stack = redisData.stack.concat([message]).slice(-redisStackLimit);
+        redisData.stack_size += 1;
+        addMongodbDoc({ Timestamp: message.timestamp, Content: message.content, BatchId: message.batch_id });
+    } else if (event.type === 'batch') {
+        redisData.batch_id = String(event.batch_id);
+    } else if (event.type === 'summary' || event.type === 'trim') {
+        // Entries leave from the head of the stack; the shown tail may lose some of them
+        const hidden = redisData.stack_size - redisData.stack.length;
+        redisData.stack = redisData.stack.slice(Math.max(event.removed - hidden, 0));
+        redisData.stack_size -= event.removed;
+        if (event.type === 'summary') {
+            redisData.summary = (redisData.summary || []).concat([event.summary]);
+            addMongodbDoc({ Timestamp: event.timestamp, Kind: 'summary', Content: event.summary.content, BatchId: event.summary.batch_id, Count: event.summary.count });
+        }
+    }
+    renderData();
 }
 
+const events = new EventSource(`/events/${userId}`);
+events.onmessage = (e) => applyEvent(JSON.parse(e.data));
+// (Re)load a snapshot whenever the stream (re)connects, since events sent while disconnected are lost
+events.onopen = () => fetchData();
+
 
 
 // async function fetchData() {
@@ -99,5 +178,4 @@ async function fetchData() {
 //     }
 // }
 
-// Fetch data initially when the page loads
-fetchData();
\ No newline at end of file
+// The initial snapshot is loaded when the event stream opens
\ No newline at end of file
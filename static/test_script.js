@@ -6,21 +6,70 @@ document.getElementById('runTest').addEventListener('click', async () => {
         return;
     }
 
-    const formData = new FormData();
-    formData.append('file', file);
-
+    setStatus('Uploading...');
     try {
+        // Sent as the raw body so the server can replay it while it uploads
         const response = await fetch('/run_test', {
             method: 'POST',
-            body: formData
+            headers: { 'Content-Type': 'application/x-ndjson' },
+            body: file
         });
-        const data = await response.json();
-        displayResults(data);
+        const job = await response.json();
+        if (!response.ok) {
+            setStatus(`Error: ${job.error}`);
+            return;
+        }
+        pollJob(job.status_url);
     } catch (error) {
         console.error('Error:', error);
     }
 });
 
+function setStatus(text) {
+    document.getElementById('testStatus').textContent = text;
+}
+
+// The benchmark runs as a background job; poll until every approach is done
+async function pollJob(statusUrl) {
+    const response = await fetch(statusUrl);
+    const job = await response.json();
+    setStatus(`${job.status}: ${job.completed}/${job.approaches.length} approaches`);
+    if (job.status === 'failed') {
+        setStatus(`Failed: ${job.error}`);
+        return;
+    }
+    if (job.status !== 'done') {
+        setTimeout(() => pollJob(statusUrl), 1000);
+        return;
+    }
+    const tokens = Object.fromEntries(Object.entries(job.results).map(([approach, result]) => [approach, result.tokens || []]));
+    displayResults(tokens);
+    displayMetrics(job.results);
+}
+
+function displayMetrics(results) {
+    const tbody = document.querySelector('#metricsTable tbody');
+    tbody.innerHTML = '';
+    for (const [approach, result] of Object.entries(results)) {
+        const row = document.createElement('tr');
+        const cells = [
+            approach,
+            result.total_prompt_tokens,
+            result.add_message_ms?.p50, result.add_message_ms?.p95, result.add_message_ms?.p99,
+            result.get_context_ms?.p50, result.get_context_ms?.p95, result.get_context_ms?.p99,
+            result.llm_calls,
+            result.peak_memory_mb,
+            result.error || ''
+        ];
+        for (const value of cells) {
+            const cell = document.createElement('td');
+            cell.textContent = value ?? '';
+            row.appendChild(cell);
+        }
+        tbody.appendChild(row);
+    }
+}
+
 function displayResults(data) {
     const ctx = document.getElementById('resultChart').getContext('2d');
     
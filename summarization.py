@@ -1,4 +1,12 @@
-from utils.gemini_api import call_gemini
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from utils.llm import get_llm
+from config import SUMMARY_WORKERS, SUMMARY_MAX_RETRIES, SUMMARY_RETRY_BACKOFF_MS
+
+logger = logging.getLogger(__name__)
 
 def summarize_chat_history(messages):
     summarize_prompt = """
@@ -18,6 +26,122 @@ def summarize_chat_history(messages):
     summary = " ".join([str(msg) for msg in messages])
     # Generate the prompt for summarization
     prompt = summarize_prompt.format(conversation=summary)
-    # Call the Gemini model to generate the summary
-    response = call_gemini(prompt, temperature=0.7)
-    return response['content']
\ No newline at end of file
+    # Call the configured LLM to generate the summary
+    response = get_llm().complete(prompt, temperature=0.7)
+    return response['content']
+
+
+# Runs summarization jobs on a worker pool so add_message never waits on the LLM.
+# Jobs for the same user run one at a time in submission order, so summaries are
+# spliced in the order their batches were closed; different users run in parallel.
+# A failed job (e.g. an LLM 5xx or rate limit) stays at the head of its user's
+# queue and is retried up to max_retries times, backing off exponentially from
+# retry_backoff_ms without holding a worker. With max_workers=0 jobs run inline.
+class SummaryQueue:
+
+    def __init__(self, max_workers=SUMMARY_WORKERS, max_retries=SUMMARY_MAX_RETRIES, retry_backoff_ms=SUMMARY_RETRY_BACKOFF_MS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summary") if max_workers > 0 else None
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff_ms / 1000
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.pending = {}  # user_id -> deque of (fn, args, enqueued_at, attempts); head is the running job
+        self.depth = 0
+        self.completed = 0
+        self.retries = 0
+        self.failed = 0  # Jobs that still failed after every retry
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+
+    def submit(self, user_id, fn, *args, coalesce=False):
+        if self.executor is None:
+            fn(*args)
+            return
+
+        with self.lock:
+            jobs = self.pending.get(user_id)
+            if jobs is not None:
+                # Skip identical jobs that are still waiting to start
+                if coalesce and any(job[0] == fn and job[1] == args for job in list(jobs)[1:]):
+                    return
+                jobs.append((fn, args, time.monotonic(), 0))
+                self.depth += 1
+                return
+            self.pending[user_id] = deque([(fn, args, time.monotonic(), 0)])
+            self.depth += 1
+
+        self.executor.submit(self._drain, user_id)
+
+    def _drain(self, user_id):
+        while True:
+            with self.lock:
+                jobs = self.pending[user_id]
+                if not jobs:
+                    del self.pending[user_id]
+                    return
+                fn, args, enqueued_at, attempts = jobs[0]
+
+            error = None
+            try:
+                fn(*args)
+            except Exception as e:
+                error = e
+
+            if error is not None and attempts < self.max_retries:
+                delay = self.retry_backoff * 2 ** attempts
+                logger.warning(f"Summarization job failed for user {user_id}, retrying in {delay:.1f}s: {error}")
+                with self.lock:
+                    jobs[0] = (fn, args, enqueued_at, attempts + 1)
+                    self.retries += 1
+                # The user's later jobs wait behind this one until the retry has run
+                timer = threading.Timer(delay, self._resume, args=(user_id,))
+                timer.daemon = True
+                timer.start()
+                return
+
+            if error is not None:
+                logger.error(f"Summarization job failed for user {user_id} after {attempts + 1} attempts: {error}")
+            with self.lock:
+                jobs.popleft()
+                lag = time.monotonic() - enqueued_at
+                self.depth -= 1
+                if error is not None:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                self.total_lag += lag
+                self.idle.notify_all()
+
+    def _resume(self, user_id):
+        try:
+            self.executor.submit(self._drain, user_id)
+        except RuntimeError:
+            logger.error(f"Summary queue shut down before a retry for user {user_id}")
+
+    def wait_until_idle(self, timeout=None):
+        with self.idle:
+            return self.idle.wait_for(lambda: self.depth == 0, timeout=timeout)
+
+    def stats(self):
+        with self.lock:
+            finished = self.completed + self.failed
+            return {
+                "queue_depth": self.depth,
+                "active_users": len(self.pending),
+                "completed": self.completed,
+                "retries": self.retries,
+                "failed": self.failed,
+                "last_lag_seconds": self.last_lag,
+                "max_lag_seconds": self.max_lag,
+                "avg_lag_seconds": self.total_lag / finished if finished else 0.0
+            }
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+
+
+summary_queue = SummaryQueue()
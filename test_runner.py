@@ -1,19 +1,32 @@
-import importlib.util
+import multiprocessing
+import queue
 import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from chat_manager import ChatManager
 from utils.token_counter import count_tokens
+from utils.llm import create_llm, get_llm, set_llm
+from utils.mongo_writer import close_mongo_writers
+from utils.workload import SyntheticWorkload, latency_stats
+from utils.conversation_parser import iter_conversation_file
+from utils.namespace import reset_namespace
+from summarization import summary_queue
+from config import TEST_NAMESPACE, BENCHMARK_LLM_BACKEND, BENCHMARK_QUEUE_SIZE
 import logging
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
 logger = logging.getLogger(__name__)
 
 def load_conversation(file_path):
+    # JSON array or NDJSON, read in chunks; yields messages as they are parsed
     logger.info(f"Loading conversation from file: {file_path}")
-    spec = importlib.util.spec_from_file_location("sample_conversation", file_path)
-    module = importlib.util.module_from_spec(spec)
-    sys.modules["sample_conversation"] = module
-    spec.loader.exec_module(module)
-    logger.info(f"Loaded conversation with {len(module.conversation)} messages")
-    return module.conversation
+    return iter_conversation_file(file_path)
 
 # def run_test(file_path):
 #     conversation = load_conversation(file_path)
@@ -45,37 +58,272 @@ def load_conversation(file_path):
 
 
 
-def run_test(file_path):
-    conversation = load_conversation(file_path)
-    chat_manager = ChatManager()
-    approaches = chat_manager.approaches.keys()
-    results = {approach: [] for approach in approaches}
-
-    for approach in approaches:
-        logger.info(f"Running test for approach: {approach}")
-        chat_manager.set_approach(approach)
-        cumulative_tokens = 0
-        try:
-            for i, message in enumerate(conversation):
-                user_id = f"user_{approach}"
+def _peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _init_worker(llm_backend):
+    logging.basicConfig(level=logging.WARNING)
+    set_llm(create_llm(llm_backend))
+
+def _user_streams(conversation, users):
+    # A synthetic workload gives every user their own conversation; anything
+    # else is a single user's, possibly streamed, conversation
+    if isinstance(conversation, SyntheticWorkload):
+        return [conversation.for_user(n) for n in range(users)]
+    return [iter(conversation)]
+
+def replay_approach(approach, conversation, users=1, namespace=TEST_NAMESPACE):
+    # Runs in its own process and namespace, so approaches can't see each
+    # other's keys and peak memory belongs to this approach alone. With several
+    # users their messages are interleaved; the token series follows user 0.
+    started = time.perf_counter()
+    chat_manager = ChatManager(namespace=f"{namespace}-{approach}")
+    chat_manager.reset()
+    chat_manager.set_approach(approach)
+    llm_calls_before = get_llm().calls
+    memory_before = _peak_memory_mb()
+
+    streams = list(enumerate(_user_streams(conversation, users)))
+    positions = [0] * users
+    tokens = []
+    add_times = []
+    context_times = []
+    try:
+        while streams:
+            for n, stream in list(streams):
+                message = next(stream, None)
+                if message is None:
+                    streams.remove((n, stream))
+                    continue
+                positions[n] += 1
+                user_id = f"user_{approach}_{n}" if users > 1 else f"user_{approach}"
+
                 if message['role'] == 'user':
+                    # Summaries run in the background; wait so the replay is deterministic
+                    summary_queue.wait_until_idle()
+                    start = time.perf_counter()
                     context = chat_manager.get_context(user_id)
-                    
-                    # All approaches now return a string context
-                    context_str = str(context)
-                    
-                    prompt = f"Context: {context_str}\n\nUser: {message['content']}\n\nAssistant:"
-                    print(f"{i}: {prompt}")
-                    tokens = count_tokens(prompt)
-                    # cumulative_tokens += tokens
-                    cumulative_tokens = tokens
-                    results[approach].append((i + 1, cumulative_tokens))
-                    logger.info(f"Approach: {approach}, Message: {i+1}, Cumulative Tokens: {cumulative_tokens}")
+                    context_times.append(time.perf_counter() - start)
+
+                    if n == 0:
+                        prompt = f"Context: {context}\n\nUser: {message['content']}\n\nAssistant:"
+                        tokens.append((positions[n], count_tokens(prompt)))
+
+                start = time.perf_counter()
                 chat_manager.handle_new_message(user_id, message)
-        except Exception as e:
-            logger.error(f"Error in approach {approach}: {str(e)}")
-            results[approach] = [(-1, -1)]  # Indicate error for this approach
+                add_times.append(time.perf_counter() - start)
+        summary_queue.wait_until_idle()
+        error = None
+    except Exception as e:
+        logger.error(f"Error in approach {approach}: {str(e)}")
+        tokens = [(-1, -1)]  # Indicate error for this approach
+        error = str(e)
+    finally:
+        chat_manager.close()
+        # Pool workers exit without running atexit, so write out buffered history here
+        close_mongo_writers()
+        # Each run has its own namespaces; nothing reads them once the results are in
+        reset_namespace(chat_manager.namespace)
+
+    return approach, {
+        "tokens": tokens,
+        "users": users,
+        "messages": sum(positions),
+        "total_prompt_tokens": sum(count for _, count in tokens if count > 0),
+        "add_message_ms": latency_stats(add_times),
+        "get_context_ms": latency_stats(context_times),
+        "llm_calls": get_llm().calls - llm_calls_before,
+        "baseline_memory_mb": memory_before,
+        "peak_memory_mb": _peak_memory_mb(),
+        "seconds": round(time.perf_counter() - started, 3),
+        "error": error
+    }
+
+def _approach_names():
+    # No approach is loaded just to list them
+    return list(ChatManager(namespace=TEST_NAMESPACE).approaches)
+
+def _queued_messages(feed):
+    while True:
+        batch = feed.get()
+        if batch is None:
+            return
+        yield from batch
+
+def _replay_worker(approach, workload, users, llm_backend, feed, results, namespace):
+    _init_worker(llm_backend)
+    conversation = workload if workload is not None else _queued_messages(feed)
+    try:
+        results.put(replay_approach(approach, conversation, users, namespace))
+    except Exception as e:
+        logger.error(f"Benchmark worker for {approach} failed: {str(e)}")
+        results.put((approach, {"tokens": [(-1, -1)], "error": str(e)}))
+
+
+class BenchmarkRun:
+    # One process per approach, each in its own namespace under the run's, so
+    # concurrent runs never reset each other's data. spawn, not fork: the
+    # parent has Redis, Mongo and summary threads running, and each process's
+    # peak memory then covers a single approach. A SyntheticWorkload is
+    # generated inside the workers; any other conversation is sent in batches
+    # through bounded queues, so the slowest approach throttles the sender and
+    # no process ever holds the whole conversation.
+    def __init__(self, approaches, workload=None, users=1, llm_backend=BENCHMARK_LLM_BACKEND, queue_size=BENCHMARK_QUEUE_SIZE, namespace=TEST_NAMESPACE):
+        if users > 1 and workload is None:
+            raise ValueError("Replaying several users needs a SyntheticWorkload")
+        context = multiprocessing.get_context("spawn")
+        self.results = context.Queue()
+        self.workers = {}
+        for approach in approaches:
+            feed = None if workload is not None else context.Queue(queue_size)
+            process = context.Process(
+                target=_replay_worker,
+                args=(approach, workload, users, llm_backend, feed, self.results, namespace),
+                name=f"benchmark-{approach}",
+                daemon=True
+            )
+            process.start()
+            self.workers[approach] = (process, feed)
+
+    def send(self, messages):
+        if not messages:
+            return
+        for process, feed in self.workers.values():
+            while process.is_alive():
+                try:
+                    feed.put(messages, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+
+    def close(self):
+        for process, feed in self.workers.values():
+            if feed is not None and process.is_alive():
+                feed.put(None)
+
+    def abort(self):
+        for process, _ in self.workers.values():
+            process.terminate()
+
+    def iter_results(self):
+        pending = set(self.workers)
+        while pending:
+            try:
+                approach, result = self.results.get(timeout=1)
+            except queue.Empty:
+                # A worker that died without reporting gets an error result
+                for approach in list(pending):
+                    process = self.workers[approach][0]
+                    if not process.is_alive() and self.results.empty():
+                        pending.discard(approach)
+                        yield approach, {"tokens": [(-1, -1)], "error": f"Worker exited with code {process.exitcode}"}
+                continue
+            pending.discard(approach)
+            yield approach, result
+        for process, _ in self.workers.values():
+            process.join()
 
+
+def run_benchmark(conversation, approaches=None, users=1, llm_backend=BENCHMARK_LLM_BACKEND, on_result=None, batch_size=256, namespace=TEST_NAMESPACE):
+    approaches = list(approaches or _approach_names())
+    workload = conversation if isinstance(conversation, SyntheticWorkload) else None
+    run = BenchmarkRun(approaches, workload, users, llm_backend, namespace=namespace)
+    try:
+        if workload is None:
+            batch = []
+            for message in conversation:
+                batch.append(message)
+                if len(batch) == batch_size:
+                    run.send(batch)
+                    batch = []
+            run.send(batch)
+            run.close()
+    except BaseException:
+        run.abort()
+        raise
+    return _collect(run, on_result)
+
+def _collect(run, on_result=None):
+    results = {}
+    for approach, result in run.iter_results():
+        logger.info(f"Benchmark finished for approach: {approach}")
+        results[approach] = result
+        if on_result is not None:
+            on_result(approach, result)
+    return results
+
+def run_test(file_path):
+    conversation = load_conversation(file_path)
+    results = run_benchmark(conversation)
     logger.info("Test completed for all approaches")
     return results
 
+
+# Synthetic /run_test jobs run here, one at a time, while the request returns straight away
+_test_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="benchmark")
+_test_jobs = {}
+_test_jobs_lock = threading.Lock()
+
+def _job_namespace(job_id):
+    return f"{TEST_NAMESPACE}-{job_id}"
+
+def _new_job(approaches):
+    job_id = uuid.uuid4().hex
+    job = {"status": "queued", "approaches": approaches, "completed": 0, "results": {}, "error": None}
+    with _test_jobs_lock:
+        _test_jobs[job_id] = job
+
+    def on_result(approach, result):
+        with _test_jobs_lock:
+            job["results"][approach] = result
+            job["completed"] += 1
+
+    return job_id, job, on_result
+
+def submit_test(conversation, users=1):
+    approaches = _approach_names()
+    job_id, job, on_result = _new_job(approaches)
+
+    def run():
+        job["status"] = "running"
+        try:
+            run_benchmark(conversation, approaches, users=users, on_result=on_result, namespace=_job_namespace(job_id))
+            job["status"] = "done"
+        except Exception as e:
+            logger.error(f"Benchmark job {job_id} failed: {str(e)}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+
+    _test_executor.submit(run)
+    return job_id
+
+def start_test_stream():
+    # For uploads: the workers start now and replay messages as the caller
+    # send()s them; close() the run once the upload is complete, or abort() it
+    approaches = _approach_names()
+    job_id, job, on_result = _new_job(approaches)
+    run = BenchmarkRun(approaches, namespace=_job_namespace(job_id))
+    job["status"] = "running"
+
+    def collect():
+        _collect(run, on_result)
+        if job["status"] == "running":
+            job["status"] = "done"
+
+    threading.Thread(target=collect, name=f"benchmark-{job_id}", daemon=True).start()
+    return job_id, run
+
+def fail_test(job_id, error):
+    with _test_jobs_lock:
+        job = _test_jobs[job_id]
+        job["status"] = "failed"
+        job["error"] = error
+
+def get_test_job(job_id):
+    with _test_jobs_lock:
+        job = _test_jobs.get(job_id)
+        return None if job is None else dict(job, results=dict(job["results"]))
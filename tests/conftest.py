@@ -0,0 +1,49 @@
+# tests/conftest.py
+
+import re
+import pytest
+import tiktoken
+from utils import token_counter
+from utils.llm import FakeStreamingLLM, set_llm
+from utils.mongo_writer import close_mongo_writers
+from summarization import summary_queue
+
+
+class WordEncoding:
+    # Stands in for tiktoken's BPE files, which are downloaded on first use:
+    # one token per word with its trailing whitespace, so decode round-trips
+    def encode(self, text, **kwargs):
+        return re.findall(r"\S+\s*|\s+", text)
+
+    def encode_batch(self, texts, num_threads=1, **kwargs):
+        return [self.encode(text) for text in texts]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+@pytest.fixture(autouse=True, scope="session")
+def offline_tokenizer():
+    # Token counts are the same with or without network access
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(tiktoken, "encoding_for_model", lambda model_name: WordEncoding())
+        token_counter.get_encoding.cache_clear()
+        token_counter._token_counts.clear()
+        yield
+    token_counter.get_encoding.cache_clear()
+    token_counter._token_counts.clear()
+
+
+@pytest.fixture
+def backends():
+    # In-process Redis (with Lua) and MongoDB, and an LLM that answers instantly
+    pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    pytest.importorskip("mongomock")
+    from benchmarks.common import use_local_backends
+    server = use_local_backends()
+    set_llm(FakeStreamingLLM(words=5, delay_ms=0))
+    yield server
+    summary_queue.wait_until_idle(timeout=30)
+    close_mongo_writers()
+    set_llm(None)
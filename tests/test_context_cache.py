@@ -0,0 +1,40 @@
+# tests/test_context_cache.py
+
+import utils.context_cache
+from chat_manager import ChatManager
+from context_managers import ExistingApproach
+from summarization import summary_queue
+from utils.token_counter import count_tokens
+
+NAMESPACE = "test-context-cache"
+
+
+def test_token_count_matches_the_rendered_context(backends):
+    approach = ExistingApproach(batch_size=5, namespace=NAMESPACE)
+    for i in range(23):
+        approach.add_message("u", {"role": "user", "content": f"message {i} " + "word " * i})
+        summary_queue.wait_until_idle(timeout=30)
+        context, tokens = approach.get_context_with_tokens("u")
+        assert tokens == count_tokens(context)
+        assert context == approach.get_context("u")
+
+
+def test_cached_reads_do_not_retokenize(backends, monkeypatch):
+    approach = ExistingApproach(batch_size=50, namespace=NAMESPACE)
+    approach.add_message("u", {"role": "user", "content": "hello"})
+    approach.get_context_with_tokens("u")
+    # The first read rebuilds from Redis; the second renders the cached entry
+    expected = approach.get_context_with_tokens("u")
+
+    calls = []
+    monkeypatch.setattr(utils.context_cache, "count_tokens", lambda text: calls.append(text))
+    assert all(approach.get_context_with_tokens("u") == expected for _ in range(5))
+    assert not calls
+
+
+def test_chat_manager_counts_approaches_without_a_cache(backends):
+    manager = ChatManager(namespace=NAMESPACE)
+    manager.set_approach("sliding_window")
+    manager.handle_new_message("u", {"role": "user", "content": "hello there"})
+    context, tokens = manager.get_context_with_tokens("u")
+    assert tokens == count_tokens(str(context)) > 0
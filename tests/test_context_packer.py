@@ -0,0 +1,25 @@
+# tests/test_context_packer.py
+
+from utils.context_packer import pack_segments
+from utils.token_counter import count_tokens
+
+
+def render(segments):
+    # Per-segment overhead the segment counts don't include, like the approaches' joins
+    return "Recent messages:\n" + "".join(f"- message: {segment}\n" for segment in segments)
+
+
+def test_packs_the_longest_suffix_that_fits():
+    segments = [f"segment {i} " + "word " * (i % 7) for i in range(300)]
+    for max_tokens in (40, 150, 600):
+        context, start = pack_segments(segments, max_tokens, render)
+        longest = next(i for i in range(len(segments)) if count_tokens(render(segments[i:])) <= max_tokens)
+        assert start == longest
+        assert context == render(segments[start:])
+        assert count_tokens(context) <= max_tokens
+
+
+def test_oversized_last_segment_is_cut_by_tokens():
+    context, start = pack_segments(["short", "long " * 500], 50, render)
+    assert start == 1
+    assert count_tokens(context) <= 50
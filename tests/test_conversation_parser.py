@@ -0,0 +1,28 @@
+# tests/test_conversation_parser.py
+
+import pytest
+from utils.conversation_parser import ConversationParser
+
+
+@pytest.mark.parametrize("body", [
+    b'[{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]',
+    b'{"role": "user", "content": "hi"}\n{"role": "assistant", "content": "hello"}\n',
+])
+def test_messages_split_across_chunks(body):
+    parser = ConversationParser()
+    messages = []
+    for i in range(0, len(body), 7):
+        messages += parser.feed(body[i:i + 7])
+    messages += parser.close()
+    assert [m["content"] for m in messages] == ["hi", "hello"]
+
+
+@pytest.mark.parametrize("start", [b'[{"role": "user", "content": "hi"}, {"role": ', b'{"role": '])
+def test_oversized_or_malformed_tail_fails_fast(start):
+    parser = ConversationParser(max_message_chars=1000)
+    parser.feed(start)
+    with pytest.raises(ValueError):
+        for _ in range(100):
+            parser.feed(b"x" * 64)
+    # Raised once the tail passed the bound, not at the end of the upload
+    assert len(parser.buffer) <= 1000 + 64
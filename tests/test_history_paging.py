@@ -0,0 +1,33 @@
+# tests/test_history_paging.py
+
+import pytest
+from chat_manager import ChatManager
+
+NAMESPACE = "test-paging"
+
+
+def test_pages_do_not_skip_tied_timestamps(backends):
+    manager = ChatManager(namespace=NAMESPACE)
+    # Three documents share each timestamp, as a batch flushed in one insert_many can
+    manager.collection.insert_many([
+        {"UserId": "u", "Timestamp": f"2026-01-01T00:00:0{i // 3}", "Content": f"message {i}", "BatchId": 1}
+        for i in range(9)
+    ])
+
+    seen, after = [], None
+    while True:
+        page = manager.get_mongodb_data("u", after, limit=2)
+        if not page:
+            break
+        seen += [doc["Content"] for doc in page]
+        after = page[-1]["Cursor"]
+
+    assert sorted(seen) == [f"message {i}" for i in range(9)]
+    assert len(seen) == 9
+    assert manager.get_mongodb_version("u", after).startswith("0-")
+
+
+def test_invalid_cursor_is_rejected(backends):
+    manager = ChatManager(namespace=NAMESPACE)
+    with pytest.raises(ValueError):
+        manager.get_mongodb_version("u", "2026-01-01T00:00:00")
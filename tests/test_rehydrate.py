@@ -0,0 +1,48 @@
+# tests/test_rehydrate.py
+
+import json
+import threading
+import context_managers
+from context_managers import ExistingApproach
+from summarization import summary_queue
+
+NAMESPACE = "test-rehydrate"
+
+
+def drop_redis_state(approach, user_id):
+    approach.redis_client.delete(*[f"{approach.prefix}{user_id}:{key}" for key in ["stack", "summary", "batch_id", "batch_counts", "version"]])
+
+
+def test_rehydrate_keeps_summaries_older_than_the_message_window(backends, monkeypatch):
+    monkeypatch.setattr(context_managers, "REHYDRATE_LIMIT", 7)
+    approach = ExistingApproach(batch_size=5, namespace=NAMESPACE)
+    for i in range(53):
+        approach.add_message("u", {"role": "user", "content": f"message {i}"})
+    assert summary_queue.wait_until_idle(timeout=30)
+    approach.writer.flush()
+    before = json.loads(approach.redis_client.get(f"{approach.prefix}u:summary"))
+
+    drop_redis_state(approach, "u")
+    assert approach.rehydrate("u")
+
+    summaries = json.loads(approach.redis_client.get(f"{approach.prefix}u:summary"))
+    assert [s["batch_id"] for s in summaries] == [s["batch_id"] for s in before] == list(range(1, 11))
+    stack = [json.loads(msg) for msg in approach.redis_client.lrange(f"{approach.prefix}u:stack", 0, -1)]
+    assert [msg["batch_id"] for msg in stack] == [11, 11, 11]
+    assert approach.redis_client.get(f"{approach.prefix}u:batch_id") == "11"
+
+
+def test_rehydrate_lock_timeout_does_not_raise(backends, monkeypatch):
+    monkeypatch.setattr(context_managers, "REHYDRATE_LOCK_TIMEOUT", 0.3)
+    approach = ExistingApproach(batch_size=5, namespace=NAMESPACE)
+    held = approach.redis_client.lock(f"{approach.prefix}u:rehydrate_lock", timeout=5)
+    assert held.acquire()
+    try:
+        assert approach.rehydrate("u") is False
+        # The other worker's rebuild lands while this one waits
+        writer = threading.Timer(0.05, approach.redis_client.set, args=(f"{approach.prefix}u:batch_id", 3))
+        writer.start()
+        assert approach.rehydrate("u") is True
+        writer.join()
+    finally:
+        held.release()
@@ -0,0 +1,100 @@
+# tests/test_rollover.py
+
+import json
+import threading
+import context_managers
+from context_managers import ExistingApproach
+from summarization import summary_queue
+from utils.llm import get_llm
+
+NAMESPACE = "test-rollover"
+
+
+def redis_state(approach, user_id):
+    stack = [json.loads(msg) for msg in approach.redis_client.lrange(f"{approach.prefix}{user_id}:stack", 0, -1)]
+    summaries = approach.redis_client.get(f"{approach.prefix}{user_id}:summary")
+    return stack, json.loads(summaries) if summaries else []
+
+
+def test_concurrent_writers_lose_nothing(backends):
+    # Writers call the approach directly, without ChatManager's user locks,
+    # while summaries roll batches out of the same stack
+    get_llm().delay = 0.001
+    approach = ExistingApproach(batch_size=5, namespace=NAMESPACE)
+    threads, per_thread = 8, 50
+
+    def write(n):
+        for i in range(per_thread):
+            approach.add_message("hot", {"role": "user", "content": f"writer {n} message {i}"})
+
+    workers = [threading.Thread(target=write, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert summary_queue.wait_until_idle(timeout=30)
+
+    stack, summaries = redis_state(approach, "hot")
+    batch_ids = [summary["batch_id"] for summary in summaries]
+    assert len(batch_ids) == len(set(batch_ids))
+    assert all(summary["count"] == 5 for summary in summaries)
+    assert sum(summary["count"] for summary in summaries) + len(stack) == threads * per_thread
+    # Only the open batch is left on the stack
+    open_batch = int(approach.redis_client.get(f"{approach.prefix}hot:batch_id"))
+    assert all(msg["batch_id"] == open_batch for msg in stack)
+
+    approach.writer.flush()
+    assert approach.collection.count_documents({"UserId": "hot", "Kind": {"$ne": "summary"}}) == threads * per_thread
+
+
+def test_failed_summary_does_not_block_later_batches(backends, monkeypatch):
+    summarize = context_managers.summarize_chat_history
+
+    def fail_first_batch(messages):
+        if any(msg["content"].startswith("message 0 ") for msg in messages):
+            raise RuntimeError("LLM unavailable")
+        return summarize(messages)
+
+    monkeypatch.setattr(context_managers, "summarize_chat_history", fail_first_batch)
+    monkeypatch.setattr(summary_queue, "retry_backoff", 0.001)
+    approach = ExistingApproach(batch_size=5, namespace=NAMESPACE)
+    for i in range(30):
+        approach.add_message("u", {"role": "user", "content": f"message {i // 5} {i}"})
+    assert summary_queue.wait_until_idle(timeout=30)
+
+    stack, summaries = redis_state(approach, "u")
+    assert [summary["batch_id"] for summary in summaries] == [2, 3, 4, 5, 6]
+    assert all(summary["count"] == 5 for summary in summaries)
+    # Batch 1 failed every retry and stays on the stack; nothing after it piles up
+    assert [msg["batch_id"] for msg in stack] == [1] * 5
+
+
+def test_rollover_removes_the_batch_wherever_it_sits(backends):
+    approach = ExistingApproach(batch_size=2, namespace=NAMESPACE)
+    stack_key = f"{approach.prefix}u:stack"
+    batches = [1, 1, 2, 2, 3]
+    for i, batch_id in enumerate(batches):
+        approach.redis_client.rpush(stack_key, json.dumps({"batch_id": batch_id, "content": f"m{i}", "timestamp": ""}))
+
+    removed = approach._rollover(
+        keys=[stack_key, f"{approach.prefix}u:summary", f"{approach.prefix}u:batch_counts", f"{approach.prefix}u:version"],
+        args=[json.dumps({"batch_id": 2, "content": "s", "count": 2}), 2, 2]
+    )
+
+    stack, summaries = redis_state(approach, "u")
+    assert removed == 2
+    assert [msg["content"] for msg in stack] == ["m0", "m1", "m4"]
+    assert summaries == [{"batch_id": 2, "content": "s", "count": 2}]
+
+
+def test_empty_batch_is_not_summarized(backends):
+    approach = ExistingApproach(batch_size=5, namespace=NAMESPACE)
+    approach.add_message("u", {"role": "user", "content": "hello"})
+    calls = get_llm().calls
+    version = approach.redis_client.get(f"{approach.prefix}u:version")
+
+    approach._create_summary("u", 7)
+
+    assert get_llm().calls == calls
+    assert approach.redis_client.get(f"{approach.prefix}u:summary") is None
+    assert approach.redis_client.get(f"{approach.prefix}u:version") == version
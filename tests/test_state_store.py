@@ -0,0 +1,88 @@
+# tests/test_state_store.py
+
+import numpy as np
+import pytest
+from context_managers import HierarchicalSummary, KeywordExtractor
+from summarization import summary_queue
+from utils.state_store import InMemoryStateStore, RedisStateStore
+
+NAMESPACE = "test-state"
+
+
+@pytest.fixture(params=["memory", "redis"])
+def make_store(request, backends):
+    def make(name, lists=()):
+        if request.param == "memory":
+            return InMemoryStateStore()
+        return RedisStateStore(name, NAMESPACE, ttl=60, lists=lists)
+    return make
+
+
+def test_lists_are_append_only_slices(make_store):
+    store = make_store("lists", lists=["a", "b"])
+    assert [store.append("u", "a", {"n": n}) for n in range(5)] == [1, 2, 3, 4, 5]
+    assert store.length("u", "a") == 5
+    assert store.items("u", "a", 1, 3) == [{"n": 1}, {"n": 2}]
+    assert store.items("u", "a", 3) == [{"n": 3}, {"n": 4}]
+    assert store.tail("u", "a", 2) == [{"n": 3}, {"n": 4}]
+    assert store.tail("u", "a", 0) == []
+    assert store.items("u", "b") == [] and store.length("other", "a") == 0
+
+
+def test_memory_store_evicts_users_past_the_item_cap():
+    store = InMemoryStateStore(max_users=10, max_items=10)
+    for n in range(6):
+        store.append("old", "a", n)
+    for n in range(4):
+        store.append("new", "a", n)
+    assert store.stats()["list_items"] == 10
+    store.append("new", "a", 4)
+    # The least recently used user goes; the one appending stays, even alone past the cap
+    assert store.length("new", "a") == 5 and store.stats()["list_items"] == 5
+    for n in range(5, 12):
+        store.append("new", "a", n)
+    assert store.length("new", "a") == 12 and store.stats()["users"] == 1
+    assert store.length("old", "a") == 0
+
+
+def test_redis_append_refreshes_every_list_ttl(backends):
+    store = RedisStateStore("ttl", NAMESPACE, ttl=60, lists=["level0", "level3"])
+    store.append("u", "level3", "old summary")
+    store.redis_client.expire(store._list_key("u", "level3"), 5)
+    store.append("u", "level0", "new message")
+    assert store.redis_client.ttl(store._list_key("u", "level3")) > 5
+    # Nothing is written to the whole-state key
+    assert not store.redis_client.exists(store._key("u"))
+
+
+def test_hierarchical_levels(make_store):
+    approach = HierarchicalSummary(state_store=make_store("hierarchical", HierarchicalSummary.LEVELS))
+    for i in range(100):
+        approach.add_message("u", {"role": "user", "content": f"message {i}"})
+    assert summary_queue.wait_until_idle(timeout=30)
+
+    state = approach.get_internal_state("u")
+    assert [len(state[level]) for level in ("level1", "level2", "level3", "level4")] == [100, 10, 1, 0]
+    context = approach.get_context("u")
+    assert len(context) == 1 + 5 + 10
+    assert context[-1] == {"role": "user", "content": "message 99"}
+
+
+def test_keyword_workers_share_records_and_match_a_full_refit(make_store):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    store = make_store("keyword", ["messages"])
+    # Two approaches over one store stand in for two workers
+    first, second = KeywordExtractor(state_store=store), KeywordExtractor(state_store=store)
+    texts = [f"redis cache {i % 3} mongo index {i % 5} query {i}" for i in range(40)]
+    for i, text in enumerate(texts):
+        (first if i % 2 else second).add_message("u", {"role": "user", "content": text})
+        if i == 20:
+            first.get_context("u")  # Later reads only add the newer records
+
+    expected = np.asarray(TfidfVectorizer().fit_transform(texts).mean(axis=1)).ravel()
+    for approach in (first, second):
+        scores = approach.get_internal_state("u")["importance_scores"]
+        np.testing.assert_allclose(scores, expected)
+        # Ties may be broken either way, so compare the chosen messages' scores
+        chosen = [expected[texts.index(text)] for text in approach.get_context("u", top_n=3)]
+        np.testing.assert_allclose(chosen, np.sort(expected)[-3:])
@@ -0,0 +1,55 @@
+# tests/test_streaming.py
+
+import asyncio
+import json
+from chat_manager import ChatManager
+from conversation_handler import astream_user_message
+from utils.llm import get_llm
+
+NAMESPACE = "test-streaming"
+
+
+def stored_roles(manager, user_id):
+    stack = manager.redis_client.lrange(f"{manager.prefix}{user_id}:stack", 0, -1)
+    return [json.loads(msg)["content"]["role"] for msg in stack]
+
+
+def test_tokens_stream_before_the_reply_is_stored(backends):
+    manager = ChatManager(namespace=NAMESPACE)
+    get_llm().words = 6
+
+    async def consume():
+        events, roles_during = [], []
+        async for event in astream_user_message(manager, "u", "hello there"):
+            events.append(event)
+            if event["type"] == "token":
+                roles_during.append(stored_roles(manager, "u"))
+        return events, roles_during
+
+    events, roles_during = asyncio.run(consume())
+
+    assert [event["type"] for event in events] == ["token"] * 6 + ["done"]
+    assert "".join(event["text"] for event in events[:-1]) == events[-1]["response"]
+    assert events[-1]["token_count"] > 0
+    # Only the user's message is stored while tokens arrive; the reply lands after the last one
+    assert all(roles == ["user"] for roles in roles_during)
+    assert stored_roles(manager, "u") == ["user", "assistant"]
+
+
+def test_closing_the_stream_midway_stores_no_reply(backends):
+    manager = ChatManager(namespace=NAMESPACE)
+    get_llm().words = 6
+
+    async def consume_two():
+        stream = astream_user_message(manager, "u", "hello there")
+        events = [await stream.__anext__(), await stream.__anext__()]
+        # What the server does when the client disconnects
+        await stream.aclose()
+        return events
+
+    events = asyncio.run(consume_two())
+
+    assert [event["type"] for event in events] == ["token", "token"]
+    assert stored_roles(manager, "u") == ["user"]
+    manager.get_approach().writer.flush()
+    assert [doc["Content"]["role"] for doc in manager.collection.find({"UserId": "u"})] == ["user"]
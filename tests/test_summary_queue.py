@@ -0,0 +1,54 @@
+# tests/test_summary_queue.py
+
+import threading
+from summarization import SummaryQueue
+
+
+def flaky(failures):
+    # A job that raises `failures` times before it succeeds
+    calls = []
+    def job(name):
+        calls.append(name)
+        if len(calls) <= failures:
+            raise RuntimeError("503 from the LLM")
+    return job, calls
+
+
+def test_failed_job_is_retried_before_the_users_next_job():
+    queue = SummaryQueue(max_workers=2, max_retries=3, retry_backoff_ms=1)
+    job, calls = flaky(failures=2)
+    order = []
+    queue.submit("u", job, "first")
+    queue.submit("u", order.append, "second")
+    assert queue.wait_until_idle(timeout=5)
+
+    assert calls == ["first"] * 3
+    assert order == ["second"]
+    stats = queue.stats()
+    assert (stats["completed"], stats["retries"], stats["failed"]) == (2, 2, 0)
+    queue.shutdown()
+
+
+def test_job_that_keeps_failing_counts_as_one_permanent_failure():
+    queue = SummaryQueue(max_workers=2, max_retries=2, retry_backoff_ms=1)
+    job, calls = flaky(failures=10)
+    queue.submit("u", job, "batch")
+    assert queue.wait_until_idle(timeout=5)
+
+    assert len(calls) == 3
+    stats = queue.stats()
+    assert (stats["completed"], stats["retries"], stats["failed"]) == (0, 2, 1)
+    assert stats["queue_depth"] == 0
+    queue.shutdown()
+
+
+def test_backoff_does_not_hold_a_worker():
+    # One worker: another user's job runs while the first user's retry waits
+    queue = SummaryQueue(max_workers=1, max_retries=1, retry_backoff_ms=500)
+    job, _ = flaky(failures=1)
+    ran = threading.Event()
+    queue.submit("a", job, "batch")
+    queue.submit("b", lambda: ran.set())
+    assert ran.wait(timeout=0.4)
+    assert queue.wait_until_idle(timeout=5)
+    queue.shutdown()
@@ -0,0 +1,73 @@
+# tests/test_topic_clusterer.py
+
+import collections
+from context_managers import TopicClusterer
+from summarization import summary_queue
+
+NAMESPACE = "test-topic"
+
+
+def stored(approach, user_id):
+    # Every message in a topic list or still waiting in the inbox
+    members = []
+    for label in range(approach.max_clusters):
+        members += approach.redis_client.lrange(f"{approach.prefix}{user_id}:topic:{label}", 0, -1)
+    inbox = approach.redis_client.lrange(f"{approach.prefix}{user_id}:topic:inbox", 0, -1)
+    return members, inbox
+
+
+def send(workers, user_id, messages, offset=0):
+    for i in range(messages):
+        content = f"message {offset + i} about " + ("redis caching" if i % 2 else "cooking pasta")
+        workers[i % len(workers)].add_message(user_id, {"role": "user", "content": content})
+    assert summary_queue.wait_until_idle(timeout=30)
+
+
+def test_two_workers_share_one_model_without_duplicates(backends):
+    workers = [TopicClusterer(namespace=NAMESPACE) for _ in range(2)]
+    send(workers, "u", 40)
+
+    owners = [worker for worker in workers if worker.models.states.get("u", {}).get("seeded")]
+    assert len(owners) == 1
+    members, inbox = stored(workers[0], "u")
+    assert len(members) == 40 and not inbox
+    assert max(collections.Counter(members).values()) == 1
+
+
+def test_messages_wait_in_redis_until_the_first_fit(backends):
+    workers = [TopicClusterer(namespace=NAMESPACE) for _ in range(2)]
+    send(workers, "u", workers[0].max_clusters - 1)
+
+    members, inbox = stored(workers[0], "u")
+    assert not members and len(inbox) == workers[0].max_clusters - 1
+
+
+def test_takeover_refits_from_redis(backends):
+    workers = [TopicClusterer(namespace=NAMESPACE) for _ in range(2)]
+    send(workers, "u", 20)
+    owner = next(worker for worker in workers if "u" in worker.models.states)
+    other = workers[1 - workers.index(owner)]
+
+    # The owner goes away; the other worker takes the lease on its next job
+    owner.redis_client.delete(f"{owner.prefix}u:topic:owner")
+    send([other], "u", 10, offset=20)
+
+    assert other.models.load("u", dict)["fitted"]
+    members, inbox = stored(other, "u")
+    assert len(members) == 30 and not inbox
+    assert max(collections.Counter(members).values()) == 1
+
+
+def test_evicted_models_are_refit_from_redis(backends):
+    worker = TopicClusterer(namespace=NAMESPACE)
+    worker.models.max_users = 1
+    for offset in (0, 10, 20):
+        for user_id in ("a", "b"):
+            send([worker], user_id, 10, offset=offset)
+
+    assert len(worker.models.states) == 1
+    for user_id in ("a", "b"):
+        members, inbox = stored(worker, user_id)
+        assert len(members) == 30 and not inbox
+        assert max(collections.Counter(members).values()) == 1
+    assert worker.hasher.n_features == worker.models.load("b", dict)["kmeans"].cluster_centers_.shape[1]
@@ -0,0 +1,139 @@
+# tests/test_user_concurrency.py
+
+import asyncio
+import threading
+import time
+from chat_manager import ChatManager
+from summarization import summary_queue
+
+NAMESPACE = "test-concurrency"
+BATCH_SIZE = 20  # ExistingApproach's default
+
+
+def stored_history(manager, user_id):
+    # Message counts per batch and the summarized batch ids, as MongoDB has them
+    batch_counts, summarized = {}, []
+    for doc in manager.collection.find({"UserId": user_id}):
+        if doc.get("Kind") == "summary":
+            summarized.append(doc["BatchId"])
+        else:
+            batch_counts[doc["BatchId"]] = batch_counts.get(doc["BatchId"], 0) + 1
+    return batch_counts, summarized
+
+
+def test_hot_user_and_other_users_stay_consistent(backends):
+    # Two managers stand in for two worker processes; the hot user is written
+    # through both, from threads and from the event loop, while eight other
+    # users write alongside
+    managers = [ChatManager(namespace=NAMESPACE), ChatManager(namespace=NAMESPACE)]
+    hot_threads, other_users, per_writer = 8, 8, 25
+
+    def write(manager, user_id, n):
+        for i in range(per_writer):
+            manager.handle_new_message(user_id, {"role": "user", "content": f"{user_id} writer {n} message {i}"})
+
+    async def write_async(manager, n):
+        for i in range(per_writer):
+            await manager.ahandle_new_message("hot", {"role": "user", "content": f"hot async writer {n} message {i}"})
+
+    async def write_all_async():
+        await asyncio.gather(*(write_async(managers[n % 2], n) for n in range(4)))
+
+    writers = [threading.Thread(target=write, args=(managers[n % 2], "hot", n)) for n in range(hot_threads)]
+    writers += [threading.Thread(target=write, args=(managers[n % 2], f"user{n}", 0)) for n in range(other_users)]
+    writers.append(threading.Thread(target=asyncio.run, args=(write_all_async(),)))
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    assert summary_queue.wait_until_idle(timeout=60)
+    for manager in managers:
+        manager.get_approach().writer.flush()
+
+    expected = {"hot": (hot_threads + 4) * per_writer, **{f"user{n}": per_writer for n in range(other_users)}}
+    for user_id, messages in expected.items():
+        batch_counts, summarized = stored_history(managers[0], user_id)
+        batches = sorted(batch_counts)
+        assert sum(batch_counts.values()) == messages, user_id
+        assert all(count == BATCH_SIZE for batch, count in batch_counts.items() if batch != batches[-1]), user_id
+        assert batch_counts[batches[-1]] <= BATCH_SIZE
+        assert len(summarized) == len(set(summarized)) == messages // BATCH_SIZE, user_id
+
+
+class BlockingApproach:
+    # Records how many writes run at once; each write waits on the barrier, so
+    # writes that were serialized would break it
+    def __init__(self, barrier):
+        self.barrier = barrier
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def add_message(self, user_id, message_dict):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            if self.barrier is not None:
+                self.barrier.wait()
+            else:
+                time.sleep(0.05)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def users_on_stripes(manager, count, same=False):
+    # User ids that land on distinct stripes, or all on the first one's stripe
+    users, stripes = [], set()
+    n = 0
+    while len(users) < count:
+        user_id = f"user{n}"
+        stripe = manager._stripe(user_id)
+        if (same and (not users or stripe == manager._stripe(users[0]))) or (not same and stripe not in stripes):
+            users.append(user_id)
+            stripes.add(stripe)
+        n += 1
+    return users
+
+
+def install(manager, approach):
+    manager.loaded_approaches[manager.current_approach] = approach
+
+
+def test_writes_for_different_users_run_in_parallel(backends):
+    manager = ChatManager(namespace=NAMESPACE)
+    users = users_on_stripes(manager, 4)
+    approach = BlockingApproach(threading.Barrier(len(users), timeout=5))
+    install(manager, approach)
+
+    writers = [threading.Thread(target=manager.handle_new_message, args=(user_id, {})) for user_id in users]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    assert not approach.barrier.broken
+    assert approach.peak == len(users)
+
+    async def write_all():
+        await asyncio.gather(*(manager.ahandle_new_message(user_id, {}) for user_id in users))
+
+    approach.barrier = threading.Barrier(len(users), timeout=5)
+    approach.peak = 0
+    asyncio.run(write_all())
+    assert not approach.barrier.broken
+    assert approach.peak == len(users)
+
+
+def test_writes_for_one_stripe_are_serialized(backends):
+    manager = ChatManager(namespace=NAMESPACE)
+    approach = BlockingApproach(None)
+    install(manager, approach)
+    users = users_on_stripes(manager, 3, same=True)
+
+    writers = [threading.Thread(target=manager.handle_new_message, args=(user_id, {})) for user_id in users * 2]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    assert approach.peak == 1
@@ -0,0 +1,55 @@
+# tests/test_vector_index.py
+
+import os
+import threading
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from utils.vector_index import UserVectorIndex, VectorIndexStore
+
+DIM = 8
+
+
+def test_user_id_cannot_leave_base_dir(tmp_path):
+    base_dir = tmp_path / "indexes"
+    store = VectorIndexStore(base_dir=str(base_dir), max_users=1, dim=DIM)
+    for user_id in ["../escape", "/etc/passwd", "a/../../b"]:
+        store.add(user_id, np.ones(DIM), {"content": user_id})
+    store.flush()
+
+    assert sorted(os.listdir(tmp_path)) == ["indexes"]
+    assert all(os.path.dirname(store._path(user_id)) == str(base_dir) for user_id in ["../escape", "/etc/passwd"])
+    assert store.get("../escape").search(np.ones(DIM), 1) == [{"content": "../escape"}]
+
+
+def test_adds_survive_concurrent_eviction(tmp_path):
+    # One user per writer and a single LRU slot, so nearly every add evicts
+    store = VectorIndexStore(base_dir=str(tmp_path), max_users=1, dim=DIM)
+    rng = np.random.default_rng(0)
+
+    def write(user_id):
+        for i in range(50):
+            store.add(user_id, rng.random(DIM), {"i": i})
+
+    writers = [threading.Thread(target=write, args=(f"user{n}",)) for n in range(4)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    store.flush()
+
+    for n in range(4):
+        assert sorted(item["i"] for item in store.get(f"user{n}").metadata) == list(range(50))
+
+
+def test_ann_index_matches_flat_on_exact_queries():
+    rng = np.random.default_rng(0)
+    vectors = rng.random((200, DIM)).astype(np.float32)
+    index = UserVectorIndex(dim=DIM, ann_threshold=100, ann_type="hnsw")
+    for i, vector in enumerate(vectors):
+        index.add(vector, i)
+
+    assert type(index.index).__name__ == "IndexHNSWFlat"
+    assert all(index.search(vectors[i], 1) == [i] for i in range(0, 200, 20))
@@ -0,0 +1,85 @@
+# utils/context_cache.py
+
+import threading
+from utils.token_counter import count_tokens
+
+# A user's ExistingApproach context kept as formatted segments and tagged
+# with the Redis state version ({user}:version) it reflects. Every write INCRs
+# that version, so a writer that sees version v+1 come back from its own INCR
+# knows nothing else changed and can append its segment in place; any other
+# jump means another writer (or process) got in between, and the entry is
+# dropped and rebuilt from Redis on the next read. The rendering and its token
+# count are computed once per version, on the first read.
+
+SUMMARY_HEADER = "Summaries of previous conversations:\n"
+MESSAGE_HEADER = "Current conversation:\n"
+
+
+def summary_segment(summary):
+    return f"Batch {summary['batch_id']}: {summary['content']}\n\n"
+
+def message_segment(message):
+    if isinstance(message['content'], dict):
+        role = message['content'].get('role', 'unknown')
+        content = message['content'].get('content', '')
+        return f"{role.capitalize()}: {content}\n"
+    return f"Message: {message['content']}\n"
+
+
+def build_segments(items, format_segment):
+    return [format_segment(item) for item in items]
+
+
+class CachedContext:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.summaries = []
+        self.messages = []
+        self.rendered = None  # (context, tokens), built on first read
+
+    def read(self, version):
+        with self.lock:
+            if self.version is None or self.version != version:
+                return None
+            return self._render()
+
+    def replace(self, version, summaries, messages):
+        # Segments from a full read; kept unless an append already got further
+        with self.lock:
+            if self.version is not None and self.version >= version:
+                return
+            self.version = version
+            self.summaries = summaries
+            self.messages = messages
+            self.rendered = None
+
+    def append(self, version, message):
+        text = message_segment(message)
+        with self.lock:
+            if self.version is None or self.version != version - 1:
+                self.version = None
+                return
+            self.messages.append(text)
+            self.version = version
+            self.rendered = None
+
+    def advance(self, version):
+        # A write that does not change the rendered context, e.g. a new batch id
+        with self.lock:
+            self.version = version if self.version is not None and self.version == version - 1 else None
+
+    def render(self):
+        with self.lock:
+            return self._render()
+
+    def _render(self):
+        if self.rendered is None:
+            parts = []
+            for header, segments in ((SUMMARY_HEADER, self.summaries), (MESSAGE_HEADER, self.messages)):
+                if segments:
+                    parts.append(header)
+                    parts.extend(segments)
+            context = "".join(parts).strip()
+            self.rendered = (context, count_tokens(context))
+        return self.rendered
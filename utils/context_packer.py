@@ -0,0 +1,53 @@
+# utils/context_packer.py
+
+from bisect import bisect_left
+from itertools import accumulate
+from utils.token_counter import count_tokens, count_tokens_batch, get_encoding
+
+def fit_suffix(token_counts, budget):
+    # Index of the first segment in the longest suffix whose counts fit the budget
+    prefix = list(accumulate(token_counts, initial=0))
+    return bisect_left(prefix, prefix[-1] - budget)
+
+def truncate_tokens(text, max_tokens, model_name='gpt-3.5-turbo'):
+    # Keep the most recent max_tokens tokens of text
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(model_name)
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[-max_tokens:])
+
+# Render the longest suffix of segments (oldest first) that fits in max_tokens.
+# Each segment is counted once (and memoized across calls) and prefix sums give
+# a first cut point. Headers and separators added by render are not in those
+# counts, so the final cut is binary-searched on the rendered count, which only
+# falls as segments are dropped: O(log n) renderings of about the budget's
+# size. Returns the context and the number of segments dropped.
+def pack_segments(segments, max_tokens, render, key=None, model_name='gpt-3.5-turbo'):
+    segments = list(segments)
+    key = key or (lambda segment: segment)
+
+    def fits(start):
+        return count_tokens(render(segments[start:]), model_name) <= max_tokens
+
+    counts = count_tokens_batch([key(segment) for segment in segments], model_name)
+    last = max(len(segments) - 1, 0)
+    start = min(fit_suffix(counts, max_tokens), last)
+    if not fits(start):
+        low, high = min(start + 1, last), last
+        while low < high:
+            middle = (low + high) // 2
+            if fits(middle):
+                high = middle
+            else:
+                low = middle + 1
+        start = low
+
+    context = render(segments[start:])
+    if count_tokens(context, model_name) > max_tokens:
+        # A single oversized segment is cut by tokens, not characters
+        context = truncate_tokens(context, max_tokens, model_name)
+
+    return context, start
@@ -0,0 +1,97 @@
+# utils/conversation_parser.py
+
+import codecs
+import json
+from config import UPLOAD_MAX_MESSAGE_CHARS
+
+# Incremental parser for uploaded conversations: either NDJSON (one message
+# object per line) or a JSON array of message objects. Bytes go in as they
+# arrive and complete messages come out, so nothing is written to disk and only
+# the unparsed tail of the input is held in memory; a tail longer than
+# max_message_chars (an oversized or malformed message) fails the upload
+# instead of being buffered to the end. Nothing is ever executed.
+
+WHITESPACE = " \t\r\n"
+
+
+class ConversationParser:
+    def __init__(self, max_message_chars=UPLOAD_MAX_MESSAGE_CHARS):
+        self.max_message_chars = max_message_chars
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.mode = None  # "array" or "ndjson", from the first character
+        self.finished = False
+        self.count = 0
+
+    def feed(self, chunk):
+        self.buffer += self.text.decode(chunk)
+        messages = self._parse(final=False)
+        if len(self.buffer) > self.max_message_chars:
+            raise ValueError(f"Message {self.count + 1} is invalid or longer than {self.max_message_chars} characters")
+        return messages
+
+    def close(self):
+        self.buffer += self.text.decode(b"", final=True)
+        messages = self._parse(final=True)
+        if self.mode == "array" and not self.finished:
+            raise ValueError("Conversation array is not closed")
+        return messages
+
+    def _message(self, value):
+        self.count += 1
+        if not isinstance(value, dict) or "role" not in value or "content" not in value:
+            raise ValueError(f"Message {self.count} needs 'role' and 'content'")
+        return value
+
+    def _parse(self, final):
+        if self.mode is None:
+            start = len(self.buffer) - len(self.buffer.lstrip(WHITESPACE))
+            if start == len(self.buffer):
+                return []
+            if self.buffer[start] == "[":
+                self.mode = "array"
+                self.buffer = self.buffer[start + 1:]
+            else:
+                self.mode = "ndjson"
+        if self.mode == "array":
+            return self._parse_array(final)
+        return self._parse_lines(final)
+
+    def _parse_lines(self, final):
+        lines = self.buffer.split("\n")
+        # The last piece may be a partial line until the input ends
+        self.buffer = "" if final else lines.pop()
+        return [self._message(json.loads(line)) for line in lines if line.strip()]
+
+    def _parse_array(self, final):
+        messages = []
+        pos = 0
+        while not self.finished:
+            while pos < len(self.buffer) and self.buffer[pos] in WHITESPACE + ",":
+                pos += 1
+            if pos == len(self.buffer):
+                break
+            if self.buffer[pos] == "]":
+                self.finished = True
+                pos += 1
+                break
+            try:
+                value, pos = self.decoder.raw_decode(self.buffer, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise ValueError("Conversation is not valid JSON")
+                break  # Wait for the rest of this element
+            messages.append(self._message(value))
+        if self.finished and self.buffer[pos:].strip(WHITESPACE):
+            raise ValueError("Unexpected data after the conversation array")
+        self.buffer = self.buffer[pos:]
+        return messages
+
+
+def iter_conversation_file(file_path, chunk_size=1 << 16):
+    parser = ConversationParser()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            yield from parser.feed(chunk)
+    yield from parser.close()
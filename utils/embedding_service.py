@@ -0,0 +1,167 @@
+# utils/embedding_service.py
+
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+import torch
+from transformers import AutoTokenizer, AutoModel
+from config import (
+    EMBEDDING_BACKEND, EMBEDDING_THREADS, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_WAIT_MS,
+    EMBEDDING_CACHE_SIZE, EMBEDDING_QUANTIZE, EMBEDDING_ONNX_DIR
+)
+
+class EmbeddingService:
+    # Mean-pooled sentence embeddings. Requests from any thread are queued and
+    # a single worker runs them through the model in micro-batches of up to
+    # max_batch_size, waiting at most max_wait_ms to fill a batch. Results are
+    # cached by content hash with LRU eviction.
+    def __init__(self, model_name, backend=EMBEDDING_BACKEND, num_threads=EMBEDDING_THREADS,
+                 max_batch_size=EMBEDDING_BATCH_SIZE, max_wait_ms=EMBEDDING_MAX_WAIT_MS,
+                 cache_size=EMBEDDING_CACHE_SIZE, quantize=EMBEDDING_QUANTIZE):
+        self.model_name = model_name
+        self.backend = backend
+        self.num_threads = num_threads
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.cache_size = cache_size
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        if backend == "onnx":
+            self.session = self._load_onnx(quantize)
+        else:
+            torch.set_num_threads(num_threads)
+            self.model = AutoModel.from_pretrained(model_name).eval()
+
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+
+        self.requests = queue.Queue()
+        self.worker = threading.Thread(target=self._run, name="embedding", daemon=True)
+        self.worker.start()
+
+    def _load_onnx(self, quantize):
+        import onnxruntime
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        model_dir = os.path.join(EMBEDDING_ONNX_DIR, self.model_name.replace("/", "_"))
+        fp32_path = os.path.join(model_dir, "model.onnx")
+        int8_path = os.path.join(model_dir, "model.int8.onnx")
+
+        # Export (and quantize) once; later starts load the cached files
+        if not os.path.exists(fp32_path):
+            os.makedirs(model_dir, exist_ok=True)
+            model = AutoModel.from_pretrained(self.model_name).eval()
+            dummy = self.tokenizer(["hello world"], return_tensors="pt")
+            torch.onnx.export(
+                model,
+                (dummy["input_ids"], dummy["attention_mask"]),
+                fp32_path,
+                input_names=["input_ids", "attention_mask"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    "input_ids": {0: "batch", 1: "sequence"},
+                    "attention_mask": {0: "batch", 1: "sequence"},
+                    "last_hidden_state": {0: "batch", 1: "sequence"}
+                },
+                opset_version=14
+            )
+        if quantize and not os.path.exists(int8_path):
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.num_threads
+        return onnxruntime.InferenceSession(int8_path if quantize else fp32_path, options, providers=["CPUExecutionProvider"])
+
+    def _cache_key(self, text):
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    def embed(self, text):
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts):
+        keys = [self._cache_key(text) for text in texts]
+        embeddings = [None] * len(texts)
+        with self.cache_lock:
+            for i, key in enumerate(keys):
+                embedding = self.cache.get(key)
+                if embedding is not None:
+                    self.cache.move_to_end(key)
+                    embeddings[i] = embedding
+                    self.hits += 1
+                else:
+                    self.misses += 1
+
+        # Queue each distinct missing text once
+        futures = {}
+        for i, embedding in enumerate(embeddings):
+            if embedding is None and keys[i] not in futures:
+                futures[keys[i]] = Future()
+                self.requests.put((texts[i], futures[keys[i]]))
+
+        for key, future in futures.items():
+            embedding = future.result()
+            with self.cache_lock:
+                self.cache[key] = embedding
+                self.cache.move_to_end(key)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+
+        return [embedding if embedding is not None else futures[key].result() for embedding, key in zip(embeddings, keys)]
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                # Wait up to the deadline for more work, then only take what is already queued
+                timeout = deadline - time.monotonic()
+                try:
+                    batch.append(self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                embeddings = self._encode([text for text, _ in batch])
+                for (_, future), embedding in zip(batch, embeddings):
+                    future.set_result(embedding)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            self.batches += 1
+
+    def _encode(self, texts):
+        if self.backend == "onnx":
+            inputs = self.tokenizer(texts, return_tensors="np", truncation=True, max_length=512, padding=True)
+            hidden = self.session.run(None, {
+                "input_ids": inputs["input_ids"].astype(np.int64),
+                "attention_mask": inputs["attention_mask"].astype(np.int64)
+            })[0]
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+        else:
+            inputs = self.tokenizer(texts, return_tensors="pt", truncation=True, max_length=512, padding=True)
+            with torch.inference_mode():
+                hidden = self.model(**inputs).last_hidden_state.numpy()
+            mask = inputs["attention_mask"].unsqueeze(-1).numpy().astype(np.float32)
+
+        # Mean over real tokens only, so padded batches match one-at-a-time embeddings
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return list(pooled.astype(np.float32))
+
+    def stats(self):
+        with self.cache_lock:
+            return {
+                "backend": self.backend,
+                "cache_entries": len(self.cache),
+                "cache_hits": self.hits,
+                "cache_misses": self.misses,
+                "batches": self.batches,
+                "queued": self.requests.qsize()
+            }
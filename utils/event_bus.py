@@ -0,0 +1,106 @@
+# utils/event_bus.py
+
+import asyncio
+import json
+import logging
+from utils.redis_client import get_async_redis_client
+from config import EVENT_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# State changes are published on a per-user Redis channel so every worker
+# process sees them. Each process holds a single pub/sub connection, subscribed
+# only to the channels its clients are listening on, and fans messages out to
+# one bounded queue per client. A client that falls behind gets a "resync"
+# event instead of an unbounded backlog.
+
+def events_channel(prefix, user_id):
+    return f"{prefix}{user_id}:events"
+
+def publish(client, prefix, user_id, event):
+    # Pass the pipeline of the write the event describes, so both go out together
+    client.publish(events_channel(prefix, user_id), json.dumps(event))
+
+
+class EventBus:
+    def __init__(self, queue_size=EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.listeners = {}
+        self.pubsub = None
+        self.reader = None
+        self.subscribed = None
+
+    async def subscribe(self, channel):
+        if self.pubsub is None:
+            self.pubsub = get_async_redis_client().pubsub(ignore_subscribe_messages=True)
+            self.subscribed = asyncio.Event()
+
+        queue = asyncio.Queue(self.queue_size)
+        listeners = self.listeners.setdefault(channel, set())
+        first = not listeners
+        listeners.add(queue)
+        if first:
+            await self.pubsub.subscribe(channel)
+            self.subscribed.set()
+            if self.reader is None:
+                self.reader = asyncio.create_task(self._run())
+        return queue
+
+    async def unsubscribe(self, channel, queue):
+        listeners = self.listeners.get(channel)
+        if listeners is None:
+            return
+        listeners.discard(queue)
+        if not listeners:
+            del self.listeners[channel]
+            await self.pubsub.unsubscribe(channel)
+
+    async def _run(self):
+        while True:
+            if not self.pubsub.subscribed:
+                # get_message needs at least one subscription; re-check after
+                # clearing so a subscribe in between is not missed
+                self.subscribed.clear()
+                if not self.pubsub.subscribed:
+                    await self.subscribed.wait()
+            try:
+                message = await self.pubsub.get_message(timeout=1.0)
+            except Exception as e:
+                logger.error(f"Event bus read failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message is None or message["type"] != "message":
+                continue
+
+            for queue in list(self.listeners.get(message["channel"], ())):
+                try:
+                    queue.put_nowait(message["data"])
+                except asyncio.QueueFull:
+                    # Drop the backlog; the client reloads a snapshot instead
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(json.dumps({"type": "resync"}))
+
+    async def listen(self, channel, keepalive=15):
+        # Yields event payloads for one client, or None after `keepalive` idle seconds
+        queue = await self.subscribe(channel)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            await self.unsubscribe(channel, queue)
+
+    async def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+            self.reader = None
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+            self.pubsub = None
+        self.listeners.clear()
+
+
+event_bus = EventBus()
@@ -11,4 +11,24 @@ def call_gemini(prompt_text, temperature=0.7):
     response = chat_session.send_message(prompt_text)
     # Parse the response
     result_text = response.text
-    return {'role': 'assistant', 'content': result_text}
\ No newline at end of file
+    return {'role': 'assistant', 'content': result_text}
+
+async def acall_gemini(prompt_text, temperature=0.7):
+    genai.configure(api_key=GEMINI_API_KEY)
+    model_name = "gemini-pro"
+    model = genai.GenerativeModel(model_name)
+    chat_session = model.start_chat()
+    # Await the response without blocking the event loop
+    response = await chat_session.send_message_async(prompt_text)
+    result_text = response.text
+    return {'role': 'assistant', 'content': result_text}
+
+async def astream_gemini(prompt_text, temperature=0.7):
+    genai.configure(api_key=GEMINI_API_KEY)
+    model_name = "gemini-pro"
+    model = genai.GenerativeModel(model_name)
+    chat_session = model.start_chat()
+    # Relay each chunk as soon as Gemini produces it
+    response = await chat_session.send_message_async(prompt_text, stream=True)
+    async for chunk in response:
+        yield chunk.text
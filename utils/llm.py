@@ -0,0 +1,92 @@
+# utils/llm.py
+
+import asyncio
+import threading
+import time
+from config import LLM_BACKEND, FAKE_LLM_WORDS, FAKE_LLM_DELAY_MS
+
+# Every backend offers the same calls: complete() and acomplete() return the
+# whole assistant message, astream() yields the reply text as it is generated.
+# LLM_BACKEND picks the backend for chat replies and summaries alike.
+
+class GeminiLLM:
+    def __init__(self):
+        # Imported here so the fake backend runs without the Gemini SDK
+        from utils import gemini_api
+        self.api = gemini_api
+        self.calls = 0
+
+    def complete(self, prompt, temperature=0.7):
+        self.calls += 1
+        return self.api.call_gemini(prompt, temperature)
+
+    async def acomplete(self, prompt, temperature=0.7):
+        self.calls += 1
+        return await self.api.acall_gemini(prompt, temperature)
+
+    async def astream(self, prompt, temperature=0.7):
+        self.calls += 1
+        async for text in self.api.astream_gemini(prompt, temperature):
+            yield text
+
+    def stats(self):
+        return {"backend": "gemini", "calls": self.calls}
+
+
+class FakeStreamingLLM:
+    # Local stand-in for tests and benchmarks. Replies deterministically with
+    # `words` words drawn from the prompt, one every delay_ms, and counts calls.
+    def __init__(self, words=FAKE_LLM_WORDS, delay_ms=FAKE_LLM_DELAY_MS):
+        self.words = words
+        self.delay = delay_ms / 1000
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _reply_words(self, prompt):
+        with self.lock:
+            self.calls += 1
+        words = prompt.split() or ["..."]
+        return [words[(i * 7919) % len(words)] for i in range(self.words)]
+
+    def complete(self, prompt, temperature=0.7):
+        words = self._reply_words(prompt)
+        time.sleep(self.delay * len(words))
+        return {'role': 'assistant', 'content': " ".join(words)}
+
+    async def acomplete(self, prompt, temperature=0.7):
+        words = self._reply_words(prompt)
+        await asyncio.sleep(self.delay * len(words))
+        return {'role': 'assistant', 'content': " ".join(words)}
+
+    async def astream(self, prompt, temperature=0.7):
+        for i, word in enumerate(self._reply_words(prompt)):
+            await asyncio.sleep(self.delay)
+            yield word if i == 0 else " " + word
+
+    def stats(self):
+        return {"backend": "fake", "calls": self.calls}
+
+
+def create_llm(backend):
+    if backend == "fake":
+        return FakeStreamingLLM()
+    if backend == "gemini":
+        return GeminiLLM()
+    raise ValueError(f"Unknown LLM backend: {backend}")
+
+
+_llm = None
+_lock = threading.Lock()
+
+def get_llm():
+    global _llm
+    with _lock:
+        if _llm is None:
+            _llm = create_llm(LLM_BACKEND)
+        return _llm
+
+def set_llm(llm):
+    # Swaps the process-wide backend, e.g. for an offline benchmark run
+    global _llm
+    with _lock:
+        _llm = llm
@@ -0,0 +1,24 @@
+# utils/message_record.py
+
+import sys
+from utils.token_counter import count_tokens
+
+class MessageRecord:
+    # Compact buffered message: no per-instance __dict__, roles are interned so
+    # every record shares one string per role, and the token count is computed once
+    __slots__ = ("role", "content", "tokens")
+
+    def __init__(self, role, content, tokens=None):
+        self.role = sys.intern(role)
+        self.content = content
+        self.tokens = count_tokens(content) if tokens is None else tokens
+
+    @classmethod
+    def from_dict(cls, message_dict):
+        return cls(message_dict.get("role", "unknown"), message_dict.get("content", ""))
+
+    def to_dict(self):
+        return {"role": self.role, "content": self.content}
+
+    def to_list(self):
+        return [self.role, self.content, self.tokens]
@@ -1,9 +1,114 @@
 # utils/mongo_client.py
 
-from pymongo import MongoClient
-from config import MONGO_URI, DATABASE_NAME
+import threading
+from pymongo import MongoClient, ASCENDING
+from pymongo.errors import PyMongoError
+from pymongo.monitoring import ConnectionPoolListener
+from config import MONGO_URI, DATABASE_NAME, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE
+
+class PoolMonitor(ConnectionPoolListener):
+    # Counts connection events so pool utilization can be reported as metrics
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checkout_failures = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "open": self.open,
+                "in_use": self.checked_out,
+                "peak_in_use": self.peak_checked_out,
+                "checkout_failures": self.checkout_failures
+            }
+
+    def connection_created(self, event):
+        with self.lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self.lock:
+            self.open -= 1
+
+    def connection_checked_out(self, event):
+        with self.lock:
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.checked_out -= 1
+
+    def connection_check_out_failed(self, event):
+        with self.lock:
+            self.checkout_failures += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+# One client per process; MongoClient is thread-safe and owns its own pool
+_client = None
+_monitor = PoolMonitor()
+_lock = threading.Lock()
+
+def _get_client():
+    global _client
+    with _lock:
+        if _client is None:
+            _client = MongoClient(
+                MONGO_URI,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                event_listeners=[_monitor]
+            )
+        return _client
 
 def get_mongo_client():
-    client = MongoClient(MONGO_URI)
-    db = client[DATABASE_NAME]
-    return db
\ No newline at end of file
+    db = _get_client()[DATABASE_NAME]
+    return db
+
+CHAT_HISTORY_INDEX = "UserId_1_Timestamp_1"
+CHAT_KIND_INDEX = "UserId_1_Kind_1_Timestamp_1"
+
+def ensure_indexes(collection):
+    # Every per-user read filters on UserId and sorts on Timestamp; rehydration
+    # reads summaries and messages (no Kind) separately. Returns whether both
+    # indexes are actually present afterwards
+    collection.create_index([("UserId", ASCENDING), ("Timestamp", ASCENDING)], name=CHAT_HISTORY_INDEX)
+    collection.create_index([("UserId", ASCENDING), ("Kind", ASCENDING), ("Timestamp", ASCENDING)], name=CHAT_KIND_INDEX)
+    indexes = collection.index_information()
+    return CHAT_HISTORY_INDEX in indexes and CHAT_KIND_INDEX in indexes
+
+def ping_mongo():
+    try:
+        _get_client().admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+
+def get_mongo_pool_stats():
+    return {"max_pool_size": MONGO_MAX_POOL_SIZE, **_monitor.stats()}
+
+def close_mongo_client():
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
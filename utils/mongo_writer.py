@@ -0,0 +1,120 @@
+# utils/mongo_writer.py
+
+import atexit
+import logging
+import threading
+from pymongo import WriteConcern
+from pymongo.errors import BulkWriteError, PyMongoError
+from utils.mongo_client import get_mongo_client
+from config import MONGO_FLUSH_INTERVAL_MS, MONGO_FLUSH_BATCH_SIZE, MONGO_WRITE_CONCERN
+
+logger = logging.getLogger(__name__)
+
+# Duplicate key: the document was already written by an earlier, partly failed attempt
+DUPLICATE_KEY = 11000
+
+class BufferedMongoWriter:
+    # Buffers documents and writes them with insert_many from a background
+    # thread, every flush_interval_ms or as soon as max_batch documents are
+    # waiting. Failed documents stay buffered and are retried on the next flush;
+    # close() (also registered with atexit) writes out whatever is left.
+    def __init__(self, collection, flush_interval_ms=MONGO_FLUSH_INTERVAL_MS, max_batch=MONGO_FLUSH_BATCH_SIZE, w=MONGO_WRITE_CONCERN):
+        self.collection = collection.with_options(write_concern=WriteConcern(w=w))
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.written = 0
+        self.flushes = 0
+        self.errors = 0
+
+        self.worker = threading.Thread(target=self._run, name=f"mongo-writer-{collection.name}", daemon=True)
+        self.worker.start()
+
+    def insert(self, document):
+        with self.lock:
+            self.buffer.append(document)
+            full = len(self.buffer) >= self.max_batch
+        if full:
+            self.wakeup.set()
+
+    def _run(self):
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        # flush_lock keeps concurrent flushes (worker, readers, shutdown) from reordering writes
+        with self.flush_lock:
+            with self.lock:
+                documents, self.buffer = self.buffer, []
+            if not documents:
+                return 0
+
+            retry = []
+            try:
+                self.collection.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                retry = [documents[error["index"]] for error in e.details["writeErrors"] if error["code"] != DUPLICATE_KEY]
+            except PyMongoError as e:
+                # insert_many assigned _ids already, so a retry can't duplicate what did get written
+                logger.error(f"Buffered insert of {len(documents)} documents failed: {e}")
+                retry = documents
+
+            if retry:
+                self.errors += 1
+                with self.lock:
+                    self.buffer[:0] = retry
+            self.written += len(documents) - len(retry)
+            self.flushes += 1
+            return len(documents) - len(retry)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        self.worker.join()
+        self.flush()
+        if self.buffer:
+            logger.error(f"{len(self.buffer)} buffered documents for {self.collection.name} could not be written")
+
+    def stats(self):
+        with self.lock:
+            return {
+                "buffered": len(self.buffer),
+                "written": self.written,
+                "flushes": self.flushes,
+                "errors": self.errors
+            }
+
+
+# One writer per collection per process
+_writers = {}
+_lock = threading.Lock()
+
+def get_mongo_writer(collection_name):
+    with _lock:
+        writer = _writers.get(collection_name)
+        if writer is None or writer.closed:
+            writer = BufferedMongoWriter(get_mongo_client()[collection_name])
+            _writers[collection_name] = writer
+        return writer
+
+def get_mongo_writer_stats():
+    with _lock:
+        return {name: writer.stats() for name, writer in _writers.items()}
+
+def close_mongo_writers():
+    with _lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+# Flush on interpreter exit too, in case the app stops without its shutdown hook
+atexit.register(close_mongo_writers)
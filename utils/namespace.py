@@ -0,0 +1,43 @@
+# utils/namespace.py
+
+import shutil
+from utils.redis_client import get_redis_client
+from utils.mongo_client import get_mongo_client
+from config import VECTOR_INDEX_DIR
+
+# A namespace isolates one ChatManager's data: every Redis key it writes starts
+# with "ns:{namespace}:", its Mongo collections are "{namespace}.{name}" and its
+# vector indexes live in "{VECTOR_INDEX_DIR}.{namespace}". The default (empty)
+# namespace is the live data and keeps the original names, which only collide
+# with a namespace's if a user id itself starts with "ns:".
+
+def key_prefix(namespace):
+    return f"ns:{namespace}:" if namespace else ""
+
+def collection_name(namespace, name="chat_history"):
+    return f"{namespace}.{name}" if namespace else name
+
+def vector_index_dir(namespace):
+    return f"{VECTOR_INDEX_DIR}.{namespace}" if namespace else VECTOR_INDEX_DIR
+
+def reset_namespace(namespace, batch_size=1000):
+    # Deletes only this namespace's keys and collections, never the live data
+    if not namespace:
+        raise ValueError("Refusing to reset the default namespace")
+
+    redis_client = get_redis_client()
+    keys = []
+    for key in redis_client.scan_iter(match=f"{key_prefix(namespace)}*", count=batch_size):
+        keys.append(key)
+        if len(keys) == batch_size:
+            redis_client.unlink(*keys)
+            keys = []
+    if keys:
+        redis_client.unlink(*keys)
+
+    mongo_db = get_mongo_client()
+    for name in mongo_db.list_collection_names():
+        if name.startswith(f"{namespace}."):
+            mongo_db.drop_collection(name)
+
+    shutil.rmtree(vector_index_dir(namespace), ignore_errors=True)
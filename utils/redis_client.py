@@ -1,7 +1,77 @@
 # utils/redis_client.py
 
+import threading
 import redis
-from config import REDIS_HOST, REDIS_PORT
+import redis.asyncio
+from config import REDIS_HOST, REDIS_PORT, REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT, REDIS_HEALTH_CHECK_INTERVAL
+
+# One pool per process, shared by every client handed out below
+_pool = None
+_async_pool = None
+_lock = threading.Lock()
+
+def get_redis_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = redis.BlockingConnectionPool(
+                host=REDIS_HOST,
+                port=REDIS_PORT,
+                decode_responses=True,
+                max_connections=REDIS_MAX_CONNECTIONS,
+                timeout=REDIS_POOL_TIMEOUT,
+                health_check_interval=REDIS_HEALTH_CHECK_INTERVAL
+            )
+        return _pool
+
+def get_async_redis_pool():
+    global _async_pool
+    with _lock:
+        if _async_pool is None:
+            _async_pool = redis.asyncio.BlockingConnectionPool(
+                host=REDIS_HOST,
+                port=REDIS_PORT,
+                decode_responses=True,
+                max_connections=REDIS_MAX_CONNECTIONS,
+                timeout=REDIS_POOL_TIMEOUT,
+                health_check_interval=REDIS_HEALTH_CHECK_INTERVAL
+            )
+        return _async_pool
 
 def get_redis_client():
-    return redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
\ No newline at end of file
+    return redis.Redis(connection_pool=get_redis_pool())
+
+def get_async_redis_client():
+    return redis.asyncio.Redis(connection_pool=get_async_redis_pool())
+
+def ping_redis():
+    try:
+        return get_redis_client().ping()
+    except redis.RedisError:
+        return False
+
+def get_redis_pool_stats():
+    stats = {"max_connections": REDIS_MAX_CONNECTIONS}
+    if _pool is not None:
+        created = len(_pool._connections)
+        idle = sum(1 for connection in list(_pool.pool.queue) if connection is not None)
+        stats["sync"] = {"created": created, "in_use": created - idle, "idle": idle}
+    if _async_pool is not None:
+        in_use = len(getattr(_async_pool, "_in_use_connections", ()))
+        idle = len(getattr(_async_pool, "_available_connections", ()))
+        stats["async"] = {"created": in_use + idle, "in_use": in_use, "idle": idle}
+    return stats
+
+def close_redis_pool():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.disconnect()
+            _pool = None
+
+async def close_async_redis_pool():
+    global _async_pool
+    with _lock:
+        pool, _async_pool = _async_pool, None
+    if pool is not None:
+        await pool.disconnect()
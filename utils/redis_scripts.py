@@ -0,0 +1,129 @@
+# utils/redis_scripts.py
+
+import json
+
+# Atomically rolls a summarized batch out of a user's stack.
+#
+# KEYS: stack key, summary key, batch counter hash, version counter
+# ARGV: summary JSON, batch_id, page size for the scan
+#
+# The batch's entries are removed wherever they sit, so an older batch whose
+# summary failed and is still on the stack doesn't block the ones after it.
+# Stack entries are serialized with batch_id as their first key, and batches
+# are pushed in order, so the scan stops at the first later batch and messages
+# pushed while the summary was being generated stay on the stack.
+# The summary is spliced into the JSON list stored at the summary key.
+ROLLOVER_SCRIPT = """
+local batch_id = tonumber(ARGV[2])
+local page = tonumber(ARGV[3])
+local leading = 0
+local scattered = {}
+local start = 0
+local done = false
+while not done do
+    local entries = redis.call('LRANGE', KEYS[1], start, start + page - 1)
+    for i, entry in ipairs(entries) do
+        local entry_batch = tonumber(string.match(entry, '^{"batch_id": (%-?%d+),'))
+        if entry_batch == batch_id then
+            if leading == start + i - 1 then
+                leading = leading + 1
+            else
+                table.insert(scattered, entry)
+            end
+        elseif entry_batch and entry_batch > batch_id then
+            done = true
+            break
+        end
+    end
+    if #entries < page then
+        done = true
+    end
+    start = start + page
+end
+if leading > 0 then
+    redis.call('LTRIM', KEYS[1], leading, -1)
+end
+for _, entry in ipairs(scattered) do
+    redis.call('LREM', KEYS[1], 1, entry)
+end
+local summary = ARGV[1]
+local existing = redis.call('GET', KEYS[2])
+if existing and existing ~= '[]' then
+    summary = string.sub(existing, 1, -2) .. ', ' .. summary .. ']'
+else
+    summary = '[' .. summary .. ']'
+end
+redis.call('SET', KEYS[2], summary)
+redis.call('HDEL', KEYS[3], ARGV[2])
+redis.call('INCR', KEYS[4])
+return leading + #scattered
+"""
+
+
+def batch_messages(redis_client, stack_key, batch_id, page):
+    # The stack entries of one batch, read with the same scan as ROLLOVER_SCRIPT
+    messages = []
+    start = 0
+    while True:
+        entries = redis_client.lrange(stack_key, start, start + page - 1)
+        for entry in entries:
+            message = json.loads(entry)
+            if message.get("batch_id") == batch_id:
+                messages.append(message)
+            elif message.get("batch_id", 0) > batch_id:
+                return messages
+        if len(entries) < page:
+            return messages
+        start += page
+
+
+# Appends a message to a user's stack, compare-and-set on the batch it was built for.
+#
+# KEYS: stack key, batch counter hash, version counter, batch_id key
+# ARGV: batch_id the message was built with, message JSON, batch size,
+#       events channel, message event JSON, next-batch event JSON
+#
+# If another writer has moved the batch on, nothing is written and
+# {-1, current batch_id} comes back so the caller can rebuild the message and
+# retry. Otherwise the push, counter, version bump and (when the batch fills
+# up) the switch to the next batch happen as one step, and the script returns
+# {messages in batch, version after the push, version after the switch or 0}.
+# Exactly one append closes each batch, so each batch is summarized once.
+APPEND_SCRIPT = """
+local batch_id = tonumber(redis.call('GET', KEYS[4]) or '1')
+if batch_id ~= tonumber(ARGV[1]) then
+    return {-1, batch_id}
+end
+redis.call('RPUSH', KEYS[1], ARGV[2])
+local count = redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+local version = redis.call('INCR', KEYS[3])
+redis.call('PUBLISH', ARGV[4], ARGV[5])
+local closed_version = 0
+if count >= tonumber(ARGV[3]) then
+    redis.call('SET', KEYS[4], batch_id + 1)
+    closed_version = redis.call('INCR', KEYS[3])
+    redis.call('PUBLISH', ARGV[4], ARGV[6])
+end
+return {count, version, closed_version}
+"""
+
+
+# Takes or renews a per-user lease, e.g. on the process that owns an in-memory model.
+#
+# KEYS: lease key
+# ARGV: this owner's token, lease length in milliseconds
+#
+# Returns 1 if the caller already held the lease (renewed), 2 if it was free
+# and the caller now holds it, 0 if another owner holds it.
+LEASE_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if owner == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+if not owner then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 2
+end
+return 0
+"""
@@ -0,0 +1,166 @@
+# utils/state_store.py
+
+import json
+import threading
+from collections import OrderedDict
+import redis
+from utils.redis_client import get_redis_client
+from utils.namespace import key_prefix
+from config import STATE_STORE, STATE_STORE_MAX_USERS, STATE_STORE_MAX_ITEMS, STATE_STORE_TTL
+
+# Per-user state for approaches that used to keep one in-process history.
+# load() returns a user's state (or a fresh one from the default factory);
+# update() applies fn to the state as one read-modify-write and returns it.
+# Stores that serialize state take encode/decode hooks for non-JSON state.
+# update() rewrites the whole state, so it suits small or bounded state. State
+# that grows with the history goes in named append-only lists instead:
+# append() adds one item and returns the list's length; length(), items()
+# (a slice with non-negative bounds) and tail() read it, and none of them
+# touch the rest of the state.
+
+class InMemoryStateStore:
+    # LRU over users: the least recently used state is evicted once max_users
+    # is exceeded, or once the users' lists hold more than max_items items in
+    # all, since those grow with each user's history. The user being served is
+    # never evicted, so one user alone can go past max_items.
+    def __init__(self, max_users=STATE_STORE_MAX_USERS, max_items=STATE_STORE_MAX_ITEMS):
+        self.max_users = max_users
+        self.max_items = max_items
+        self.states = OrderedDict()
+        self.list_items = {}  # user_id -> items across that user's lists
+        self.total_items = 0
+        self.lock = threading.Lock()
+
+    def _get(self, user_id, default):
+        state = self.states.get(user_id)
+        if state is None:
+            state = default()
+            self.states[user_id] = state
+        self.states.move_to_end(user_id)
+        self._evict()
+        return state
+
+    def _evict(self):
+        while len(self.states) > 1 and (len(self.states) > self.max_users or self.total_items > self.max_items):
+            evicted, _ = self.states.popitem(last=False)
+            self.total_items -= self.list_items.pop(evicted, 0)
+
+    def load(self, user_id, default):
+        with self.lock:
+            return self._get(user_id, default)
+
+    def update(self, user_id, default, fn):
+        with self.lock:
+            state = self._get(user_id, default)
+            fn(state)
+            return state
+
+    def append(self, user_id, name, item):
+        with self.lock:
+            items = self._get(user_id, dict).setdefault(name, [])
+            items.append(item)
+            self.list_items[user_id] = self.list_items.get(user_id, 0) + 1
+            self.total_items += 1
+            self._evict()
+            return len(items)
+
+    def items(self, user_id, name, start=0, stop=None):
+        with self.lock:
+            return self._get(user_id, dict).get(name, [])[start:stop]
+
+    def length(self, user_id, name):
+        with self.lock:
+            return len(self._get(user_id, dict).get(name, []))
+
+    def tail(self, user_id, name, count):
+        with self.lock:
+            items = self._get(user_id, dict).get(name, [])
+            return items[-count:] if count > 0 else []
+
+    def delete(self, user_id):
+        with self.lock:
+            self.states.pop(user_id, None)
+            self.total_items -= self.list_items.pop(user_id, 0)
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "users": len(self.states),
+            "max_users": self.max_users,
+            "list_items": self.total_items,
+            "max_items": self.max_items
+        }
+
+
+class RedisStateStore:
+    # JSON state per user in Redis, shared by every worker; idle users expire after ttl seconds.
+    # Each named list is a Redis list of JSON items, so append() is one RPUSH.
+    # `lists` names every list the approach uses: an append refreshes all of
+    # their TTLs, so a rarely written list doesn't expire under an active user.
+    def __init__(self, name, namespace=None, ttl=STATE_STORE_TTL, encode=None, decode=None, lists=()):
+        self.name = name
+        self.namespace = namespace
+        self.ttl = ttl or None
+        self.encode = encode or (lambda state: state)
+        self.decode = decode or (lambda data: data)
+        self.lists = tuple(lists)
+        self.redis_client = get_redis_client()
+
+    def _key(self, user_id):
+        return f"{key_prefix(self.namespace)}state:{self.name}:{user_id}"
+
+    def _list_key(self, user_id, name):
+        return f"{self._key(user_id)}:{name}"
+
+    def load(self, user_id, default):
+        raw = self.redis_client.get(self._key(user_id))
+        return self.decode(json.loads(raw)) if raw else default()
+
+    def update(self, user_id, default, fn):
+        key = self._key(user_id)
+        with self.redis_client.pipeline() as pipe:
+            while True:
+                try:
+                    # Optimistic update: retry if another worker wrote the state meanwhile
+                    pipe.watch(key)
+                    raw = pipe.get(key)
+                    state = self.decode(json.loads(raw)) if raw else default()
+                    fn(state)
+                    pipe.multi()
+                    pipe.set(key, json.dumps(self.encode(state)), ex=self.ttl)
+                    pipe.execute()
+                    return state
+                except redis.WatchError:
+                    continue
+
+    def append(self, user_id, name, item):
+        pipe = self.redis_client.pipeline()
+        pipe.rpush(self._list_key(user_id, name), json.dumps(item))
+        if self.ttl:
+            for list_name in set(self.lists) | {name}:
+                pipe.expire(self._list_key(user_id, list_name), self.ttl)
+        return pipe.execute()[0]
+
+    def items(self, user_id, name, start=0, stop=None):
+        end = -1 if stop is None else stop - 1
+        return [json.loads(item) for item in self.redis_client.lrange(self._list_key(user_id, name), start, end)]
+
+    def length(self, user_id, name):
+        return self.redis_client.llen(self._list_key(user_id, name))
+
+    def tail(self, user_id, name, count):
+        if count <= 0:
+            return []
+        return [json.loads(item) for item in self.redis_client.lrange(self._list_key(user_id, name), -count, -1)]
+
+    def delete(self, user_id):
+        self.redis_client.delete(self._key(user_id), *[self._list_key(user_id, name) for name in self.lists])
+
+    def stats(self):
+        return {"backend": "redis", "name": self.name, "namespace": self.namespace, "ttl": self.ttl}
+
+
+def get_state_store(name, namespace=None, encode=None, decode=None, lists=()):
+    if STATE_STORE == "redis":
+        return RedisStateStore(name, namespace, encode=encode, decode=decode, lists=lists)
+    return InMemoryStateStore()
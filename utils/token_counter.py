@@ -1,6 +1,54 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 import tiktoken
+from config import TOKEN_CACHE_SIZE, TOKEN_COUNT_THREADS
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name='gpt-3.5-turbo'):
+    # Building an encoding is expensive; keep one per model for the process lifetime
+    return tiktoken.encoding_for_model(model_name)
+
+# LRU memo of token counts keyed by (model, content hash)
+_token_counts = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+def _cache_key(text, model_name):
+    return model_name, hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+def _lookup(key):
+    with _token_counts_lock:
+        num_tokens = _token_counts.get(key)
+        if num_tokens is not None:
+            _token_counts.move_to_end(key)
+        return num_tokens
+
+def _remember(key, num_tokens):
+    with _token_counts_lock:
+        _token_counts[key] = num_tokens
+        _token_counts.move_to_end(key)
+        while len(_token_counts) > TOKEN_CACHE_SIZE:
+            _token_counts.popitem(last=False)
 
 def count_tokens(text, model_name='gpt-3.5-turbo'):
-    encoding = tiktoken.encoding_for_model(model_name)
-    num_tokens = len(encoding.encode(text))
-    return num_tokens
\ No newline at end of file
+    key = _cache_key(text, model_name)
+    num_tokens = _lookup(key)
+    if num_tokens is None:
+        num_tokens = len(get_encoding(model_name).encode(text))
+        _remember(key, num_tokens)
+    return num_tokens
+
+def count_tokens_batch(texts, model_name='gpt-3.5-turbo'):
+    keys = [_cache_key(text, model_name) for text in texts]
+    counts = [_lookup(key) for key in keys]
+
+    # Only tokenize the strings we have not seen, spread across tiktoken's threads
+    missing = [i for i, num_tokens in enumerate(counts) if num_tokens is None]
+    if missing:
+        encoded = get_encoding(model_name).encode_batch([texts[i] for i in missing], num_threads=TOKEN_COUNT_THREADS)
+        for i, tokens in zip(missing, encoded):
+            counts[i] = len(tokens)
+            _remember(keys[i], counts[i])
+
+    return counts
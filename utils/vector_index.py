@@ -0,0 +1,153 @@
+# utils/vector_index.py
+
+import hashlib
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+import faiss
+import numpy as np
+from config import VECTOR_INDEX_DIR, VECTOR_INDEX_MAX_USERS, VECTOR_ANN_THRESHOLD, VECTOR_ANN_TYPE, VECTOR_DTYPE
+
+class UserVectorIndex:
+    # One user's long-term memory: embeddings live in a single contiguous
+    # array (float32 or float16) next to a metadata list, and the faiss index
+    # starts flat and is rebuilt as IVF or HNSW once ann_threshold is reached
+    def __init__(self, dim=384, dtype=VECTOR_DTYPE, ann_threshold=VECTOR_ANN_THRESHOLD, ann_type=VECTOR_ANN_TYPE):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.ann_threshold = ann_threshold
+        self.ann_type = ann_type
+        self.vectors = np.empty((0, dim), dtype=self.dtype)
+        self.size = 0
+        self.metadata = []
+        self.index = faiss.IndexFlatL2(dim)
+        self.dirty = False
+        # Guards the arrays and the faiss index; closed is set once the store
+        # has evicted (and saved) this copy, so late writers reload it instead
+        self.lock = threading.RLock()
+        self.closed = False
+
+    def __len__(self):
+        return self.size
+
+    def add(self, vector, metadata):
+        with self.lock:
+            self._add(vector, metadata)
+
+    def _add(self, vector, metadata):
+        if self.size == len(self.vectors) or not self.vectors.flags.writeable:
+            # Grow by doubling; a memory-mapped array is copied on first write
+            grown = np.empty((max(2 * self.size, 64), self.dim), dtype=self.dtype)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+        self.vectors[self.size] = vector
+        self.size += 1
+        self.metadata.append(metadata)
+        self.dirty = True
+
+        self.index.add(np.asarray(vector, dtype=np.float32).reshape(1, -1))
+        if self.size == self.ann_threshold:
+            self._build_ann_index()
+
+    def _build_ann_index(self):
+        data = np.ascontiguousarray(self.vectors[:self.size], dtype=np.float32)
+        if self.ann_type == "ivf":
+            nlist = max(1, int(math.sqrt(self.size)))
+            index = faiss.IndexIVFFlat(faiss.IndexFlatL2(self.dim), self.dim, nlist)
+            index.train(data)
+            index.nprobe = max(1, nlist // 8)
+        else:
+            index = faiss.IndexHNSWFlat(self.dim, 32)
+            index.hnsw.efSearch = 64
+        index.add(data)
+        self.index = index
+
+    def search(self, vector, k):
+        with self.lock:
+            k = min(k, self.size)
+            if k == 0:
+                return []
+            distances, indices = self.index.search(np.asarray(vector, dtype=np.float32).reshape(1, -1), k)
+            return [self.metadata[i] for i in indices[0] if i >= 0]
+
+    def save(self, path):
+        with self.lock:
+            os.makedirs(path, exist_ok=True)
+            np.save(os.path.join(path, "vectors.npy"), self.vectors[:self.size])
+            with open(os.path.join(path, "metadata.json"), "w") as f:
+                json.dump(self.metadata, f)
+            faiss.write_index(self.index, os.path.join(path, "index.faiss"))
+            self.dirty = False
+
+    @classmethod
+    def load(cls, path, mmap=True, **kwargs):
+        vector_index = cls(**kwargs)
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r" if mmap else None)
+        vector_index.dim = vectors.shape[1]
+        vector_index.dtype = vectors.dtype
+        vector_index.vectors = vectors
+        vector_index.size = len(vectors)
+        with open(os.path.join(path, "metadata.json")) as f:
+            vector_index.metadata = json.load(f)
+        index_path = os.path.join(path, "index.faiss")
+        try:
+            vector_index.index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP if mmap else 0)
+        except RuntimeError:
+            # Not every index type supports memory-mapped reads
+            vector_index.index = faiss.read_index(index_path)
+        return vector_index
+
+
+class VectorIndexStore:
+    # Per-user indexes kept in an LRU; evicted and flushed indexes are saved
+    # under base_dir and loaded back (memory-mapped) on next use
+    def __init__(self, base_dir=VECTOR_INDEX_DIR, max_users=VECTOR_INDEX_MAX_USERS, **index_kwargs):
+        self.base_dir = base_dir
+        self.max_users = max_users
+        self.index_kwargs = index_kwargs
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _path(self, user_id):
+        # user_id comes from the request; hashing it keeps every index directly
+        # under base_dir whatever characters it contains
+        return os.path.join(self.base_dir, hashlib.sha256(str(user_id).encode()).hexdigest())
+
+    def get(self, user_id):
+        with self.lock:
+            vector_index = self.indexes.get(user_id)
+            if vector_index is None:
+                path = self._path(user_id)
+                if os.path.exists(os.path.join(path, "index.faiss")):
+                    vector_index = UserVectorIndex.load(path, **self.index_kwargs)
+                else:
+                    vector_index = UserVectorIndex(**self.index_kwargs)
+                self.indexes[user_id] = vector_index
+            self.indexes.move_to_end(user_id)
+
+            while len(self.indexes) > self.max_users:
+                evicted_user, evicted = self.indexes.popitem(last=False)
+                with evicted.lock:
+                    if evicted.dirty:
+                        evicted.save(self._path(evicted_user))
+                    evicted.closed = True
+            return vector_index
+
+    def add(self, user_id, vector, metadata):
+        # Retried when the index is evicted between lookup and write, so the
+        # write lands in the copy that is loaded back from disk
+        while True:
+            vector_index = self.get(user_id)
+            with vector_index.lock:
+                if not vector_index.closed:
+                    vector_index.add(vector, metadata)
+                    return
+
+    def flush(self):
+        with self.lock:
+            for user_id, vector_index in self.indexes.items():
+                with vector_index.lock:
+                    if vector_index.dirty:
+                        vector_index.save(self._path(user_id))
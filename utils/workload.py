@@ -0,0 +1,79 @@
+# utils/workload.py
+
+import math
+import random
+
+# Seeded synthetic conversations for scaling benchmarks. Messages are generated
+# lazily, so a 10k+ message conversation never has to exist as a list.
+
+TOPICS = {
+    "cloud": ["aws", "ec2", "s3", "lambda", "region", "instance", "bucket", "serverless", "autoscaling", "vpc", "billing", "iam", "cluster", "latency", "availability"],
+    "databases": ["index", "query", "mongodb", "redis", "replica", "shard", "transaction", "schema", "cache", "key", "collection", "join", "backup", "throughput", "consistency"],
+    "cooking": ["recipe", "oven", "garlic", "pasta", "sauce", "flour", "butter", "simmer", "spice", "bake", "knife", "onion", "salt", "dough", "roast"],
+    "travel": ["flight", "hotel", "passport", "itinerary", "museum", "train", "beach", "luggage", "visa", "airport", "booking", "tour", "city", "map", "ferry"],
+    "fitness": ["workout", "protein", "squat", "cardio", "stretch", "marathon", "sleep", "recovery", "calories", "strength", "yoga", "sprint", "hydration", "gym", "routine"],
+    "finance": ["budget", "savings", "interest", "loan", "stock", "bond", "inflation", "tax", "pension", "dividend", "mortgage", "credit", "portfolio", "expense", "income"],
+}
+FILLER = ["the", "a", "how", "what", "should", "i", "you", "it", "is", "can", "about", "with", "for", "and", "my", "when", "does", "this", "that", "more"]
+
+
+def latency_stats(samples):
+    # Milliseconds; nearest-rank percentiles
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 3)
+    return {
+        "count": len(ordered),
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "max": round(ordered[-1] * 1000, 3)
+    }
+
+
+def synthetic_conversation(seed=0, messages=10000, topic_drift=0.05, mean_words=30, length_sigma=0.6, user_share=0.5):
+    # topic_drift: chance the topic changes before each message.
+    # Lengths are lognormal with mean mean_words; user_share is the fraction of user messages.
+    rng = random.Random(str(seed))
+    topics = list(TOPICS)
+    topic = rng.choice(topics)
+    mu = math.log(mean_words) - length_sigma ** 2 / 2
+    for _ in range(messages):
+        if rng.random() < topic_drift:
+            topic = rng.choice(topics)
+        role = "user" if rng.random() < user_share else "assistant"
+        length = max(1, round(rng.lognormvariate(mu, length_sigma)))
+        words = [rng.choice(TOPICS[topic]) if rng.random() < 0.4 else rng.choice(FILLER) for _ in range(length)]
+        content = " ".join(words).capitalize() + ("?" if role == "user" else ".")
+        yield {"role": role, "content": content}
+
+
+class SyntheticWorkload:
+    # Picklable description of a workload, so benchmark processes generate
+    # their own messages instead of receiving them. Iterating yields user 0's
+    # conversation; for_user(n) gives each user a different, reproducible one.
+    def __init__(self, seed=0, messages=10000, topic_drift=0.05, mean_words=30, length_sigma=0.6, user_share=0.5):
+        self.seed = seed
+        self.messages = messages
+        self.topic_drift = topic_drift
+        self.mean_words = mean_words
+        self.length_sigma = length_sigma
+        self.user_share = user_share
+
+    def __len__(self):
+        return self.messages
+
+    def __iter__(self):
+        return self.for_user(0)
+
+    def for_user(self, user_index):
+        return synthetic_conversation(
+            seed=f"{self.seed}:{user_index}",
+            messages=self.messages,
+            topic_drift=self.topic_drift,
+            mean_words=self.mean_words,
+            length_sigma=self.length_sigma,
+            user_share=self.user_share
+        )